@@ -33,6 +33,7 @@ let isRecordingVideo = false;
 let mediaRecorder = null;
 let recordedChunks = [];
 let animationFrameId = null;
+let useEngine = false; // Python engine + Web Worker renderer (desktop only)
 
 // DOM elements
 const textInput = document.getElementById('textInput');
@@ -88,6 +89,7 @@ const showLines3DCheckbox = document.getElementById('showLines3D');
 const plotSpeed3DSlider = document.getElementById('plotSpeed3D');
 const plotSpeed3DValue = document.getElementById('plotSpeed3DValue');
 const startVideoExportBtn = document.getElementById('startVideoExportBtn');
+const useEngineCheckbox = document.getElementById('useEngine');
 
 // Hash function for deterministic color mapping (standard mode)
 function hashString(str) {
@@ -1376,6 +1378,10 @@ function renderCanvas() {
         renderCanvas3D();
         return;
     }
+    if (useEngine && engineAvailable()) {
+        renderCanvasWithEngine();
+        return;
+    }
     
     tokens = tokenize(textInput.value);
     
@@ -1708,6 +1714,10 @@ function randomizeColors() {
 
 // Export high-res image
 function exportHighResImage() {
+    if (useEngine && engineAvailable()) {
+        exportHighResImageWithEngine();
+        return;
+    }
     if (tokens.length === 0) {
         alert('No tokens to export. Please enter some text first.');
         return;
@@ -1834,6 +1844,118 @@ function exportHighResImage() {
     });
 }
 
+// Python engine + Web Worker renderer: the main process runs python/render_spec.py, which
+// returns a compact spec (palette + uint32 cell grid); spec_worker.js blits it with ImageData
+// on an OffscreenCanvas, so no per-token Map or position objects are built on the UI thread.
+const ENGINE_PREVIEW_MAX = 1200;
+let specWorker = null;
+let specRequestId = 0;
+let engineRenderSeq = 0;
+const specRequests = new Map();
+
+function engineAvailable() {
+    return typeof window !== 'undefined' && window.desktopAPI && window.desktopAPI.buildRenderSpec
+        && typeof Worker !== 'undefined' && typeof OffscreenCanvas !== 'undefined';
+}
+
+function getSpecWorker() {
+    if (specWorker) return specWorker;
+    specWorker = new Worker('spec_worker.js');
+    specWorker.onmessage = (e) => {
+        const pending = specRequests.get(e.data.id);
+        if (!pending) return;
+        specRequests.delete(e.data.id);
+        if (e.data.ok) pending.resolve(e.data);
+        else pending.reject(new Error(e.data.error));
+    };
+    specWorker.onerror = (e) => {
+        specRequests.forEach((pending) => pending.reject(new Error(e.message || 'Render worker failed')));
+        specRequests.clear();
+        specWorker = null;
+    };
+    return specWorker;
+}
+
+// Draw spec bytes in the worker. output 'bitmap' -> ImageBitmap, 'png' -> PNG ArrayBuffer
+function blitSpecInWorker(bytes, scale, maxSide, output) {
+    // Transfer (not copy) the spec: use the bytes' own ArrayBuffer when it is not a view into a larger one
+    const buffer = bytes.byteOffset === 0 && bytes.byteLength === bytes.buffer.byteLength ? bytes.buffer : bytes.slice().buffer;
+    const id = ++specRequestId;
+    return new Promise((resolve, reject) => {
+        specRequests.set(id, { resolve, reject });
+        getSpecWorker().postMessage({ id, buffer, scale, maxSide, output }, [buffer]);
+    });
+}
+
+// Current controls as python/render_spec.py options
+function engineOptions() {
+    return {
+        tokenize_mode: tokenizeMode,
+        custom_separator: customSeparator || ',',
+        current_mode: currentMode,
+        pixel_size: pixelSize,
+        canvas_shape: canvasShape,
+        arrangement_pattern: arrangementPattern,
+        emphasize_similarity: emphasizeSimilarity,
+        similarity_threshold: similarityThreshold,
+        highlight_trends: highlightTrends,
+        trend_horizontal: trendHorizontal,
+        trend_vertical: trendVertical,
+        trend_diagonal: trendDiagonal,
+        trend_min_length: trendMinLength,
+        trend_similarity: trendSimilarity,
+        trend_opacity: trendOpacity,
+        highlight_color_hex: highlightColorHex,
+    };
+}
+
+async function renderCanvasWithEngine() {
+    const seq = ++engineRenderSeq;
+    const text = textInput.value;
+    if (!text.trim()) {
+        canvas.width = 0;
+        canvas.height = 0;
+        return;
+    }
+    try {
+        const { data } = await window.desktopAPI.buildRenderSpec(text, engineOptions());
+        if (seq !== engineRenderSeq) return; // a newer render was started meanwhile
+        const frame = await blitSpecInWorker(data, 1, ENGINE_PREVIEW_MAX, 'bitmap');
+        if (seq !== engineRenderSeq) {
+            frame.bitmap.close();
+            return;
+        }
+        canvas.width = frame.width;
+        canvas.height = frame.height;
+        ctx.drawImage(frame.bitmap, 0, 0);
+        frame.bitmap.close();
+    } catch (err) {
+        // Fall back to the built-in renderer (e.g. Python not installed)
+        useEngine = false;
+        if (useEngineCheckbox) useEngineCheckbox.checked = false;
+        showMessage('Python engine unavailable, using the built-in renderer: ' + err.message);
+        renderCanvas();
+    }
+}
+
+async function exportHighResImageWithEngine() {
+    const text = textInput.value;
+    if (!text.trim()) {
+        alert('No tokens to export. Please enter some text first.');
+        return;
+    }
+    const result = await window.desktopAPI.saveImage(generateRandomFilename('image.png'));
+    if (result.canceled) return;
+    try {
+        const { data } = await window.desktopAPI.buildRenderSpec(text, engineOptions());
+        const image = await blitSpecInWorker(data, getExportScale(), 0, 'png');
+        await window.desktopAPI.writeFileBuffer(result.path, new Uint8Array(image.png));
+        showMessage('Image saved to ' + result.path + ' (' + image.width + '×' + image.height + ')');
+    } catch (err) {
+        showMessage('Export failed: ' + err.message);
+    }
+}
+
 function showMessage(msg) {
     alert(msg);
 }
@@ -2180,6 +2302,13 @@ rgb3DShowPathCheckbox.addEventListener('change', (e) => {
     renderCanvas();
 });
 
+if (useEngineCheckbox) {
+    useEngineCheckbox.addEventListener('change', (e) => {
+        useEngine = e.target.checked;
+        renderCanvas();
+    });
+}
+
 randomizeBtn.addEventListener('click', () => {
     if (currentMode === 'random') {
         randomizeColors();
@@ -2231,6 +2360,7 @@ function saveSettings() {
             trendSimilarity,
             trendOpacity,
             highlightColorHex,
+            useEngine,
             tokenizeMode: tokenizeModeSelect ? tokenizeModeSelect.value : 'words',
             customSeparator: customSeparatorInput ? customSeparatorInput.value : ',',
             exportScale: exportScaleSelect ? exportScaleSelect.value : '4',
@@ -2262,6 +2392,7 @@ function loadSettings() {
         if (s.trendSimilarity != null) { trendSimilarity = s.trendSimilarity; if (trendSimilaritySlider) trendSimilaritySlider.value = trendSimilarity; if (trendSimilarityValue) trendSimilarityValue.textContent = trendSimilarity; }
         if (s.trendOpacity != null) { trendOpacity = s.trendOpacity; if (trendOpacitySlider) trendOpacitySlider.value = trendOpacity; if (trendOpacityValue) trendOpacityValue.textContent = trendOpacity; }
         if (s.highlightColorHex && highlightColorInput) highlightColorInput.value = s.highlightColorHex;
+        if (s.useEngine != null) { useEngine = !!s.useEngine; if (useEngineCheckbox) useEngineCheckbox.checked = useEngine; }
         if (s.tokenizeMode && tokenizeModeSelect) { tokenizeModeSelect.value = s.tokenizeMode; customSepGroup.style.display = s.tokenizeMode === 'custom' ? 'block' : 'none'; }
         if (s.customSeparator && customSeparatorInput) customSeparatorInput.value = s.customSeparator;
         if (s.exportScale && exportScaleSelect) {
@@ -2288,7 +2419,7 @@ function attachSettingsSave() {
     [modeSelect, pixelSizeSlider, canvasShapeSelect, arrangementPatternSelect, emphasizeSimilarityCheckbox,
      similarityThresholdSlider, highlightTrendsCheckbox, trendHorizontalCheckbox, trendVerticalCheckbox, trendDiagonalCheckbox,
      trendMinLengthSlider, trendSimilaritySlider, trendOpacitySlider, highlightColorInput, tokenizeModeSelect, customSeparatorInput,
-     exportScaleSelect, exportScaleCustomInput, videoExportResSelect, videoExportWidthInput, videoExportHeightInput]
+     exportScaleSelect, exportScaleCustomInput, videoExportResSelect, videoExportWidthInput, videoExportHeightInput, useEngineCheckbox]
         .filter(Boolean).forEach(el => { el.addEventListener('change', save); el.addEventListener('input', save); });
 }
 
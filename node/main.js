@@ -1,7 +1,13 @@
 const { app, BrowserWindow, dialog, Menu, ipcMain, shell } = require('electron');
 const path = require('path');
+const os = require('os');
+const { execFile } = require('child_process');
 const fs = require('fs').promises;
 
+// Python engine: python/render_spec.py turns text + options into a binary render spec (.tcrs)
+// that spec_worker.js draws. Set TCM_PYTHON to choose the interpreter.
+const ENGINE_SCRIPT = path.join(__dirname, '..', 'python', 'render_spec.py');
+
 let mainWindow;
 
 function createWindow() {
@@ -146,6 +152,38 @@ ipcMain.handle('file:writeBuffer', async (_, filePath, buffer) => {
   }
 });
 
+// IPC: build a render spec with the Python engine; returns { result, data } (data = spec bytes)
+ipcMain.handle('engine:renderSpec', async (_, text, options) => {
+  const dir = await fs.mkdtemp(path.join(os.tmpdir(), 'tcm-spec-'));
+  const input = path.join(dir, 'input.txt');
+  const output = path.join(dir, 'map.tcrs');
+  try {
+    await fs.writeFile(input, text, 'utf-8');
+    const python = process.env.TCM_PYTHON || (process.platform === 'win32' ? 'python' : 'python3');
+    const result = await new Promise((resolve, reject) => {
+      execFile(
+        python,
+        [ENGINE_SCRIPT, input, output, '--options', JSON.stringify(options || {})],
+        { cwd: path.dirname(ENGINE_SCRIPT), maxBuffer: 1024 * 1024, windowsHide: true },
+        (err, stdout, stderr) => {
+          // The script prints one JSON line: { ok, error?, ... }
+          const line = String(stdout || '').trim().split('\n').pop();
+          let parsed = null;
+          try { parsed = line ? JSON.parse(line) : null; } catch (_) { parsed = null; }
+          if (parsed && parsed.ok) resolve(parsed);
+          else reject(new Error((parsed && parsed.error) || String(stderr || '').trim() || (err && err.message) || 'Python engine failed'));
+        },
+      );
+    });
+    const data = await fs.readFile(output);
+    return { result, data };
+  } catch (err) {
+    throw new Error(err.message);
+  } finally {
+    await fs.rm(dir, { recursive: true, force: true });
+  }
+});
+
 app.whenReady().then(createWindow);
 
 app.on('window-all-closed', () => {
@@ -8,6 +8,7 @@ contextBridge.exposeInMainWorld('desktopAPI', {
   writeFile: (filePath, data, encoding) => ipcRenderer.invoke('file:write', filePath, data, encoding),
   writeFileBuffer: (filePath, buffer) => ipcRenderer.invoke('file:writeBuffer', filePath, buffer),
   getVersion: () => ipcRenderer.invoke('app:getVersion'),
+  buildRenderSpec: (text, options) => ipcRenderer.invoke('engine:renderSpec', text, options),
   onMenuOpenFile: (cb) => ipcRenderer.on('menu-open-file', cb),
   onMenuSaveText: (cb) => ipcRenderer.on('menu-save-text', cb),
   onMenuImportMapping: (cb) => ipcRenderer.on('menu-import-mapping', cb),
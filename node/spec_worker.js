@@ -0,0 +1,114 @@
+// spec_worker.js - Web Worker: draw a Python render spec (.tcrs) with ImageData on an OffscreenCanvas
+// Layout of the spec is documented in python/render_spec.py. The main thread posts
+// { id, buffer, scale, maxSide, output: 'bitmap' | 'png' } (buffer transferred) and gets back
+// { id, ok, width, height, bitmap } or { id, ok, width, height, png } (ArrayBuffer), or { id, ok: false, error }.
+
+const SPEC_MAGIC = 0x53524354; // "TCRS" read as little-endian u32
+const SPEC_VERSION = 1;
+const EMPTY_CELL = 0xFFFFFFFF;
+const MAX_EXPORT_DIM = 32768;
+
+function parseSpec(buffer) {
+    const view = new DataView(buffer);
+    if (buffer.byteLength < 48 || view.getUint32(0, true) !== SPEC_MAGIC) throw new Error('Not a render spec (bad magic)');
+    const version = view.getUint16(4, true);
+    if (version !== SPEC_VERSION) throw new Error('Unsupported render spec version ' + version);
+    const headerSize = view.getUint16(6, true);
+    const spec = {
+        cols: view.getUint32(8, true),
+        rows: view.getUint32(12, true),
+        pixelSize: view.getUint32(16, true),
+        width: view.getUint32(20, true),
+        height: view.getUint32(24, true),
+        paletteSize: view.getUint32(28, true),
+        filled: view.getUint32(32, true),
+        flags: view.getUint32(36, true),
+        background: view.getUint32(40, true),
+    };
+    spec.palette = new Uint8Array(buffer, headerSize, spec.paletteSize * 3);
+    const gridOffset = headerSize + Math.ceil((spec.paletteSize * 3) / 4) * 4;
+    spec.grid = new Uint32Array(buffer, gridOffset, spec.rows * spec.cols);
+    return spec;
+}
+
+// RGB -> packed ImageData pixel (bytes R, G, B, A in memory = ABGR little-endian u32)
+function packRgb(r, g, b) {
+    return (0xFF000000 | (b << 16) | (g << 8) | r) >>> 0;
+}
+
+// Same integer block bounds as block_bounds() in python/render_2d.py (same operation order, so
+// fractional scales round identically)
+function blockStarts(n, pixelSize, scale, limit) {
+    const starts = new Int32Array(n);
+    const ends = new Int32Array(n);
+    for (let i = 0; i < n; i++) {
+        const a = Math.min(limit - 1, Math.floor(i * pixelSize * scale));
+        let b = Math.min(limit, Math.floor((i + 1) * pixelSize * scale));
+        if (b <= a) b = a + 1;
+        starts[i] = a;
+        ends[i] = b;
+    }
+    return { starts, ends };
+}
+
+function blitSpec(spec, scale) {
+    const w = Math.max(1, Math.floor(spec.width * scale));
+    const h = Math.max(1, Math.floor(spec.height * scale));
+    const image = new ImageData(w, h);
+    const px = new Uint32Array(image.data.buffer);
+    const bg = spec.background;
+    px.fill(packRgb((bg >> 16) & 0xFF, (bg >> 8) & 0xFF, bg & 0xFF));
+    const colors = new Uint32Array(spec.paletteSize);
+    const pal = spec.palette;
+    for (let i = 0; i < spec.paletteSize; i++) colors[i] = packRgb(pal[i * 3], pal[i * 3 + 1], pal[i * 3 + 2]);
+
+    const xs = blockStarts(spec.cols, spec.pixelSize, scale, w);
+    const ys = blockStarts(spec.rows, spec.pixelSize, scale, h);
+    const grid = spec.grid;
+    const cols = spec.cols;
+    for (let r = 0; r < spec.rows; r++) {
+        const y0 = ys.starts[r];
+        const rowStart = y0 * w;
+        const base = r * cols;
+        // Paint the block row's first scanline, cell by cell
+        for (let c = 0; c < cols; c++) {
+            const idx = grid[base + c];
+            if (idx === EMPTY_CELL) continue;
+            px.fill(colors[idx], rowStart + xs.starts[c], rowStart + xs.ends[c]);
+        }
+        // Copy the first scanline down the block (block rows overlap only below one pixel per cell, where blocks are 1 px tall)
+        for (let y = y0 + 1; y < ys.ends[r]; y++) px.copyWithin(y * w, rowStart, rowStart + w);
+    }
+    return image;
+}
+
+// Largest scale <= scale keeping both sides within limit (effective_scale() in python/export_plan.py)
+function fitScale(width, height, scale, limit) {
+    const outW = width * scale;
+    const outH = height * scale;
+    if (outW <= limit && outH <= limit) return scale;
+    const r = Math.min(limit / outW, limit / outH);
+    return width ? Math.floor(outW * r) / width : 1;
+}
+
+self.onmessage = async (e) => {
+    const { id, buffer, scale = 1, maxSide = 0, output = 'bitmap' } = e.data;
+    try {
+        const spec = parseSpec(buffer);
+        const s = fitScale(spec.width, spec.height, scale, maxSide > 0 ? maxSide : MAX_EXPORT_DIM);
+        const image = blitSpec(spec, s);
+        const canvas = new OffscreenCanvas(image.width, image.height);
+        canvas.getContext('2d').putImageData(image, 0, 0);
+        const info = { id, ok: true, width: image.width, height: image.height, scale: s, filled: spec.filled, flags: spec.flags };
+        if (output === 'png') {
+            const blob = await canvas.convertToBlob({ type: 'image/png' });
+            const png = await blob.arrayBuffer();
+            self.postMessage({ ...info, png }, [png]);
+        } else {
+            const bitmap = canvas.transferToImageBitmap();
+            self.postMessage({ ...info, bitmap }, [bitmap]);
+        }
+    } catch (err) {
+        self.postMessage({ id, ok: false, error: err && err.message ? err.message : String(err) });
+    }
+};
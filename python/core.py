@@ -1,11 +1,17 @@
 # core.py - Tokenization, color mapping, canvas layout, similarity, trends (no GUI)
+import functools
 import math
 import os
 import re
 import random
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
 import multiprocessing
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, Iterator, Optional, Tuple, Any
+
+import numpy as np
+
+import perf_profile
+import trend_scan
 
 # For parallel tokenization (must be picklable top-level; calls _tokenize_single to avoid recursion)
 def _tokenize_chunk(args: Tuple[str, str, str]) -> List[str]:
@@ -37,6 +43,39 @@ def random_color() -> str:
     return "#{:02x}{:02x}{:02x}".format(r, g, b)
 
 
+def new_seed() -> int:
+    """Fresh seed for random mode when the user did not fix one (report it so runs can be reproduced)."""
+    return random.getrandbits(63)
+
+
+def normalize_seed(seed: Optional[int]) -> Optional[int]:
+    """A user seed as the unsigned 64-bit value colors and layouts use (negative seeds wrap); None stays None."""
+    return None if seed is None else int(seed) & 0xFFFFFFFFFFFFFFFF
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    x = (x + np.uint64(0x9E3779B97F4A7C15)).astype(np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def seeded_random_colors(token_ids: np.ndarray, seed: int) -> np.ndarray:
+    """(n, 3) uint8 random colors in [50, 255], keyed by (seed, token ID).
+
+    Counter-based: each color is a pure function of its token ID, so any chunking of the
+    vocabulary across workers yields the same palette for the same seed.
+    """
+    with np.errstate(over="ignore"):
+        key = _splitmix64(np.array([normalize_seed(seed)], dtype=np.uint64))[0]
+        x = _splitmix64(np.asarray(token_ids, dtype=np.uint64) ^ key)
+    out = np.empty((len(x), 3), dtype=np.uint8)
+    for ch in range(3):
+        field = (x >> np.uint64(16 * ch)) & np.uint64(0xFFFF)
+        out[:, ch] = 50 + ((field * np.uint64(206)) >> np.uint64(16))
+    return out
+
+
 def hex_to_rgb(hex_color: str) -> Optional[Tuple[int, int, int]]:
     hex_color = hex_color.lstrip("#")
     if len(hex_color) != 6:
@@ -112,11 +151,10 @@ def tokenize(
     raw = text.strip()
     if not raw:
         return []
-    # Parallel path for very long text (use multiple CPU cores)
-    _PARALLEL_TOKENIZE_MIN_LEN = 500_000
+    # Parallel path for very long text (use multiple CPU cores); thresholds from the performance profile
     n_workers = multiprocessing.cpu_count() or 4
-    n_workers = min(n_workers, 32)
-    if len(raw) >= _PARALLEL_TOKENIZE_MIN_LEN and n_workers > 1:
+    n_workers = min(n_workers, perf_profile.get("tokenize_max_workers"))
+    if len(raw) >= perf_profile.get("tokenize_parallel_min_chars") and n_workers > 1:
         lines = re.split(r"[\r\n]+", raw)
         if not lines:
             return _tokenize_single(raw, mode, custom_sep)
@@ -150,13 +188,208 @@ def _tokenize_single(raw: str, mode: str, custom_sep: str) -> List[str]:
     if mode == "lines":
         return [t for t in re.split(r"[\r\n]+", raw) if t]
     if mode == "custom":
-        try:
-            return [t.strip() for t in re.split(custom_sep, raw) if t.strip()]
-        except (re.error, TypeError):
-            return [t.strip() for t in raw.split(custom_sep or ",") if t.strip()]
+        return split_custom(raw, custom_sep)
     return [t for t in re.split(r"\s+", raw) if t]
 
 
+# Custom separators: a pattern with no regex operators is split with str.split (as fast as it gets);
+# only true regexes go through re. Classified once per process (pool workers keep their own cache).
+_REGEX_META = frozenset(".^$*+?{}[]|()")
+_REGEX_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "f": "\f", "v": "\v"}
+
+
+def _literal_separator(sep: str) -> Optional[str]:
+    """The string a regex without operators matches (escapes like \\t or \\| allowed), else None."""
+    out = []
+    i = 0
+    while i < len(sep):
+        c = sep[i]
+        if c == "\\":
+            if i + 1 == len(sep):
+                return None
+            e = sep[i + 1]
+            if e in _REGEX_ESCAPES:
+                out.append(_REGEX_ESCAPES[e])
+            elif e.isalnum() or e == "_":
+                return None  # class, anchor or backreference (\\s, \\b, \\1, ...)
+            else:
+                out.append(e)
+            i += 2
+        elif c in _REGEX_META:
+            return None
+        else:
+            out.append(c)
+            i += 1
+    return "".join(out)
+
+
+@functools.lru_cache(maxsize=64)
+def classify_separator(custom_sep: str) -> Tuple[str, Any]:
+    """("char" | "literal", the string) or ("regex", compiled pattern) for a custom separator.
+
+    An empty separator means ","; an invalid regex splits on its literal text.
+    """
+    sep = custom_sep or ","
+    literal = _literal_separator(sep)
+    if literal is None:
+        try:
+            return "regex", re.compile(sep)
+        except re.error:
+            literal = sep
+    return ("char" if len(literal) == 1 else "literal"), literal
+
+
+def separator_pattern(custom_sep: str) -> "re.Pattern":
+    """Compiled pattern matching the custom separator (for finding cut points)."""
+    kind, sep = classify_separator(custom_sep)
+    return sep if kind == "regex" else re.compile(re.escape(sep))
+
+
+def split_custom(raw: str, custom_sep: str) -> List[str]:
+    """Split on the custom separator; tokens are stripped, empty ones dropped."""
+    kind, sep = classify_separator(custom_sep)
+    if kind != "regex":
+        parts = raw.split(sep)
+    else:
+        parts = sep.split(raw)
+        if sep.groups:
+            parts = filter(None, parts)  # groups that did not take part in a match are None
+    return list(filter(None, map(str.strip, parts)))
+
+
+# N-gram modes -> base tokenization ("bytes" = UTF-8 bytes of the text)
+NGRAM_MODES = {"char-ngrams": "chars", "word-ngrams": "words", "byte-windows": "bytes"}
+DEFAULT_NGRAM_N = 3
+_NGRAM_BASE = np.uint64(0x100000001B3)  # odd multiplier for the polynomial window hash
+
+
+def is_ngram_mode(mode: str) -> bool:
+    return mode in NGRAM_MODES
+
+
+class NgramVocab:
+    """Vocabulary of n-grams kept as windows into the base token-ID array.
+
+    Each entry is (start, length) into base_ids; the joined string is only built when an
+    entry is read (mapping export, mapping lookups), never for every occurrence.
+    hashes holds the window hash of each entry (used for standard-mode colors).
+    """
+
+    def __init__(self, base_vocab: List[Any], base_ids: np.ndarray, starts: np.ndarray,
+                 lengths: np.ndarray, hashes: np.ndarray, kind: str):
+        self.base_vocab = base_vocab
+        self.base_ids = base_ids
+        self.starts = starts
+        self.lengths = lengths
+        self.hashes = hashes
+        self.kind = kind
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, i: int) -> str:
+        s = int(self.starts[i])
+        parts = [self.base_vocab[j] for j in self.base_ids[s : s + int(self.lengths[i])].tolist()]
+        if self.kind == "bytes":
+            return bytes(parts).decode("utf-8", errors="backslashreplace")
+        return ("" if self.kind == "chars" else " ").join(parts)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def window_hashes(base_ids: np.ndarray, n: int) -> np.ndarray:
+    """(L - n + 1,) uint64 polynomial hash of every length-n window of base_ids.
+
+    Computed for all windows at once: n vectorized multiply-adds over shifted views of the
+    ID array, never a per-window Python loop.
+    """
+    count = len(base_ids) - n + 1
+    h = np.zeros(max(0, count), dtype=np.uint64)
+    if count <= 0:
+        return h
+    x = base_ids.astype(np.uint64) + np.uint64(1)  # +1 so ID 0 still changes the hash
+    with np.errstate(over="ignore"):
+        for k in range(n):
+            h = h * _NGRAM_BASE + x[k : k + count]
+    return h
+
+
+def _base_documents(texts: List[str], base: str, custom_sep: str) -> Tuple[List[np.ndarray], List[Any]]:
+    if base == "bytes":
+        ids = [np.frombuffer(t.strip().encode("utf-8"), dtype=np.uint8).astype(np.uint32) for t in texts]
+        return ids, list(range(256))
+    return encode_documents([tokenize(t, mode=base, custom_sep=custom_sep) for t in texts])
+
+
+def encode_ngram_documents(
+    texts: List[str], mode: str, custom_sep: str = ",", n: int = DEFAULT_NGRAM_N,
+) -> Tuple[List[np.ndarray], NgramVocab]:
+    """N-gram token-ID arrays (one per document, shared IDs in first-seen order) plus an NgramVocab.
+
+    Texts are tokenized with the base mode (chars/words use the parallel tokenizer, bytes
+    are the UTF-8 bytes), then every window of n base IDs is hashed and the hashes are
+    mapped to dense IDs with np.unique. Windows do not cross document boundaries; a
+    document shorter than n becomes one shorter gram. Distinct n-grams are told apart by
+    their 64-bit hash only.
+    """
+    base = NGRAM_MODES[mode]
+    n = max(1, int(n))
+    base_ids, base_vocab = _base_documents(texts, base, custom_sep)
+    offsets = np.cumsum([0] + [len(b) for b in base_ids])
+    all_base = np.concatenate(base_ids) if base_ids else np.zeros(0, dtype=np.uint32)
+    hashes, starts, lengths = [], [], []
+    for b, off in zip(base_ids, offsets[:-1].tolist()):
+        k = min(n, len(b))
+        h = window_hashes(b, k) if k else np.zeros(0, dtype=np.uint64)
+        if k and k < n:
+            h = h ^ np.uint64(k)  # keep short grams apart from full-length ones
+        hashes.append(h)
+        starts.append(off + np.arange(len(h), dtype=np.int64))
+        lengths.append(np.full(len(h), k, dtype=np.int64))
+    all_hash = np.concatenate(hashes)
+    uniq, first, inv = np.unique(all_hash, return_index=True, return_inverse=True)
+    # Renumber so IDs follow first occurrence (same convention as encode_tokens)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty(len(uniq), dtype=np.uint32)
+    rank[order] = np.arange(len(uniq), dtype=np.uint32)
+    ids_all = rank[inv.ravel()]
+    first = first[order]
+    vocab = NgramVocab(
+        base_vocab, all_base, np.concatenate(starts)[first], np.concatenate(lengths)[first],
+        uniq[order], base,
+    )
+    bounds = np.cumsum([0] + [len(h) for h in hashes])
+    return [ids_all[bounds[i] : bounds[i + 1]] for i in range(len(hashes))], vocab
+
+
+def encode_text_documents(
+    texts: List[str], mode: str, custom_sep: str = ",", ngram_n: int = DEFAULT_NGRAM_N,
+) -> Tuple[List[np.ndarray], Any]:
+    """Token-ID arrays for several texts in one shared ID space, for any tokenize mode."""
+    if is_ngram_mode(mode):
+        return encode_ngram_documents(texts, mode, custom_sep, ngram_n)
+    return encode_documents([tokenize(t, mode=mode, custom_sep=custom_sep) for t in texts])
+
+
+def tokenize_ids(
+    text: str, mode: str = "words", custom_sep: str = ",", ngram_n: int = DEFAULT_NGRAM_N,
+) -> Tuple[np.ndarray, Any]:
+    """Token-ID array plus vocab (a list, or an NgramVocab for n-gram modes) for one text."""
+    ids, vocab = encode_text_documents([text], mode, custom_sep, ngram_n)
+    return ids[0], vocab
+
+
+def hash_colors(hashes: np.ndarray) -> np.ndarray:
+    """(n, 3) uint8 standard-mode colors from 64-bit token hashes (channels floored at 50 like hash_to_color)."""
+    with np.errstate(over="ignore"):
+        x = _splitmix64(np.asarray(hashes, dtype=np.uint64))
+    out = np.empty((len(x), 3), dtype=np.uint8)
+    for ch in range(3):
+        out[:, ch] = np.maximum((x >> np.uint64(16 - 8 * ch)) & np.uint64(0xFF), 50)
+    return out
+
+
 def get_color_for_token(
     token: str,
     mode: str,
@@ -172,9 +405,27 @@ def get_color_for_token(
     return color
 
 
-def fill_color_map(tokens: List[str], mode: str, color_map: Dict[str, str]) -> None:
-    """Fill color_map for all tokens in one pass. Faster than 9M get_color_for_token calls."""
-    if mode == "standard":
+def fill_color_map(
+    tokens: List[str],
+    mode: str,
+    color_map: Dict[str, str],
+    cache: Optional[Any] = None,
+) -> None:
+    """Fill color_map for all tokens in one pass. Faster than 9M get_color_for_token calls.
+
+    In standard mode an optional cache (palette_cache.PaletteCache) is consulted in bulk
+    for the unique missing tokens; only tokens it does not know are hashed and written back.
+    """
+    if mode == "standard" and cache is not None:
+        missing = [t for t in dict.fromkeys(tokens) if t not in color_map]
+        if not missing:
+            return
+        found = cache.get_many(missing)
+        color_map.update(found)
+        new = {t: hash_to_color(hash_string(t)) for t in missing if t not in found}
+        color_map.update(new)
+        cache.put_many(new)
+    elif mode == "standard":
         for token in tokens:
             if token not in color_map:
                 color_map[token] = hash_to_color(hash_string(token))
@@ -184,6 +435,148 @@ def fill_color_map(tokens: List[str], mode: str, color_map: Dict[str, str]) -> N
                 color_map[token] = random_color()
 
 
+def encode_tokens(tokens: List[str]) -> Tuple[np.ndarray, List[str]]:
+    """Map tokens to a uint32 token-ID array plus the vocabulary (IDs in first-seen order)."""
+    ids, vocab = encode_documents([tokens])
+    return ids[0], vocab
+
+
+def encode_documents(docs: List[List[str]]) -> Tuple[List[np.ndarray], List[str]]:
+    """Encode several token lists into one shared token-ID space: one ID array per document, one vocab."""
+    index: Dict[str, int] = {}
+    ids = [
+        np.fromiter((index.setdefault(t, len(index)) for t in tokens), dtype=np.uint32, count=len(tokens))
+        for tokens in docs
+    ]
+    return ids, list(index)
+
+
+def document_frequencies(ids_list: List[np.ndarray], n_vocab: int) -> np.ndarray:
+    """(N, V) int64 token counts, one row per document of a shared token-ID space."""
+    freqs = np.zeros((len(ids_list), n_vocab), dtype=np.int64)
+    for i, ids in enumerate(ids_list):
+        freqs[i] = np.bincount(ids, minlength=n_vocab)
+    return freqs
+
+
+def unique_token_mask(freqs: np.ndarray) -> np.ndarray:
+    """(N, V) bool: token occurs in document i and in no other document."""
+    present = freqs > 0
+    return present & (present.sum(axis=0) == 1)
+
+
+def _hex_colors_to_rgb(colors: List[str]) -> np.ndarray:
+    packed = np.array([int(c[1:7], 16) for c in colors], dtype=np.uint32)
+    out = np.empty((len(colors), 3), dtype=np.uint8)
+    out[:, 0] = packed >> 16
+    out[:, 1] = (packed >> 8) & 0xFF
+    out[:, 2] = packed & 0xFF
+    return out
+
+
+def build_palette(
+    vocab: List[str],
+    mode: str,
+    color_map: Optional[Dict[str, str]] = None,
+    mapping: Optional[Any] = None,
+    cache: Optional[Any] = None,
+    seed: Optional[int] = None,
+    id_offset: int = 0,
+) -> np.ndarray:
+    """(V, 3) uint8 palette indexed by token ID.
+
+    Colors come from mapping (a mapping_io.MappingFile, looked up without building a dict),
+    then color_map, then the mode's generator: hashing in standard mode (optionally through
+    a palette cache), seeded_random_colors keyed by token ID in random mode. For an
+    NgramVocab, standard mode colors come from the window hashes, so no strings are built.
+    id_offset is the token ID of vocab[0] when coloring a slice of a larger vocabulary.
+    """
+    palette = np.zeros((len(vocab), 3), dtype=np.uint8)
+    if not len(vocab):
+        return palette
+    todo = np.arange(len(vocab))
+    if mapping is not None:
+        rgb, found = mapping.lookup_rgb(vocab)
+        palette[found] = rgb[found]
+        todo = todo[~found]
+    if color_map and len(todo):
+        known = np.fromiter((vocab[i] in color_map for i in todo), dtype=bool, count=len(todo))
+        hit = todo[known]
+        palette[hit] = _hex_colors_to_rgb([color_map[vocab[i]] for i in hit])
+        todo = todo[~known]
+    if len(todo) and mode == "random":
+        palette[todo] = seeded_random_colors(todo + id_offset, seed if seed is not None else new_seed())
+    elif len(todo) and isinstance(vocab, NgramVocab):
+        palette[todo] = hash_colors(vocab.hashes[todo])
+    elif len(todo):
+        colors: Dict[str, str] = {}
+        missing = [vocab[i] for i in todo]
+        fill_color_map(missing, mode, colors, cache=cache)
+        palette[todo] = _hex_colors_to_rgb([colors[t] for t in missing])
+    return palette
+
+
+def emphasize_palette(palette: np.ndarray, threshold: float, emphasize_on: bool) -> np.ndarray:
+    """Vectorized emphasize_similar_colors over a (V, 3) palette (same bins and averages)."""
+    if not emphasize_on or threshold <= 0 or len(palette) == 0:
+        return palette.copy()
+    thresh_dist = (threshold / 100.0) * max_color_distance()
+    step = max(1, int(thresh_dist / math.sqrt(3)))
+    q = (palette // step).astype(np.int64)
+    _, inv = np.unique((q[:, 0] << 16) | (q[:, 1] << 8) | q[:, 2], return_inverse=True)
+    inv = inv.ravel()
+    counts = np.bincount(inv)
+    out = np.empty_like(palette)
+    for ch in range(3):
+        sums = np.bincount(inv, weights=palette[:, ch].astype(np.float64))
+        out[:, ch] = np.round(sums / counts).astype(np.uint8)[inv]
+    return out
+
+
+def token_stats(
+    vocab: List[str], counts: np.ndarray, top_k: int = 20, table_limit: int = 10_000,
+) -> Dict[str, Any]:
+    """Summary of per-token counts (np.bincount over the token-ID array).
+
+    Entropy is in bits per token; the frequency table is sorted by count (ties in first-seen
+    order) and cut at table_limit entries so huge vocabularies stay small on disk.
+    """
+    total = int(counts.sum())
+    unique = int(np.count_nonzero(counts))
+    order = np.argsort(-counts, kind="stable")
+    table = order[:table_limit]
+    p = counts[counts > 0] / total if total else np.zeros(0)
+    return {
+        "total_tokens": total,
+        "unique_tokens": unique,
+        "unique_ratio": unique / total if total else 0.0,
+        "entropy_bits": float(-(p * np.log2(p)).sum()) if total else 0.0,
+        "top_k": [[vocab[i], int(counts[i])] for i in order[:top_k].tolist()],
+        "frequency_table": [[vocab[i], int(counts[i])] for i in table.tolist()],
+        "frequency_table_truncated": len(table) < len(order),
+    }
+
+
+def frequency_heat(counts: np.ndarray) -> np.ndarray:
+    """(V,) float32 heat in [0, 1]: log-scaled token frequency (most frequent token = 1)."""
+    top = int(counts.max()) if len(counts) else 0
+    if top <= 1:
+        return np.zeros(len(counts), dtype=np.float32)
+    return (np.log(np.maximum(counts, 1)) / math.log(top)).astype(np.float32)
+
+
+def fade_palette(palette: np.ndarray, keep: np.ndarray, amount: float = 0.85) -> np.ndarray:
+    """Blend palette entries not in keep (bool (V,)) toward white; kept entries are unchanged."""
+    out = palette.copy()
+    fade = ~keep
+    out[fade] = np.round(palette[fade] * (1.0 - amount) + 255.0 * amount).astype(np.uint8)
+    return out
+
+
+def palette_to_color_map(vocab: List[str], palette: np.ndarray) -> Dict[str, str]:
+    return {t: "#{:02x}{:02x}{:02x}".format(r, g, b) for t, (r, g, b) in zip(vocab, palette.tolist())}
+
+
 def calculate_canvas_size(
     n_tokens: int,
     pixel_size: int,
@@ -210,12 +603,14 @@ def calculate_canvas_size(
         cols = math.ceil(n_tokens / rows)
         width, height = cols * pixel_size, rows * pixel_size
     elif shape == "circle":
-        area = n_tokens
-        radius = math.ceil(math.sqrt(area / math.pi)) * pixel_size
+        # Grid spans the whole disc; grow the radius until the disc holds every token
+        r_cells = math.ceil(math.sqrt(n_tokens / math.pi))
+        while _circle_cell_count(r_cells) < n_tokens:
+            r_cells += 1
+        radius = r_cells * pixel_size
+        cols = rows = 2 * r_cells + 1
         width = height = radius * 2 + pixel_size
         center_x, center_y = width / 2, height / 2
-        cols = math.ceil(math.sqrt(n_tokens))
-        rows = math.ceil(n_tokens / cols)
     elif shape == "spiral":
         cols = math.ceil(math.sqrt(n_tokens))
         rows = math.ceil(n_tokens / cols)
@@ -242,110 +637,279 @@ def calculate_canvas_size(
     }
 
 
-def _spiral_in_positions(tokens: List[str], cols: int, rows: int, pixel_size: int) -> List[Dict]:
-    grid = [[None] * cols for _ in range(rows)]
-    r, c = 0, 0
-    min_r, max_r, min_c, max_c = 0, rows - 1, 0, cols - 1
-    direction = 0  # 0 right, 1 down, 2 left, 3 up
-    for i in range(len(tokens)):
-        grid[r][c] = i
-        if direction == 0:
-            if c >= max_c:
-                direction = 1
-                min_r += 1
-                r += 1
-            else:
-                c += 1
-        elif direction == 1:
-            if r >= max_r:
-                direction = 2
-                max_c -= 1
-                c -= 1
-            else:
-                r += 1
-        elif direction == 2:
-            if c <= min_c:
-                direction = 3
-                max_r -= 1
-                r -= 1
-            else:
-                c -= 1
-        else:
-            if r <= min_r:
-                direction = 0
-                min_c += 1
-                c += 1
-            else:
-                r -= 1
-    out = []
-    for ri, row in enumerate(grid):
-        for ci, idx in enumerate(row):
-            if idx is not None and idx < len(tokens):
-                out.append({
-                    "token": tokens[idx], "row": ri, "col": ci,
-                    "x": ci * pixel_size, "y": ri * pixel_size, "valid": True,
-                })
-    return out
+def _circle_cell_count(r_cells: int) -> int:
+    """Grid cells whose centers lie inside a circle of r_cells cells around the center cell."""
+    dy = np.arange(-r_cells, r_cells + 1, dtype=np.int64)
+    return int((2 * np.floor(np.sqrt(r_cells * r_cells - dy * dy)) + 1).sum())
 
 
-def _spiral_out_positions(tokens: List[str], cols: int, rows: int, pixel_size: int) -> List[Dict]:
-    grid = [[None] * cols for _ in range(rows)]
-    sr, sc = rows // 2, cols // 2
-    r, c = sr, sc
-    step, step_count, direction = 1, 0, 0
-    idx = 0
-    if idx < len(tokens) and 0 <= r < rows and 0 <= c < cols:
-        grid[r][c] = idx
-        idx += 1
-    while idx < len(tokens):
-        if direction == 0:
-            c += 1
-        elif direction == 1:
-            r -= 1
-        elif direction == 2:
-            c -= 1
-        else:
-            r += 1
-        step_count += 1
-        if 0 <= r < rows and 0 <= c < cols and idx < len(tokens):
-            grid[r][c] = idx
-            idx += 1
-        if step_count >= step:
-            step_count = 0
-            direction = (direction + 1) % 4
-            if direction in (0, 2):
-                step += 1
-    out = []
-    for ri, row in enumerate(grid):
-        for ci, token_idx in enumerate(row):
-            if token_idx is not None and token_idx < len(tokens):
-                out.append({
-                    "token": tokens[token_idx], "row": ri, "col": ci,
-                    "x": ci * pixel_size, "y": ri * pixel_size, "valid": True,
-                })
-    return out
+def shape_contains(canvas_info: Dict[str, Any], shape: str, pixel_size: int, r: np.ndarray, c: np.ndarray) -> np.ndarray:
+    """Bool per cell (row r, column c; broadcast) inside the shape; shape_mask applies it to the whole grid."""
+    if shape == "circle":
+        cx, cy, radius = canvas_info["center_x"], canvas_info["center_y"], canvas_info["radius"]
+        dx = c * pixel_size + pixel_size / 2 - cx
+        dy = r * pixel_size + pixel_size / 2 - cy
+        return dy ** 2 + dx ** 2 <= radius * radius
+    if shape == "triangle":
+        return c <= r
+    return np.ones(np.broadcast(r, c).shape, dtype=bool)
 
 
-def _diagonal_positions(tokens: List[str], cols: int, rows: int, pixel_size: int) -> List[Dict]:
-    grid = [[None] * cols for _ in range(rows)]
-    idx = 0
+def shape_mask(canvas_info: Dict[str, Any], shape: str, pixel_size: int) -> np.ndarray:
+    """(rows, cols) bool mask of cells inside the shape; same test as is_valid_position, in bulk."""
+    rows, cols = canvas_info["rows"], canvas_info["cols"]
+    return shape_contains(canvas_info, shape, pixel_size, np.arange(rows)[:, None], np.arange(cols)[None, :])
+
+
+def _spiral_in_segments(rows: int, cols: int) -> Iterator[np.ndarray]:
+    # Ring by ring from the border: top row, right column, bottom row, left column
+    top, bottom, left, right = 0, rows - 1, 0, cols - 1
+    while top <= bottom and left <= right:
+        yield top * cols + np.arange(left, right + 1)
+        yield np.arange(top + 1, bottom + 1) * cols + right
+        if top < bottom:
+            yield bottom * cols + np.arange(right - 1, left - 1, -1)
+        if left < right:
+            yield np.arange(bottom - 1, top, -1) * cols + left
+        top, bottom, left, right = top + 1, bottom - 1, left + 1, right - 1
+
+
+def _spiral_in_order(rows: int, cols: int) -> np.ndarray:
+    parts = list(_spiral_in_segments(rows, cols))
+    return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+
+def _spiral_out_segments(rows: int, cols: int) -> Iterator[np.ndarray]:
+    # Walk legs of length 1, 1, 2, 2, 3, 3, ... (right, up, left, down) from the center cell,
+    # keeping only in-bounds cells; each leg is one vectorized segment.
+    r, c = rows // 2, cols // 2
+    yield np.array([r * cols + c])
+    n_cells, seen = rows * cols, 1
+    moves = ((0, 1), (-1, 0), (0, -1), (1, 0))
+    step, direction = 1, 0
+    while seen < n_cells:
+        dr, dc = moves[direction]
+        k = np.arange(1, step + 1)
+        rr, cc = r + dr * k, c + dc * k
+        inside = (rr >= 0) & (rr < rows) & (cc >= 0) & (cc < cols)
+        yield rr[inside] * cols + cc[inside]
+        seen += int(inside.sum())
+        r, c = r + dr * step, c + dc * step
+        direction = (direction + 1) % 4
+        if direction in (0, 2):
+            step += 1
+
+
+def _spiral_out_order(rows: int, cols: int) -> np.ndarray:
+    return np.concatenate(list(_spiral_out_segments(rows, cols)))
+
+
+def _diagonal_segments(rows: int, cols: int) -> Iterator[np.ndarray]:
+    # Anti-diagonals r + c = s in order, top row first within each (the order of the lexsort)
     for s in range(rows + cols - 1):
-        if idx >= len(tokens):
-            break
-        for row in range(rows):
-            col = s - row
-            if 0 <= col < cols and idx < len(tokens):
-                grid[row][col] = idx
-                idx += 1
-    out = []
-    for ri, row in enumerate(grid):
-        for ci, token_idx in enumerate(row):
-            if token_idx is not None and token_idx < len(tokens):
-                out.append({
-                    "token": tokens[token_idx], "row": ri, "col": ci,
-                    "x": ci * pixel_size, "y": ri * pixel_size, "valid": True,
-                })
-    return out
+        r = np.arange(max(0, s - cols + 1), min(s, rows - 1) + 1)
+        yield r * cols + (s - r)
+
+
+def _linear_cells(pattern: str, rows: int, cols: int, start: int, stop: int) -> np.ndarray:
+    """Flat cells at positions start..stop-1 of a row/column-major or zigzag order (closed form)."""
+    k = np.arange(start, stop, dtype=np.int64)
+    if pattern == "column-major":
+        c, r = np.divmod(k, rows)
+        return r * cols + c
+    if pattern == "zigzag":
+        r, c = np.divmod(k, cols)
+        return r * cols + np.where(r & 1, cols - 1 - c, c)
+    if pattern == "zigzag-col":
+        c, r = np.divmod(k, rows)
+        return np.where(c & 1, rows - 1 - r, r) * cols + c
+    return k
+
+
+_CURVE_CHUNK = 1 << 22
+
+
+# Hilbert d -> (x, y), most significant quadrant first. The state is the symmetry applied to
+# the current sub-square (0 identity, 1 transpose, 2 anti-transpose, 3 rotate 180); quadrant q
+# sits at state(_HILBERT_BASE[q]) and recurses with state composed with _HILBERT_TURN[q].
+_HILBERT_BASE = ((0, 0), (0, 1), (1, 1), (1, 0))
+_HILBERT_TURN = (1, 0, 0, 2)
+_HILBERT_COMPOSE = ((0, 1, 2, 3), (1, 0, 3, 2), (2, 3, 0, 1), (3, 2, 1, 0))
+_HILBERT_LUT_LEVELS = 8
+_hilbert_luts: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+
+def _hilbert_apply(state: int, x: int, y: int) -> Tuple[int, int]:
+    if state == 1:
+        return y, x
+    if state == 2:
+        return 1 - y, 1 - x
+    if state == 3:
+        return 1 - x, 1 - y
+    return x, y
+
+
+def _hilbert_lut(levels: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(x bits, y bits, next state) for every (state, next `levels` quadrants) combination."""
+    if levels not in _hilbert_luts:
+        size = 1 << (2 * levels)
+        lx = np.zeros(4 * size, dtype=np.int64)
+        ly = np.zeros(4 * size, dtype=np.int64)
+        ls = np.zeros(4 * size, dtype=np.int64)
+        for state0 in range(4):
+            for v in range(size):
+                state, x, y = state0, 0, 0
+                for i in range(levels - 1, -1, -1):
+                    q = (v >> (2 * i)) & 3
+                    bx, by = _hilbert_apply(state, *_HILBERT_BASE[q])
+                    x, y = (x << 1) | bx, (y << 1) | by
+                    state = _HILBERT_COMPOSE[state][_HILBERT_TURN[q]]
+                k = state0 * size + v
+                lx[k], ly[k], ls[k] = x, y, state
+        _hilbert_luts[levels] = (lx, ly, ls)
+    return _hilbert_luts[levels]
+
+
+def hilbert_d2xy(d: np.ndarray, order: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized Hilbert index -> (x, y) on a 2**order square (table lookup, 8 levels per step)."""
+    d = np.asarray(d, dtype=np.int64)
+    x = np.zeros_like(d)
+    y = np.zeros_like(d)
+    state = np.zeros_like(d)
+    remaining = order
+    while remaining > 0:
+        levels = remaining % _HILBERT_LUT_LEVELS or _HILBERT_LUT_LEVELS
+        remaining -= levels
+        lx, ly, ls = _hilbert_lut(levels)
+        idx = (state << (2 * levels)) | ((d >> (2 * remaining)) & ((1 << (2 * levels)) - 1))
+        x = (x << levels) | lx[idx]
+        y = (y << levels) | ly[idx]
+        state = ls[idx]
+    return x, y
+
+
+def _compact_bits(v: np.ndarray) -> np.ndarray:
+    v = v & 0x5555555555555555
+    v = (v | (v >> 1)) & 0x3333333333333333
+    v = (v | (v >> 2)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v >> 4)) & 0x00FF00FF00FF00FF
+    v = (v | (v >> 8)) & 0x0000FFFF0000FFFF
+    return (v | (v >> 16)) & 0x00000000FFFFFFFF
+
+
+def morton_d2xy(d: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized Z-order (Morton) index -> (x, y): x from even bits, y from odd bits."""
+    d = np.asarray(d, dtype=np.int64)
+    return _compact_bits(d), _compact_bits(d >> 1)
+
+
+def _curve_segments(rows: int, cols: int, d2xy, chunk: int = _CURVE_CHUNK) -> Iterator[np.ndarray]:
+    # Walk the curve over the enclosing power-of-two square in chunks and keep in-grid cells,
+    # so non-power-of-two grids keep the curve's order and memory stays bounded per chunk.
+    order = max(0, (max(rows, cols) - 1).bit_length())
+    total = 1 << (2 * order)
+    for start in range(0, total, chunk):
+        x, y = d2xy(np.arange(start, min(total, start + chunk), dtype=np.int64), order)
+        inside = (x < cols) & (y < rows)
+        yield y[inside] * cols + x[inside]
+
+
+def _curve_order(rows: int, cols: int, d2xy) -> np.ndarray:
+    return np.concatenate(list(_curve_segments(rows, cols, d2xy)))
+
+
+def pattern_cell_order(rows: int, cols: int, pattern: str) -> np.ndarray:
+    """Flat cell indices (row * cols + col) of the whole grid in the pattern's fill order."""
+    grid = np.arange(rows * cols, dtype=np.int64).reshape(rows, cols)
+    if pattern == "column-major":
+        return grid.T.ravel()
+    if pattern == "spiral-in":
+        return _spiral_in_order(rows, cols)
+    if pattern == "spiral-out":
+        return _spiral_out_order(rows, cols)
+    if pattern == "zigzag":
+        grid[1::2] = grid[1::2, ::-1]
+        return grid.ravel()
+    if pattern == "zigzag-col":
+        t = grid.T.copy()
+        t[1::2] = t[1::2, ::-1]
+        return t.ravel()
+    if pattern == "diagonal":
+        r, c = np.divmod(grid.ravel(), cols)
+        return np.lexsort((r, r + c))
+    if pattern == "hilbert":
+        # Locality in both axes; every aligned 2**k x 2**k tile is one contiguous token range
+        return _curve_order(rows, cols, hilbert_d2xy)
+    if pattern == "morton":
+        return _curve_order(rows, cols, lambda d, _order: morton_d2xy(d))
+    return grid.ravel()
+
+
+def pattern_cell_pieces(rows: int, cols: int, pattern: str, chunk: int = _CURVE_CHUNK) -> Iterator[np.ndarray]:
+    """pattern_cell_order in consecutive pieces, without the whole-grid array.
+
+    A piece is at most chunk cells, one spiral leg or one anti-diagonal, so memory is bounded
+    by the chunk and the grid side. Random layouts are sampled, not ordered (see layout_cells).
+    """
+    if rows <= 0 or cols <= 0:
+        return
+    if pattern == "spiral-in":
+        yield from _spiral_in_segments(rows, cols)
+    elif pattern == "spiral-out":
+        yield from _spiral_out_segments(rows, cols)
+    elif pattern == "diagonal":
+        yield from _diagonal_segments(rows, cols)
+    elif pattern == "hilbert":
+        yield from _curve_segments(rows, cols, hilbert_d2xy, chunk)
+    elif pattern == "morton":
+        yield from _curve_segments(rows, cols, lambda d, _order: morton_d2xy(d), chunk)
+    else:
+        n = rows * cols
+        for start in range(0, n, chunk):
+            yield _linear_cells(pattern, rows, cols, start, min(n, start + chunk))
+
+
+def layout_cells(
+    n_tokens: int,
+    canvas_info: Dict[str, Any],
+    pattern: str,
+    shape: str = "square",
+    pixel_size: int = 1,
+    seed: Optional[int] = None,
+) -> np.ndarray:
+    """Flat cell index for each token (token order), using only cells inside the shape mask.
+
+    Tokens are reflowed along the pattern over the masked cells instead of being placed and
+    then dropped, so every token gets a cell (calculate_canvas_size sizes the grid for that).
+    """
+    rows, cols = canvas_info["rows"], canvas_info["cols"]
+    if n_tokens <= 0 or rows <= 0 or cols <= 0:
+        return np.empty(0, dtype=np.int64)
+    mask = shape_mask(canvas_info, shape, pixel_size).ravel()
+    if pattern == "random":
+        # Seeded sample of the valid cells (no rows*cols tuple list, reproducible per seed)
+        valid = np.flatnonzero(mask)
+        rng = np.random.default_rng(normalize_seed(seed))  # default_rng rejects negative seeds
+        pick = rng.choice(len(valid), size=min(n_tokens, len(valid)), replace=False)
+        return valid[pick]
+    order = pattern_cell_order(rows, cols, pattern)
+    if not mask.all():
+        order = order[mask[order]]
+    return order[:n_tokens]
+
+
+def build_color_grid(
+    cells: np.ndarray,
+    cell_rgb: np.ndarray,
+    rows: int,
+    cols: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Dense (rows, cols, 3) uint8 color grid (white background) and (rows, cols) filled mask."""
+    grid = np.full((rows * cols, 3), 255, dtype=np.uint8)
+    filled = np.zeros(rows * cols, dtype=bool)
+    grid[cells] = cell_rgb
+    filled[cells] = True
+    return grid.reshape(rows, cols, 3), filled.reshape(rows, cols)
 
 
 def generate_pixel_positions(
@@ -353,65 +917,18 @@ def generate_pixel_positions(
     canvas_info: Dict[str, Any],
     pattern: str,
     pixel_size: int,
+    seed: Optional[int] = None,
 ) -> List[Dict]:
+    """Position dicts (token order) for callers that still use the dict pipeline; see layout_cells."""
     cols = canvas_info["cols"]
-    rows = canvas_info["rows"]
+    cells = layout_cells(len(tokens), canvas_info, pattern, "square", pixel_size, seed=seed)
     positions = []
-    if pattern == "row-major":
-        for i, token in enumerate(tokens):
-            row, col = i // cols, i % cols
-            positions.append({
-                "token": token, "row": row, "col": col,
-                "x": col * pixel_size, "y": row * pixel_size, "valid": True,
-            })
-    elif pattern == "column-major":
-        for i, token in enumerate(tokens):
-            col, row = i // rows, i % rows
-            positions.append({
-                "token": token, "row": row, "col": col,
-                "x": col * pixel_size, "y": row * pixel_size, "valid": True,
-            })
-    elif pattern == "spiral-in":
-        positions = _spiral_in_positions(tokens, cols, rows, pixel_size)
-    elif pattern == "spiral-out":
-        positions = _spiral_out_positions(tokens, cols, rows, pixel_size)
-    elif pattern == "zigzag":
-        for i, token in enumerate(tokens):
-            row, col = i // cols, i % cols
-            actual_col = col if row % 2 == 0 else cols - 1 - col
-            positions.append({
-                "token": token, "row": row, "col": actual_col,
-                "x": actual_col * pixel_size, "y": row * pixel_size, "valid": True,
-            })
-    elif pattern == "zigzag-col":
-        for i, token in enumerate(tokens):
-            col, row = i // rows, i % rows
-            actual_row = row if col % 2 == 0 else rows - 1 - row
-            positions.append({
-                "token": token, "row": actual_row, "col": col,
-                "x": col * pixel_size, "y": actual_row * pixel_size, "valid": True,
-            })
-    elif pattern == "diagonal":
-        positions = _diagonal_positions(tokens, cols, rows, pixel_size)
-    elif pattern == "random":
-        # O(n) placement: shuffle all (row,col) and assign tokens (no collision loop)
-        all_cells = [(r, c) for r in range(rows) for c in range(cols)]
-        random.shuffle(all_cells)
-        for i, token in enumerate(tokens):
-            if i >= len(all_cells):
-                break
-            row, col = all_cells[i]
-            positions.append({
-                "token": token, "row": row, "col": col,
-                "x": col * pixel_size, "y": row * pixel_size, "valid": True,
-            })
-    else:
-        for i, token in enumerate(tokens):
-            row, col = i // cols, i % cols
-            positions.append({
-                "token": token, "row": row, "col": col,
-                "x": col * pixel_size, "y": row * pixel_size, "valid": True,
-            })
+    for token, cell in zip(tokens, cells.tolist()):
+        row, col = divmod(cell, cols)
+        positions.append({
+            "token": token, "row": row, "col": col,
+            "x": col * pixel_size, "y": row * pixel_size, "valid": True,
+        })
     return positions
 
 
@@ -451,6 +968,20 @@ def build_position_color_map(
     return m
 
 
+def build_grid_position_color_map(
+    color_grid: np.ndarray,
+    filled: np.ndarray,
+) -> Dict[Tuple[int, int], str]:
+    """(row, col) -> hex for filled cells of a dense color grid (input format of detect_trends)."""
+    rows_i, cols_i = np.nonzero(filled)
+    rgb = color_grid[rows_i, cols_i].astype(np.uint32)
+    packed = ((rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]).tolist()
+    return {
+        (r, c): "#{:06x}".format(v)
+        for r, c, v in zip(rows_i.tolist(), cols_i.tolist(), packed)
+    }
+
+
 def get_color_at_position(
     row: int,
     col: int,
@@ -458,11 +989,22 @@ def get_color_at_position(
     pixel_positions: List[Dict],
     display_color_map: Dict[str, str],
     token_color_map: Dict[str, str],
+    grid_index: Optional[Any] = None,
 ) -> Optional[str]:
+    """Color at (row, col): position_color_map, then grid_index (grid_index.GridIndex, O(1)).
+
+    Without either, falls back to scanning pixel_positions.
+    """
     if position_color_map is not None:
         key = (row, col)
         if key in position_color_map:
             return position_color_map[key]
+    if grid_index is not None:
+        i = grid_index.token_index_at(row, col)
+        if i < 0:
+            return None
+        p = pixel_positions[int(grid_index.source[i]) if grid_index.source is not None else i]
+        return display_color_map.get(p["token"]) or token_color_map.get(p["token"])
     for p in pixel_positions:
         if p.get("row") == row and p.get("col") == col and p.get("valid", True):
             return display_color_map.get(p["token"]) or token_color_map.get(p["token"])
@@ -477,60 +1019,16 @@ def detect_trends(
     trend_min_length: int,
     trend_similarity_pct: float,
 ) -> List[List[Tuple[int, int]]]:
-    trends = []
-    thresh = (trend_similarity_pct / 100.0) * max_color_distance()
-
-    def get_color(r: int, c: int) -> Optional[str]:
-        return position_color_map.get((r, c))
-
-    def run_sequence(seq):
-        current, last_color = [], None
-        for row, col in seq:
-            color = get_color(row, col)
-            if not color:
-                continue
-            if last_color is None:
-                current.append((row, col))
-                last_color = color
-            else:
-                if color_distance(color, last_color) <= thresh:
-                    current.append((row, col))
-                else:
-                    if len(current) >= trend_min_length:
-                        trends.append(current)
-                    current = [(row, col)]
-                    last_color = color
-        if len(current) >= trend_min_length:
-            trends.append(current)
-
-    if direction == "horizontal":
-        for row in range(rows):
-            run_sequence([(row, c) for c in range(cols)])
-    elif direction == "vertical":
-        for col in range(cols):
-            run_sequence([(r, col) for r in range(rows)])
-    else:  # diagonal
-        for start_row in range(rows):
-            run_sequence([
-                (start_row + o, o)
-                for o in range(min(rows - start_row, cols))
-            ])
-        for start_col in range(1, cols):
-            run_sequence([
-                (o, start_col + o)
-                for o in range(min(rows, cols - start_col))
-            ])
-        for start_row in range(rows):
-            run_sequence([
-                (start_row + o, cols - 1 - o)
-                for o in range(min(rows - start_row, cols))
-            ])
-        for start_col in range(cols - 2, -1, -1):
-            run_sequence([
-                (o, start_col - o)
-                for o in range(min(rows, start_col + 1))
-            ])
-    return trends
+    """Runs of one direction as lists of (row, col) cells (see trend_scan for the scan order)."""
+    return detect_all_trends(
+        cols, rows, position_color_map, trend_min_length, trend_similarity_pct,
+        horizontal=direction == "horizontal", vertical=direction == "vertical",
+        diagonal=direction not in ("horizontal", "vertical"),
+    )
+
+
+def _trend_directions(horizontal: bool, vertical: bool, diagonal: bool) -> List[str]:
+    return [d for d, on in zip(trend_scan.DIRECTIONS, (horizontal, vertical, diagonal)) if on]
 
 
 def detect_all_trends(
@@ -542,48 +1040,68 @@ def detect_all_trends(
     horizontal: bool = True,
     vertical: bool = True,
     diagonal: bool = True,
+    max_workers: Optional[int] = None,
 ) -> List[List[Tuple[int, int]]]:
-    """Run trend detection for enabled directions; use parallel workers when grid is large."""
-    directions = []
-    if horizontal:
-        directions.append("horizontal")
-    if vertical:
-        directions.append("vertical")
-    if diagonal:
-        directions.append("diagonal")
+    """Run trend detection for enabled directions (horizontal, vertical, diagonal order).
+
+    Large grids are scanned in balanced chunks of lines by worker processes over a shared
+    packed grid (trend_scan); max_workers caps them, 1 runs serially.
+    """
+    directions = _trend_directions(horizontal, vertical, diagonal)
     if not directions:
         return []
-    # Use parallel process pool when grid is large to use multiple CPU cores
-    _PARALLEL_TRENDS_MIN_CELLS = 100_000
-    if cols * rows >= _PARALLEL_TRENDS_MIN_CELLS and len(directions) > 1:
-        try:
-            all_trends: List[List[Tuple[int, int]]] = []
-            with ProcessPoolExecutor(max_workers=min(3, len(directions))) as ex:
-                futures = {
-                    ex.submit(
-                        detect_trends,
-                        cols,
-                        rows,
-                        d,
-                        position_color_map,
-                        trend_min_length,
-                        trend_similarity_pct,
-                    ): d
-                    for d in directions
-                }
-                for fut in as_completed(futures):
-                    all_trends.extend(fut.result())
-            return all_trends
-        except Exception:
-            pass
-    all_trends = []
-    for d in directions:
-        all_trends.extend(
-            detect_trends(
-                cols, rows, d,
-                position_color_map,
-                trend_min_length,
-                trend_similarity_pct,
-            )
-        )
-    return all_trends
+    packed = trend_scan.pack_position_map(position_color_map, rows, cols)
+    lines, runs = trend_scan.find_runs(packed, directions, trend_similarity_pct, trend_min_length, max_workers)
+    return trend_scan.runs_to_cells(packed, lines, runs)
+
+
+def detect_trend_mask(
+    color_grid: np.ndarray,
+    filled: np.ndarray,
+    trend_min_length: int,
+    trend_similarity_pct: float,
+    horizontal: bool = True,
+    vertical: bool = True,
+    diagonal: bool = True,
+    max_workers: Optional[int] = None,
+) -> np.ndarray:
+    """(rows, cols) bool mask of the cells in any trend, straight from a dense color grid."""
+    packed = trend_scan.pack_grid(color_grid, filled)
+    directions = _trend_directions(horizontal, vertical, diagonal)
+    lines, runs = trend_scan.find_runs(packed, directions, trend_similarity_pct, trend_min_length, max_workers)
+    return trend_scan.runs_to_mask(packed, lines, runs)
+
+
+def analyze_trends(
+    color_grid: np.ndarray,
+    filled: np.ndarray,
+    trend_min_length: int,
+    trend_similarity_pct: float,
+    horizontal: bool = True,
+    vertical: bool = True,
+    diagonal: bool = True,
+    layout: Optional[Any] = None,
+    ids: Optional[np.ndarray] = None,
+    vocab: Optional[Any] = None,
+    counts: Optional[np.ndarray] = None,
+    top_n: int = 20,
+    max_workers: Optional[int] = None,
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Trend mask and trend analytics (trend_scan.trend_report) of a dense color grid from one scan.
+
+    layout: layout cells (token order) or (first token, cells) chunks; with ids and vocab
+    the report attributes runs to tokens.
+    """
+    packed = trend_scan.pack_grid(color_grid, filled)
+    directions = _trend_directions(horizontal, vertical, diagonal)
+    lines, runs = trend_scan.find_runs(packed, directions, trend_similarity_pct, trend_min_length, max_workers)
+    mask = trend_scan.runs_to_mask(packed, lines, runs)
+    if isinstance(layout, np.ndarray):
+        layout = [(0, layout)]
+    report = trend_scan.trend_report(
+        packed, lines, runs, mask, layout=layout, ids=ids, vocab=vocab, counts=counts, top_n=top_n,
+    )
+    report["settings"] = {
+        "min_length": int(trend_min_length), "similarity_pct": float(trend_similarity_pct), "directions": directions,
+    }
+    return mask, report
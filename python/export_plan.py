@@ -0,0 +1,322 @@
+# export_plan.py - Estimate export memory/runtime per stage and choose render mode, trends and workers (no GUI)
+"""plan_export() looks at the token count, vocabulary size, canvas cells and output pixels
+before anything runs and decides:
+
+- the effective scale (the image side limit, 32,768 px or the performance profile's
+  max_export_dim, is reported, not applied silently),
+- whether trend detection fits the RAM budget, and with how many worker processes,
+- in-memory rendering (whole canvas as one array) or banded rendering (row bands streamed
+  to the PNG/PPM/raw file, memory bounded by the band height; WebP and other Pillow
+  formats are always rendered in memory),
+- the encoder cost for opts["output_format"] (image_formats: PNG level and threads, PPM, raw, WebP),
+- in-memory or out-of-core tokenization (token_store: token IDs, color grid and filled
+  mask as memmaps on disk) when opts["out_of_core"] is "auto" (default), True or False;
+  the random arrangement samples every cell at once, so an out-of-core plan with it is
+  rejected (plan["error"]).
+
+The GUI shows the estimated plan before long exports; the worker re-plans with the exact
+token and vocabulary counts and follows that plan. Rates are rough single-core figures.
+Trend limits, worker caps and the default RAM budget come from the performance profile.
+"""
+import multiprocessing
+from typing import Any, Dict, List, Optional, Tuple
+
+import core
+import perf_profile
+import trend_scan
+from image_formats import STREAMING_FORMATS, WEBP_MAX_DIM, encode_workers, png_level
+from token_store import DEFAULT_CHUNK_CHARS, DEFAULT_MEMORY_VOCAB, ID_CHUNK, streams_layout, supports_out_of_core
+
+# Optional: available RAM for the default budget
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+# Hard limit on the image side; the performance profile (max_export_dim) may set a lower one.
+# Trend detection is skipped above the profile's export_trend_max_cells (default 2M cells,
+# which keeps exports of 9M+ tokens finishable).
+MAX_EXPORT_DIM = perf_profile.MAX_EXPORT_DIM
+# Fraction of available RAM an export may use when no budget is configured
+MEMORY_BUDGET_FRACTION = 0.7
+_FALLBACK_BUDGET = 4 * 1024 ** 3
+# Exports estimated to take longer than this are confirmed with the user first
+LONG_EXPORT_S = 10.0
+MIN_BAND_ROWS = 16
+
+# Bytes per item
+_TOKEN_STR_BYTES = 72  # Python str plus list slot, while tokenizing
+_VOCAB_ENTRY_BYTES = 64
+_TREND_RUN_BYTES = 16  # (line, first, last, cells) int32 per run; a run holds >= trend_min_length cells
+_TREND_BATCH_BYTES = 64 << 20  # run expansion while building the trend mask
+_TREND_WORKER_BYTES = 96 << 20  # a trend scan process (interpreter, numpy, run buffer)
+_CELL_BOUNDS_BYTES = 48  # block bounds and colors per painted cell (blocks under one pixel)
+_CANVAS_PX_BYTES = 3  # RGB canvas array (PNG/PPM/raw encode it in place); index canvases: opts["canvas_px_bytes"]
+_PIL_PX_BYTES = 10  # canvas, PIL image copy and encoder buffers (WebP, other Pillow formats)
+_BAND_PX_BYTES = 9  # band array, filtered rows and compressor input
+# Seconds per item
+_TOKENIZE_S = 5e-7
+_COLOR_S = 3e-6
+_LAYOUT_S = 5e-8
+_TREND_S = 5e-8 if trend_scan.HAS_NUMBA else 7e-7  # per cell of a scan line
+_POOL_START_S = 0.3
+_DRAW_S = 1e-8  # painted blocks
+_REPLICATE_S = 3e-9  # blocks of >= 1 px, replicated from grid rows
+_PNG_LEVEL_S = (1.0e-8, 1.2e-8, 1.3e-8, 1.4e-8, 1.5e-8, 1.6e-8, 1.7e-8, 2.0e-8, 2.4e-8, 2.6e-8)  # per thread
+_ENCODE_S = {"ppm": 1e-9, "raw": 1e-9, "webp": 5e-8, "pil": 3e-8}
+_SPILL_S = 5e-6  # per vocabulary entry kept in SQLite (out of core)
+_SPILL_ENTRY_BYTES = 80  # on disk
+
+# Rough tokens per input character, by tokenize mode (for planning before tokenizing)
+_TOKENS_PER_CHAR = {
+    "words": 1 / 6, "lines": 1 / 40, "custom": 1 / 8,
+    "chars": 1.0, "char-ngrams": 1.0, "byte-windows": 1.1, "word-ngrams": 1 / 6,
+}
+
+
+def estimate_tokens(n_chars: int, mode: str) -> int:
+    return max(1, int(n_chars * _TOKENS_PER_CHAR.get(mode, 1 / 6)))
+
+
+def estimate_vocab(n_tokens: int, mode: str) -> int:
+    """Heaps'-law guess of distinct tokens (exact counts replace it once tokenized)."""
+    if mode == "chars":
+        return min(n_tokens, 5_000)
+    return min(n_tokens, int(40 * n_tokens ** 0.6))
+
+
+def available_memory() -> int:
+    if HAS_PSUTIL:
+        return int(psutil.virtual_memory().available)
+    return _FALLBACK_BUDGET
+
+
+def memory_budget(opts: Optional[Dict[str, Any]] = None) -> int:
+    """RAM budget in bytes: opts["memory_budget_mb"] or the profile's if set (> 0), else a fraction of available RAM."""
+    mb = int((opts or {}).get("memory_budget_mb") or 0) or perf_profile.get("memory_budget_mb")
+    if mb > 0:
+        return mb * 1024 * 1024
+    return int(available_memory() * MEMORY_BUDGET_FRACTION)
+
+
+def effective_scale(w: int, h: int, scale: float, max_dim: Optional[int] = None) -> float:
+    """Largest scale <= scale that keeps a w x h canvas within max_dim (default: the profile's) on both sides."""
+    max_dim = max_dim or perf_profile.get("max_export_dim")
+    out_w, out_h = w * scale, h * scale
+    if out_w > max_dim or out_h > max_dim:
+        r = min(max_dim / out_w, max_dim / out_h)
+        out_w = int(out_w * r)
+        scale = out_w / w if w else 1
+    return scale
+
+
+def _stage(name: str, peak: int, seconds: float, note: str = "") -> Dict[str, Any]:
+    return {"name": name, "bytes": int(peak), "seconds": float(seconds), "note": note}
+
+
+def _token_stages(
+    n: int, n_vocab: int, n_chars: int, cells: int, opts: Dict[str, Any], out_of_core: bool,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Tokenize, color and layout stages plus the bytes held from layout to the end."""
+    if not out_of_core:
+        # Token IDs, vocab, cells, color grid (+ filled, heat)
+        base = 4 * n + _VOCAB_ENTRY_BYTES * n_vocab + 8 * n + 4 * cells
+        if opts.get("heatmap"):
+            base += 4 * cells
+        return [
+            _stage("tokenize", 2 * n_chars + (_TOKEN_STR_BYTES + 4) * n, _TOKENIZE_S * n),
+            _stage("color", 4 * n + _VOCAB_ENTRY_BYTES * n_vocab + 6 * n_vocab, _COLOR_S * n_vocab),
+            _stage("layout", base + 3 * n, _LAYOUT_S * n + 2e-9 * cells),
+        ], base
+    # Out of core: token IDs, cells, grids on disk; in memory are one text chunk, the
+    # in-memory part of the vocab, palettes and token counts
+    mode = opts.get("tokenize_mode", "words")
+    mem_vocab = min(n_vocab, DEFAULT_MEMORY_VOCAB)
+    chunk_tokens = min(n, estimate_tokens(DEFAULT_CHUNK_CHARS, mode))
+    base = _VOCAB_ENTRY_BYTES * mem_vocab + 14 * n_vocab
+    layout = base + 24 * min(n, ID_CHUNK)  # cells are generated per chunk (token_store.iter_layout_cells)
+    return [
+        _stage(
+            "tokenize", 4 * DEFAULT_CHUNK_CHARS + (_TOKEN_STR_BYTES + 12) * chunk_tokens + _VOCAB_ENTRY_BYTES * mem_vocab,
+            _TOKENIZE_S * n + _SPILL_S * (n_vocab - mem_vocab), "out of core",
+        ),
+        _stage("color", base + _VOCAB_ENTRY_BYTES * min(n_vocab, 1 << 20), _COLOR_S * n_vocab),
+        _stage("layout", layout, 2 * _LAYOUT_S * n + 2e-9 * cells, "grids on disk"),
+    ], base
+
+
+def plan_export(
+    n_tokens: int,
+    n_vocab: int,
+    opts: Dict[str, Any],
+    budget: Optional[int] = None,
+    n_chars: int = 0,
+    cpu_count: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Plan an image export; returns a dict with the choices and a per-stage estimate.
+
+    Keys: rows, cols, width, height, requested_scale, scale, scale_clamped, out_width,
+    out_height, render ("memory" or "banded"), band_rows, trends, trend_note, workers,
+    out_of_core, disk_bytes, format, max_dim, encode_workers, stages (name, bytes, seconds,
+    note), peak_bytes, seconds, budget, fits, error ("" or why the export cannot run).
+    """
+    budget = memory_budget(opts) if budget is None else budget
+    cpus = cpu_count or multiprocessing.cpu_count() or 1
+    n = max(1, int(n_tokens))
+    info = core.calculate_canvas_size(n, opts.get("pixel_size", 1), opts.get("canvas_shape", "square"))
+    rows, cols = int(info["rows"]), int(info["cols"])
+    w, h = int(info["width"]), int(info["height"])
+    cells = rows * cols
+    requested = float(opts.get("export_scale", 1))
+    fmt = opts.get("output_format", "png")
+    max_dim = perf_profile.get("max_export_dim")
+    if fmt == "webp":
+        max_dim = min(max_dim, WEBP_MAX_DIM)
+    scale = effective_scale(w, h, requested, max_dim)
+    out_w, out_h = max(1, int(w * scale)), max(1, int(h * scale))
+    out_px = out_w * out_h
+
+    # Out of core when forced, or ("auto") when the in-memory token stages exceed the budget
+    setting = opts.get("out_of_core", "auto")
+    stages, base = _token_stages(n, n_vocab, n_chars, cells, opts, False)
+    out_of_core = supports_out_of_core(opts.get("tokenize_mode", "words")) and (
+        setting is True or (setting == "auto" and max(s["bytes"] for s in stages) > budget)
+    )
+    disk_bytes, error = 0, ""
+    if out_of_core:
+        stages, base = _token_stages(n, n_vocab, n_chars, cells, opts, True)
+        pattern = opts.get("arrangement_pattern", "row-major")
+        if not streams_layout(pattern):
+            error = (
+                f"The {pattern} arrangement needs all {cells:,} canvas cells in memory, so it cannot run "
+                "out of core. Choose another arrangement or raise the memory budget."
+            )
+        disk_bytes = 4 * n + 4 * cells + (4 * cells if opts.get("heatmap") else 0)
+        disk_bytes += _SPILL_ENTRY_BYTES * max(0, n_vocab - DEFAULT_MEMORY_VOCAB)
+
+    # Trends: packed grid (plus one shared copy when parallel), mask, runs and per-worker
+    # buffers; fewer workers (down to serial) until it fits
+    trends, workers, trend_note = False, 0, ""
+    if opts.get("highlight_trends"):
+        flags = [bool(opts.get(k, True)) for k in ("trend_horizontal", "trend_vertical", "trend_diagonal")]
+        directions = sum(flags)
+        line_cells = cells * (flags[0] + flags[1] + 2 * flags[2])  # diagonals visit every cell twice
+        held_trends = base + 5 * cells + _TREND_RUN_BYTES * line_cells // max(2, int(opts.get("trend_min_length", 3)))
+        held_trends += _TREND_BATCH_BYTES
+
+        def trend_peak(k: int) -> int:
+            return held_trends + (4 * cells + _TREND_WORKER_BYTES * k if k > 1 else 0)
+
+        max_cells = perf_profile.get("export_trend_max_cells")
+        if cells > max_cells:
+            trend_note = f"skipped: {cells:,} cells > {max_cells:,}"
+        elif directions == 0:
+            trend_note = "no directions"
+        else:
+            parallel = cells >= perf_profile.get("trend_parallel_min_cells")
+            workers = min(perf_profile.get("trend_max_workers"), cpus) if parallel else 1
+            while workers > 1 and trend_peak(workers) > budget:
+                workers -= 1
+            if trend_peak(workers) > budget:
+                workers, trend_note = 0, "skipped: does not fit the RAM budget"
+            else:
+                trends = True
+                trend_note = f"{directions} direction(s), {workers} worker(s)"
+        if trends:
+            secs = _TREND_S * line_cells / max(1, workers) + (_POOL_START_S if workers > 1 else 0)
+            stages.append(_stage("trends", trend_peak(workers), secs, trend_note))
+
+    # Encoder: PNG deflate by level, split over encode threads; PPM/raw only write; WebP one thread
+    threads = 1
+    if fmt == "png":
+        threads = min(encode_workers(opts), cpus)
+        encode_s = _PNG_LEVEL_S[png_level(opts)] / threads
+        encode_note = f"PNG level {png_level(opts)}, {threads} thread(s)"
+    else:
+        encode_s = _ENCODE_S.get(fmt, _PNG_LEVEL_S[-1])
+        encode_note = fmt.upper()
+
+    # Render: whole canvas in memory if it fits (always for formats Pillow encodes), else row
+    # bands streamed to the file
+    held = base + (cells if trends else 0)
+    streams = fmt in STREAMING_FORMATS
+    px_bytes = (opts.get("canvas_px_bytes") or _CANVAS_PX_BYTES) if streams else _PIL_PX_BYTES
+    # Blocks of >= 1 px are replicated a few grid rows at a time (no per-cell bounds held)
+    replicate = opts.get("pixel_size", 1) * scale >= 1
+    cell_bytes = 0 if replicate else _CELL_BOUNDS_BYTES * n
+    draw_s = _REPLICATE_S if replicate else _DRAW_S
+    in_memory = held + px_bytes * out_px + cell_bytes
+    band_rows = out_h
+    if in_memory <= budget or not streams:
+        render = "memory"
+        stages.append(_stage(
+            "render", in_memory, (draw_s + encode_s) * out_px, f"{out_w:,} x {out_h:,} px in memory, {encode_note}",
+        ))
+    else:
+        render = "banded"
+        row_bytes = _BAND_PX_BYTES * out_w
+        band_rows = int(max(0, budget - held - cell_bytes) // row_bytes)
+        band_rows = max(MIN_BAND_ROWS, min(out_h, band_rows))
+        peak = held + cell_bytes + row_bytes * band_rows
+        bands = -(-out_h // band_rows)
+        stages.append(_stage(
+            "render", peak, (draw_s + encode_s) * out_px + 2e-3 * bands,
+            f"{out_w:,} x {out_h:,} px in {bands:,} bands of {band_rows:,} rows, {encode_note}",
+        ))
+
+    peak_bytes = max(s["bytes"] for s in stages)
+    return {
+        "n_tokens": n, "n_vocab": int(n_vocab), "rows": rows, "cols": cols, "width": w, "height": h,
+        "requested_scale": requested, "scale": scale, "scale_clamped": scale < requested,
+        "out_width": out_w, "out_height": out_h,
+        "render": render, "band_rows": band_rows,
+        "trends": trends, "trend_note": trend_note, "workers": max(1, workers),
+        "out_of_core": out_of_core, "disk_bytes": disk_bytes,
+        "format": fmt, "max_dim": max_dim, "encode_workers": threads,
+        "stages": stages, "peak_bytes": peak_bytes, "seconds": sum(s["seconds"] for s in stages),
+        "budget": budget, "fits": peak_bytes <= budget, "error": error,
+    }
+
+
+def _fmt_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:,.0f} {unit}" if unit == "B" else f"{n:,.1f} {unit}"
+        n /= 1024.0
+    return str(n)
+
+
+def _fmt_seconds(s: float) -> str:
+    if s < 60:
+        return f"{s:.1f} s"
+    return f"{s / 60:.1f} min"
+
+
+def format_plan(plan: Dict[str, Any]) -> str:
+    """Multi-line summary of a plan for a dialog."""
+    lines = [
+        f"Tokens: {plan['n_tokens']:,}  vocabulary: {plan['n_vocab']:,}",
+        f"Canvas: {plan['cols']:,} x {plan['rows']:,} cells -> {plan['out_width']:,} x {plan['out_height']:,} px",
+    ]
+    if plan["scale_clamped"]:
+        lines.append(
+            f"Scale reduced from {plan['requested_scale']:g} to {plan['scale']:.2f} "
+            f"(max {plan['max_dim']:,} px per side)"
+        )
+    lines.append("")
+    for s in plan["stages"]:
+        note = f"  ({s['note']})" if s["note"] else ""
+        lines.append(f"{s['name']:<9} {_fmt_bytes(s['bytes']):>10}  {_fmt_seconds(s['seconds']):>8}{note}")
+    if not plan["trends"] and plan["trend_note"]:
+        lines.append(f"trends    {plan['trend_note']}")
+    if plan["out_of_core"]:
+        lines.append(f"Out of core: token IDs and grids on disk (~{_fmt_bytes(plan['disk_bytes'])})")
+    lines.append("")
+    lines.append(
+        f"Peak ~{_fmt_bytes(plan['peak_bytes'])} of {_fmt_bytes(plan['budget'])} budget, "
+        f"~{_fmt_seconds(plan['seconds'])}"
+    )
+    if not plan["fits"]:
+        lines.append("Warning: the estimate exceeds the RAM budget.")
+    return "\n".join(lines)
@@ -1,76 +1,621 @@
 # export_worker.py - Run export in a subprocess (no tkinter) so UI stays responsive
-"""Export image worker for use in a separate process. Handles very large token counts."""
-from typing import Dict, Any
+"""Export image/video/comparison workers for use in a separate process. Handles very large token counts."""
+import json
+import os
+from typing import Dict, Any, List, Optional, Tuple
 from multiprocessing import Queue
 
+import numpy as np
+
 import core
-from render_2d import draw_canvas
+import perf_profile
+from export_plan import effective_scale, estimate_tokens, estimate_vocab, plan_export
+from grid_index import GridIndex
+from mapping_io import MappingFile, MappingWriter, write_mapping
+from palette_cache import PaletteCache, DEFAULT_MAX_ENTRIES
+from image_formats import MAX_PALETTE_COLORS, indexed_palette, open_image_writer, output_format, write_image
+from render_2d import (
+    MAX_INDEX_COLORS, CanvasPalette, blend_heat, blend_highlight, compose_side_by_side, draw_grid, draw_grid_array,
+    hex_to_rgb_tuple, iter_grid_bands,
+)
+from render_spec import spec_palette_and_grid, write_render_spec
+from token_store import SpillVocab, build_palette_chunked, count_tokens, tokenize_to_store
+from video_export import iter_cube_frames, iter_growth_frames, write_video
+
+
+def read_text_file(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def _payload_text(payload: Any) -> str:
+    """Worker input is the text itself or {"path": ...} for files too large for the editor."""
+    if isinstance(payload, dict):
+        return read_text_file(payload["path"])
+    return payload
+
+
+def _payload_chars(payload: Any) -> int:
+    if isinstance(payload, dict):
+        return os.path.getsize(payload["path"])
+    return len(payload)
+
+
+def _token_palette(text: Any, opts: Dict[str, Any], out_of_core: bool = False) -> Optional[Dict[str, Any]]:
+    """Tokenize and color: token-ID array, vocab, palette, display palette and seed (None if no tokens).
+
+    With out_of_core, inputs the export plan does not fit in memory are tokenized into a
+    token_store.TokenStore (returned as "store"; the caller releases it with _release).
+    """
+    if out_of_core:
+        n_chars = _payload_chars(text)
+        mode = opts["tokenize_mode"]
+        n = estimate_tokens(n_chars, mode)
+        plan = plan_export(n, estimate_vocab(n, mode), opts, n_chars=n_chars)
+        if plan["error"]:
+            raise ValueError(plan["error"])
+        if plan["out_of_core"]:
+            return _token_palette_out_of_core(text, opts)
+    text = _payload_text(text)
+    # Token-ID array + (V, 3) palette: each unique token (or n-gram) is colored once
+    ids, vocab = core.tokenize_ids(
+        text,
+        mode=opts["tokenize_mode"],
+        custom_sep=opts["custom_separator"],
+        ngram_n=opts.get("ngram_n", core.DEFAULT_NGRAM_N),
+    )
+    if not len(ids):
+        return None
+    out = _color_vocab(vocab, opts)
+    out["ids"] = ids
+    return out
+
+
+def _token_palette_out_of_core(payload: Any, opts: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    store = tokenize_to_store(
+        payload, opts["tokenize_mode"], opts["custom_separator"], work_dir=opts.get("out_of_core_dir") or None,
+    )
+    if not len(store.ids):
+        store.close()
+        return None
+    try:
+        out = _color_vocab(store.vocab, opts)
+    except Exception:
+        store.close()
+        raise
+    out["ids"] = store.ids
+    out["store"] = store
+    return out
+
+
+def _release(tp: Optional[Dict[str, Any]]) -> None:
+    """Remove the on-disk token store of an out-of-core run."""
+    if tp and tp.get("store") is not None:
+        tp["ids"] = None
+        tp.pop("store").close()
+
+
+def _color_vocab(vocab: Any, opts: Dict[str, Any]) -> Dict[str, Any]:
+    """Palette for a vocab (mapping file, then palette cache / generator) plus the emphasized display palette."""
+    mode = opts["current_mode"]
+    seed = core.normalize_seed(opts.get("seed"))
+    if seed is None:
+        seed = core.new_seed()
+    mapping_path = opts.get("mapping_path")
+    mapping = MappingFile(mapping_path) if mapping_path else None
+    # A disk-spilled vocabulary is colored in chunks (only one chunk of token strings in memory)
+    build = build_palette_chunked if isinstance(vocab, SpillVocab) else core.build_palette
+    try:
+        cache_path = opts.get("palette_cache_path")
+        if cache_path and mode == "standard":
+            with PaletteCache(cache_path, opts.get("palette_cache_max_entries", DEFAULT_MAX_ENTRIES)) as cache:
+                palette = build(vocab, mode, mapping=mapping, cache=cache)
+        else:
+            palette = build(vocab, mode, mapping=mapping, seed=seed)
+    finally:
+        if mapping is not None:
+            mapping.close()
+    display = core.emphasize_palette(
+        palette, opts["similarity_threshold"], opts["emphasize_similarity"]
+    )
+    return {"vocab": vocab, "palette": palette, "display": display, "seed": seed}
+
+
+def _grid_name(kind: str, opts: Dict[str, Any]) -> str:
+    return "_".join([kind] + [str(v) for v in _layout_key(opts)]) + ".grid"
+
+
+def _layout_grid(ids: np.ndarray, display: np.ndarray, opts: Dict[str, Any], seed: int, store: Any = None):
+    """Canvas info, layout cells and the dense color grid / filled mask for a token-ID array.
+
+    With an out-of-core store, the grid and mask are memmaps written in one pass over the
+    token-ID memmap, and cells is None.
+    """
+    canvas_info = core.calculate_canvas_size(len(ids), opts["pixel_size"], opts["canvas_shape"])
+    if store is not None:
+        color_grid, filled = store.scatter(display, canvas_info, opts, seed, _grid_name("color", opts), 255, filled=True)
+        return canvas_info, None, color_grid, filled
+    # Tokens go only to cells inside the shape mask (nothing placed and then dropped)
+    cells = core.layout_cells(
+        len(ids), canvas_info, opts["arrangement_pattern"], opts["canvas_shape"],
+        opts["pixel_size"], seed=seed,
+    )
+    color_grid, filled = core.build_color_grid(
+        cells, display[ids[: len(cells)]], canvas_info["rows"], canvas_info["cols"]
+    )
+    return canvas_info, cells, color_grid, filled
+
+
+def _trend_mask(
+    color_grid: np.ndarray, filled: np.ndarray, opts: Dict[str, Any], max_workers: Optional[int] = None,
+) -> Optional[np.ndarray]:
+    rows, cols = filled.shape
+    # Skip trend detection for huge grids so export can finish in reasonable time
+    if not opts["highlight_trends"] or rows * cols > perf_profile.get("export_trend_max_cells"):
+        return None
+    return core.detect_trend_mask(
+        color_grid, filled, opts["trend_min_length"], opts["trend_similarity"],
+        horizontal=opts["trend_horizontal"],
+        vertical=opts["trend_vertical"],
+        diagonal=opts["trend_diagonal"],
+        max_workers=max_workers,
+    )
+
+
+def _trend_analysis(
+    tp: Dict[str, Any], canvas_info: Dict[str, Any], cells: Optional[np.ndarray], color_grid: np.ndarray,
+    filled: np.ndarray, opts: Dict[str, Any], counts: Optional[np.ndarray] = None, max_workers: Optional[int] = None,
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Trend mask and analytics report (core.analyze_trends), runs attributed to tokens."""
+    store = tp.get("store")
+    layout = cells if store is None else store.layout_chunks(canvas_info, opts, tp["seed"])
+    mask, report = core.analyze_trends(
+        color_grid, filled, opts["trend_min_length"], opts["trend_similarity"],
+        horizontal=opts["trend_horizontal"],
+        vertical=opts["trend_vertical"],
+        diagonal=opts["trend_diagonal"],
+        layout=layout, ids=tp["ids"], vocab=tp["vocab"], counts=counts,
+        top_n=opts.get("trend_top_runs", 20),
+        max_workers=max_workers,
+    )
+    report["tokens"] = int(len(tp["ids"]))
+    report["vocab"] = int(len(tp["vocab"]))
+    return mask, report
 
-# Skip trend detection above this many grid cells (keeps export finishable for 9M+ tokens)
-EXPORT_TREND_MAX_CELLS = 2_000_000
+
+def _write_json(obj: Any, path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+
+
+def _layout_key(opts: Dict[str, Any]) -> tuple:
+    return (opts["pixel_size"], opts["canvas_shape"], opts["arrangement_pattern"])
+
+
+def _trend_key(opts: Dict[str, Any]) -> tuple:
+    if not opts["highlight_trends"]:
+        return ()
+    return (opts["trend_min_length"], opts["trend_similarity"],
+            opts["trend_horizontal"], opts["trend_vertical"], opts["trend_diagonal"])
+
+
+def _export_palette(
+    display: np.ndarray, counts: Optional[np.ndarray], color_grid: np.ndarray, filled: np.ndarray,
+    heat: Optional[np.ndarray], draw_args: Dict[str, Any], max_colors: int = MAX_PALETTE_COLORS,
+) -> Optional[np.ndarray]:
+    """Every color the export can paint, if at most max_colors (index canvas, indexed PNG), else None.
+
+    Token colors get the heatmap blend per token; highlighted colors are taken from the
+    trend cells themselves, so only variants that occur count against the limit.
+    """
+    colors = np.asarray(display, dtype=np.uint8)
+    heat_opacity = draw_args["heat_opacity"]
+    if heat is not None and heat_opacity > 0:
+        colors = blend_heat(colors, core.frequency_heat(counts), heat_opacity)
+    palette = indexed_palette(colors, max_colors=max_colors)
+    trend_mask = draw_args["trend_mask"]
+    if palette is None or trend_mask is None:
+        return palette
+    hit = np.asarray(trend_mask) & np.asarray(filled)
+    if not hit.any():
+        return palette
+    hit_rgb = np.asarray(color_grid)[hit]
+    if heat is not None and heat_opacity > 0:
+        hit_rgb = blend_heat(hit_rgb, np.asarray(heat)[hit], heat_opacity)
+    highlight = hex_to_rgb_tuple(draw_args["highlight_color"])
+    return indexed_palette(
+        colors, blend_highlight(hit_rgb, highlight, draw_args["highlight_opacity"]), max_colors=max_colors,
+    )
+
+
+def _export_image_from(
+    tp: Dict[str, Any], opts: Dict[str, Any], path: str, stages: Dict[tuple, Any],
+) -> Dict[str, Any]:
+    """Layout, optional trends/heatmap, draw and save for an already colored token stream.
+
+    stages caches the shared pipeline stages (token counts, layout per canvas, trend mask per
+    canvas and trend settings), so variants of one text only redo what differs. The export
+    plan (export_plan.plan_export) decides trends, their worker count and banded rendering.
+    For an out-of-core token stream (tp["store"]) the grids are memmaps in the store. The
+    output format follows the path extension (image_formats).
+    """
+    ids, display, seed = tp["ids"], tp["display"], tp["seed"]
+    store = tp.get("store")
+    fmt = output_format(path)
+    plan = plan_export(len(ids), len(tp["vocab"]), dict(opts, out_of_core=store is not None, output_format=fmt))
+    # One bincount over the token IDs feeds both the stats sidecar and the heatmap
+    counts = None
+    if opts.get("heatmap") or opts.get("write_stats"):
+        if ("counts",) not in stages:
+            stages[("counts",)] = count_tokens(ids, len(tp["vocab"]))
+        counts = stages[("counts",)]
+
+    lkey = ("layout",) + _layout_key(opts)
+    if lkey not in stages:
+        stages[lkey] = _layout_grid(ids, display, opts, seed, store)
+    canvas_info, cells, color_grid, filled = stages[lkey]
+    scale = plan["scale"]
+    rows, cols = canvas_info["rows"], canvas_info["cols"]
+    heat = None
+    if opts.get("heatmap") and store is not None:
+        heat, _ = store.scatter(core.frequency_heat(counts), canvas_info, opts, seed, _grid_name("heat", opts), 0.0)
+    elif opts.get("heatmap"):
+        heat = np.zeros(rows * cols, dtype=np.float32)
+        heat[cells] = core.frequency_heat(counts)[ids[: len(cells)]]
+        heat = heat.reshape(rows, cols)
+
+    # With the stats sidecar, the trend scan also yields its analytics report (same mask)
+    analytics = bool(opts.get("write_stats")) and plan["trends"]
+    tkey = ("trends",) + _layout_key(opts) + _trend_key(opts) + (("report",) if analytics else ())
+    if tkey not in stages:
+        if analytics:
+            stages[tkey] = _trend_analysis(tp, canvas_info, cells, color_grid, filled, opts, counts, plan["workers"])
+        else:
+            stages[tkey] = (_trend_mask(color_grid, filled, opts, plan["workers"]) if plan["trends"] else None, None)
+    trend_mask, trends = stages[tkey]
+
+    draw_args = dict(
+        trend_mask=trend_mask,
+        highlight_color=opts["highlight_color_hex"],
+        highlight_opacity=opts["trend_opacity"] / 100.0,
+        scale=scale,
+        heat=heat,
+        heat_opacity=opts.get("heatmap_opacity", 60) / 100.0,
+    )
+    # Few distinct colors (e.g. after similarity emphasis): paint palette indices, not RGB
+    palette, canvas = None, None
+    index_canvas = opts.get("index_canvas", True)
+    if index_canvas or (fmt == "png" and opts.get("png_palette", True)):
+        max_colors = MAX_INDEX_COLORS if index_canvas else MAX_PALETTE_COLORS
+        palette = _export_palette(display, counts, color_grid, filled, heat, draw_args, max_colors)
+    if palette is not None and index_canvas:
+        canvas = CanvasPalette(palette)
+        plan = plan_export(len(ids), len(tp["vocab"]), dict(
+            opts, out_of_core=store is not None, output_format=fmt, canvas_px_bytes=canvas.dtype.itemsize,
+        ))
+    indexed_png = (
+        fmt == "png" and palette is not None and len(palette) <= MAX_PALETTE_COLORS and opts.get("png_palette", True)
+    )
+    if plan["render"] == "banded":
+        # Canvas does not fit the RAM budget: stream row bands straight into the file
+        with open_image_writer(path, fmt, plan["out_width"], plan["out_height"], opts, palette) as out:
+            for band in iter_grid_bands(
+                color_grid, filled, canvas_info, opts["pixel_size"], plan["band_rows"], palette=canvas, **draw_args
+            ):
+                out.write(band)
+    else:
+        arr = draw_grid_array(color_grid, filled, canvas_info, opts["pixel_size"], palette=canvas, **draw_args)
+        write_image(arr, path, fmt, opts, palette)
+        del arr
+    stats_path, trends_path = None, None
+    if opts.get("write_stats"):
+        stats_path = os.path.splitext(path)[0] + ".stats.json"
+        _write_json(core.token_stats(tp["vocab"], counts), stats_path)
+    if trends is not None:
+        trends_path = os.path.splitext(path)[0] + ".trends.json"
+        _write_json(trends, trends_path)
+    return {
+        "ok": True, "path": path, "seed": seed, "stats_path": stats_path, "trends_path": trends_path,
+        "scale": scale, "requested_scale": plan["requested_scale"], "render": plan["render"],
+        "out_of_core": store is not None, "format": fmt, "max_dim": plan["max_dim"],
+        "canvas": "rgb" if canvas is None else f"index{8 * canvas.dtype.itemsize}",
+        "palette_colors": len(palette) if indexed_png else None,
+        "trend_note": plan["trend_note"] if opts["highlight_trends"] and not plan["trends"] else "",
+    }
+
+
+def export_image(text: Any, opts: Dict[str, Any], path: str) -> Dict[str, Any]:
+    """Full export (tokenize, color, layout, optional trend, draw, save); returns the result dict."""
+    tp = _token_palette(text, opts, out_of_core=True)
+    if tp is None:
+        return {"ok": False, "error": "No tokens to export."}
+    try:
+        return _export_image_from(tp, opts, path, {})
+    finally:
+        _release(tp)
 
 
 def run_export_image(text: str, opts: Dict[str, Any], path: str, result_queue: Queue) -> None:
-    """Run full export (tokenize, color, positions, optional trend, draw, save). Puts result in queue."""
+    """Run full export (tokenize, color, layout, optional trend, draw, save). Puts result in queue."""
     try:
-        tokens = core.tokenize(
-            text,
-            mode=opts["tokenize_mode"],
-            custom_sep=opts["custom_separator"],
-        )
-        if not tokens:
+        result_queue.put(export_image(text, opts, path))
+    except Exception as e:
+        result_queue.put({"ok": False, "error": str(e)})
+
+
+def trend_report(text: Any, opts: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Trend analytics of a text without rendering (tokenize, color, layout, scan); None if no tokens.
+
+    Runs regardless of highlight_trends and the export trend cell limit; large inputs go
+    out of core as for an export. opts["trend_top_runs"] sets the number of longest runs.
+    """
+    tp = _token_palette(text, opts, out_of_core=True)
+    if tp is None:
+        return None
+    try:
+        canvas_info, cells, color_grid, filled = _layout_grid(tp["ids"], tp["display"], opts, tp["seed"], tp.get("store"))
+        _mask, report = _trend_analysis(tp, canvas_info, cells, color_grid, filled, opts)
+        report["seed"] = tp["seed"]
+        return report
+    finally:
+        _release(tp)
+
+
+def export_trends(text: Any, opts: Dict[str, Any], path: str) -> Dict[str, Any]:
+    """Write the trend analytics of a text as JSON to path (no image); returns the result dict."""
+    report = trend_report(text, opts)
+    if report is None:
+        return {"ok": False, "error": "No tokens to analyze."}
+    _write_json(report, path)
+    return {
+        "ok": True, "path": path, "seed": report["seed"], "runs": report["runs"], "coverage": report["coverage"],
+    }
+
+
+def run_export_trends(text: Any, opts: Dict[str, Any], path: str, result_queue: Queue) -> None:
+    """Write trend analytics JSON without rendering. Puts result in queue."""
+    try:
+        result_queue.put(export_trends(text, opts, path))
+    except Exception as e:
+        result_queue.put({"ok": False, "error": str(e)})
+
+
+def run_export_batch(text: Any, variants: List[Tuple[Dict[str, Any], str]], result_queue: Queue) -> None:
+    """Several image exports of one text (e.g. scales or shapes) in one process. Puts one result per variant.
+
+    Tokenizing and coloring run once for all variants (they share tokenize/color options);
+    layout and trends run once per canvas. Variants are processed grouped by canvas so only
+    one layout is held at a time. Each result carries "index" (position in variants).
+    """
+    try:
+        tp = _token_palette(text, variants[0][0], out_of_core=True)
+    except Exception as e:
+        tp, error = None, str(e)
+    else:
+        error = "No tokens to export."
+    order = sorted(range(len(variants)), key=lambda i: repr(_layout_key(variants[i][0])))
+    stages: Dict[tuple, Any] = {}
+    for i in order:
+        opts, path = variants[i]
+        if tp is None:
+            result_queue.put({"ok": False, "error": error, "index": i})
+            continue
+        lkey = ("layout",) + _layout_key(opts)
+        if lkey not in stages:
+            # Next canvas: drop the previous layout and trend masks, keep the token counts
+            stages = {k: v for k, v in stages.items() if k == ("counts",)}
+        try:
+            result = _export_image_from(tp, opts, path, stages)
+        except Exception as e:
+            result = {"ok": False, "error": str(e)}
+        result["index"] = i
+        result_queue.put(result)
+    stages.clear()
+    _release(tp)
+
+
+def run_build_view(text: str, opts: Dict[str, Any], path: str, result_queue: Queue) -> None:
+    """Build the in-app viewer data in directory path. Puts result in queue.
+
+    Writes color_grid.npy (one pixel per cell), the GridIndex arrays and vocab.tcm (token
+    strings and display colors in token-ID order), so the GUI can open all of it via mmap.
+    """
+    try:
+        tp = _token_palette(text, opts)
+        if tp is None:
+            result_queue.put({"ok": False, "error": "No tokens to view."})
+            return
+        ids, display, seed = tp["ids"], tp["display"], tp["seed"]
+        canvas_info, cells, color_grid, filled = _layout_grid(ids, display, opts, seed)
+        del filled
+        np.save(os.path.join(path, "color_grid.npy"), color_grid)
+        del color_grid
+        GridIndex(cells, ids, canvas_info["rows"], canvas_info["cols"], len(tp["vocab"])).save(path)
+        with MappingWriter(os.path.join(path, "vocab.tcm")) as w:
+            for token, rgb in zip(tp["vocab"], display.tolist()):
+                w.write(token, rgb)
+        result_queue.put({
+            "ok": True, "path": path, "seed": seed, "kind": "view",
+            "rows": int(canvas_info["rows"]), "cols": int(canvas_info["cols"]), "tokens": int(len(ids)),
+        })
+    except Exception as e:
+        result_queue.put({"ok": False, "error": str(e)})
+
+
+def build_render_spec(text: Any, opts: Dict[str, Any], path: str) -> Dict[str, Any]:
+    """Tokenize, color, lay out and (if planned) detect trends, then write a render spec file.
+
+    The spec holds final colors as a palette plus one palette index per cell (see render_spec).
+    """
+    tp = _token_palette(text, opts)
+    if tp is None:
+        return {"ok": False, "error": "No tokens to export."}
+    ids, display = tp["ids"], tp["display"]
+    plan = plan_export(len(ids), len(tp["vocab"]), opts)
+    canvas_info, cells, color_grid, filled = _layout_grid(ids, display, opts, tp["seed"])
+    trend_mask = _trend_mask(color_grid, filled, opts, plan["workers"]) if plan["trends"] else None
+    del color_grid
+    token_heat = None
+    if opts.get("heatmap"):
+        token_heat = core.frequency_heat(np.bincount(ids, minlength=len(tp["vocab"])))
+    palette, grid, flags = spec_palette_and_grid(
+        ids, cells, display, canvas_info["rows"], canvas_info["cols"],
+        trend_mask=trend_mask,
+        highlight_rgb=hex_to_rgb_tuple(opts["highlight_color_hex"]),
+        highlight_opacity=opts["trend_opacity"] / 100.0,
+        token_heat=token_heat,
+        heat_opacity=opts.get("heatmap_opacity", 60) / 100.0,
+    )
+    size = write_render_spec(path, palette, grid, canvas_info, opts["pixel_size"], flags)
+    return {
+        "ok": True, "path": path, "seed": tp["seed"], "kind": "spec", "bytes": size,
+        "tokens": int(len(ids)), "cells": int(len(cells)), "palette": int(len(palette)),
+    }
+
+
+def run_export_spec(text: Any, opts: Dict[str, Any], path: str, result_queue: Queue) -> None:
+    """Render spec export for other front ends. Puts result in queue."""
+    try:
+        result_queue.put(build_render_spec(text, opts, path))
+    except Exception as e:
+        result_queue.put({"ok": False, "error": str(e)})
+
+
+def export_mapping(text: Any, opts: Dict[str, Any], path: str) -> Dict[str, Any]:
+    """Color the vocab of a text on top of opts["token_color_map"] and write the merged mapping file.
+
+    The result's "color_map" holds the newly built colors, for the GUI to merge into its map.
+    """
+    ids, vocab = core.tokenize_ids(
+        _payload_text(text),
+        mode=opts["tokenize_mode"],
+        custom_sep=opts["custom_separator"],
+        ngram_n=opts.get("ngram_n", core.DEFAULT_NGRAM_N),
+    )
+    if not len(ids):
+        return {"ok": False, "error": "No tokens to export."}
+    # Token IDs match the image export, so a fixed seed gives the same random colors in both;
+    # n-gram strings are only built here, once per vocab entry
+    color_map = dict(opts.get("token_color_map") or {})
+    mode = opts["current_mode"]
+    mapping_path = opts.get("mapping_path")
+    mapping = MappingFile(mapping_path) if mapping_path else None
+    try:
+        cache_path = opts.get("palette_cache_path")
+        if cache_path and mode == "standard":
+            with PaletteCache(cache_path, opts.get("palette_cache_max_entries", DEFAULT_MAX_ENTRIES)) as cache:
+                palette = core.build_palette(vocab, mode, color_map, mapping=mapping, cache=cache)
+        else:
+            palette = core.build_palette(vocab, mode, color_map, mapping=mapping, seed=opts.get("seed"))
+    finally:
+        if mapping is not None:
+            mapping.close()
+    built = core.palette_to_color_map(vocab, palette)
+    color_map.update(built)
+    write_mapping(path, color_map)
+    return {"ok": True, "path": path, "kind": "mapping", "color_map": built, "tokens": len(vocab)}
+
+
+def run_export_mapping(text: Any, opts: Dict[str, Any], path: str, result_queue: Queue) -> None:
+    """Color mapping export (JSON or binary .tcm/.tcmz). Puts result in queue."""
+    try:
+        result_queue.put(export_mapping(text, opts, path))
+    except Exception as e:
+        result_queue.put({"ok": False, "error": str(e)})
+
+
+def run_export_video(text: str, opts: Dict[str, Any], path: str, result_queue: Queue) -> None:
+    """Video export (RGB 3D density cube, or 2D growth in reading order) to MP4/GIF. Puts result in queue."""
+    try:
+        tp = _token_palette(text, opts)
+        if tp is None:
             result_queue.put({"ok": False, "error": "No tokens to export."})
             return
+        n_frames = opts.get("video_frames", 120)
+        size = opts.get("video_size", 720)
+        if opts.get("video_kind") == "growth":
+            # 2D map filling in reading order: one canvas, each frame paints only its new cells
+            ids, display = tp["ids"], tp["display"]
+            canvas_info = core.calculate_canvas_size(len(ids), opts["pixel_size"], opts["canvas_shape"])
+            cells = core.layout_cells(
+                len(ids), canvas_info, opts["arrangement_pattern"], opts["canvas_shape"],
+                opts["pixel_size"], seed=tp["seed"],
+            )
+            frames = iter_growth_frames(
+                cells, display[ids[: len(cells)]], canvas_info, opts["pixel_size"],
+                size=size, n_frames=n_frames,
+            )
+            n = write_video(frames, path, fps=opts.get("video_fps", 30), queue_size=2)
+        else:
+            frames = iter_cube_frames(
+                tp["ids"], tp["display"],
+                bins=opts.get("video_bins", 64),
+                n_frames=n_frames,
+                size=size,
+            )
+            n = write_video(frames, path, fps=opts.get("video_fps", 30))
+        result_queue.put({"ok": True, "path": path, "seed": tp["seed"], "kind": "video", "frames": n})
+    except Exception as e:
+        result_queue.put({"ok": False, "error": str(e)})
+
+
+def compare_documents(texts: List[str], opts: Dict[str, Any]) -> Dict[str, Any]:
+    """Tokenize N documents into one shared token-ID space and color the shared vocab once.
+
+    Returns ids (one uint32 array per document), vocab, palette, display, seed, freqs
+    ((N, V) token counts per document) and unique ((N, V) bool, token only in that document).
+    """
+    ids_list, vocab = core.encode_text_documents(
+        texts, opts["tokenize_mode"], opts["custom_separator"], opts.get("ngram_n", core.DEFAULT_NGRAM_N),
+    )
+    out = _color_vocab(vocab, opts)
+    out["ids"] = ids_list
+    out["freqs"] = core.document_frequencies(ids_list, len(vocab))
+    out["unique"] = core.unique_token_mask(out["freqs"])
+    return out
 
-        # Build color map for all tokens (batch fill is faster for millions of tokens)
-        color_map: Dict[str, str] = {}
-        core.fill_color_map(tokens, opts["current_mode"], color_map)
-        display_map = core.emphasize_similar_colors(
-            color_map, opts["similarity_threshold"], opts["emphasize_similarity"]
-        )
 
-        scale = opts["export_scale"]
-        canvas_info = core.calculate_canvas_size(len(tokens), opts["pixel_size"], opts["canvas_shape"])
+def run_export_compare(paths: List[str], opts: Dict[str, Any], path: str, result_queue: Queue) -> None:
+    """Compare documents: side-by-side maps (or a diff map fading shared tokens) in one PNG. Puts result in queue.
+
+    All documents share one canvas and one layout (sized for the longest document), so layout
+    and coloring run once. Per-document frequency vectors are saved next to the PNG as .freq.npz.
+    """
+    try:
+        cmp = compare_documents([read_text_file(p) for p in paths], opts)
+        ids_list, display = cmp["ids"], cmp["display"]
+        n_max = max((len(ids) for ids in ids_list), default=0)
+        if n_max == 0:
+            result_queue.put({"ok": False, "error": "No tokens to compare."})
+            return
+
+        canvas_info = core.calculate_canvas_size(n_max, opts["pixel_size"], opts["canvas_shape"])
         w, h = int(canvas_info["width"]), int(canvas_info["height"])
-        out_w, out_h = w * scale, h * scale
-        max_dim = 32768
-        if out_w > max_dim or out_h > max_dim:
-            r = min(max_dim / out_w, max_dim / out_h)
-            out_w, out_h = int(out_w * r), int(out_h * r)
-            scale = out_w / w if w else 1
-
-        positions = core.generate_pixel_positions(
-            tokens, canvas_info, opts["arrangement_pattern"], opts["pixel_size"]
+        # Panels sit side by side, so the combined width is what must fit the size limit
+        scale = effective_scale(w * len(ids_list), h, opts["export_scale"])
+        rows, cols = canvas_info["rows"], canvas_info["cols"]
+        cells = core.layout_cells(
+            n_max, canvas_info, opts["arrangement_pattern"], opts["canvas_shape"],
+            opts["pixel_size"], seed=cmp["seed"],
         )
-        for p in positions:
-            p["valid"] = core.is_valid_position(
-                p, canvas_info, opts["canvas_shape"], opts["pixel_size"]
-            )
+        diff = opts.get("compare_mode") == "diff"
+        panels = []
+        for i, ids in enumerate(ids_list):
+            # Diff map: tokens unique to this document keep their color, shared ones fade out
+            pal = core.fade_palette(display, cmp["unique"][i]) if diff else display
+            n = min(len(ids), len(cells))
+            color_grid, filled = core.build_color_grid(cells[:n], pal[ids[:n]], rows, cols)
+            panels.append(draw_grid(color_grid, filled, canvas_info, opts["pixel_size"], scale=scale))
+        compose_side_by_side(panels, gap=max(1, int(round(opts["pixel_size"] * scale)))).save(path)
 
-        # Skip trend detection for huge grids so export can finish in reasonable time
-        trend_cells = set()
-        cells = canvas_info["cols"] * canvas_info["rows"]
-        if opts["highlight_trends"] and cells <= EXPORT_TREND_MAX_CELLS:
-            pos_map = core.build_position_color_map(positions, display_map, color_map)
-            for trend in core.detect_all_trends(
-                canvas_info["cols"], canvas_info["rows"],
-                pos_map, opts["trend_min_length"], opts["trend_similarity"],
-                horizontal=opts["trend_horizontal"],
-                vertical=opts["trend_vertical"],
-                diagonal=opts["trend_diagonal"],
-            ):
-                for c in trend:
-                    trend_cells.add(c)
-
-        img = draw_canvas(
-            positions, canvas_info, display_map, color_map, opts["pixel_size"],
-            highlight_trends=opts["highlight_trends"],
-            trend_cells=list(trend_cells) if trend_cells else None,
-            highlight_color=opts["highlight_color_hex"],
-            highlight_opacity=opts["trend_opacity"] / 100.0,
-            scale=scale,
+        np.savez_compressed(
+            os.path.splitext(path)[0] + ".freq.npz",
+            freqs=cmp["freqs"], vocab=np.array(list(cmp["vocab"]), dtype=str),
         )
-        img.save(path)
-        result_queue.put({"ok": True, "path": path})
+        result_queue.put({
+            "ok": True, "path": path, "seed": cmp["seed"], "kind": "compare",
+            "tokens": [int(len(ids)) for ids in ids_list],
+            "unique_tokens": cmp["unique"].sum(axis=1).tolist(),
+        })
     except Exception as e:
         result_queue.put({"ok": False, "error": str(e)})
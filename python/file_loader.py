@@ -0,0 +1,141 @@
+# file_loader.py - Background file reading/decoding and a sparse line index for large files (no GUI)
+"""The GUI never reads files on the Tk thread:
+
+- BackgroundReader decodes a file on a daemon thread into a bounded queue of text chunks,
+  which the Tk loop drains within a time budget (small and medium files, editable).
+- LineIndex records every LINE_INDEX_STEP-th line start of a file on a daemon thread and
+  reads any window of lines through mmap (large files, shown read-only in a virtual view;
+  exports read the file themselves).
+"""
+import codecs
+import mmap
+import os
+import threading
+from queue import Full, Queue
+from typing import List, Optional
+
+# Files above this size open in the read-only virtual view instead of being loaded into the widget
+LARGE_FILE_BYTES = 32 * 1024 * 1024
+READ_CHUNK_BYTES = 256 * 1024
+LINE_INDEX_STEP = 64
+_SCAN_BYTES = 8 * 1024 * 1024
+
+
+def file_size(path: str) -> int:
+    return os.path.getsize(path)
+
+
+class BackgroundReader:
+    """Read and decode (UTF-8, invalid bytes replaced) on a daemon thread; queue items are str, None at end."""
+
+    def __init__(self, path: str, chunk_bytes: int = READ_CHUNK_BYTES, max_chunks: int = 16):
+        self.path = path
+        self.total = file_size(path)
+        self.bytes_read = 0
+        self.error: Optional[Exception] = None
+        self.queue: "Queue[Optional[str]]" = Queue(maxsize=max_chunks)
+        self._chunk_bytes = chunk_bytes
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _put(self, item: Optional[str]) -> bool:
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _run(self) -> None:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        try:
+            with open(self.path, "rb") as f:
+                while not self._stop.is_set():
+                    data = f.read(self._chunk_bytes)
+                    self.bytes_read += len(data)
+                    text = decoder.decode(data, final=not data)
+                    if text and not self._put(text):
+                        return
+                    if not data:
+                        break
+        except Exception as e:  # reported by the consumer after the end marker
+            self.error = e
+        self._put(None)
+
+    def cancel(self) -> None:
+        self._stop.set()
+
+
+class LineIndex:
+    """Sparse line-start index over a memory-mapped file, built on a daemon thread.
+
+    Only every LINE_INDEX_STEP-th line start is stored; a line is found from the nearest
+    stored start with at most LINE_INDEX_STEP - 1 newline searches, so the index for a
+    1 GB file stays small.
+    """
+
+    def __init__(self, path: str, step: int = LINE_INDEX_STEP):
+        self.path = path
+        self.step = step
+        self._f = open(path, "rb")
+        self.size = file_size(path)
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._starts: List[int] = [0]
+        self.line_count = 1 if self.size else 0  # lines found so far
+        self.done = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._scan, daemon=True)
+        self._thread.start()
+
+    def _scan(self) -> None:
+        mm, step = self._mm, self.step
+        try:
+            if mm is None:
+                return
+            pos, count = 0, 1
+            while pos < self.size and not self._stop.is_set():
+                end = min(self.size, pos + _SCAN_BYTES)
+                i = mm.find(b"\n", pos, end)
+                while i != -1:
+                    if i + 1 < self.size:
+                        if count % step == 0:
+                            self._starts.append(i + 1)
+                        count += 1
+                    i = mm.find(b"\n", i + 1, end)
+                pos = end
+                self.line_count = count
+        finally:
+            self.done.set()
+
+    def _line_start(self, line: int) -> int:
+        k = min(line // self.step, len(self._starts) - 1)
+        pos = self._starts[k]
+        for _ in range(line - k * self.step):
+            i = self._mm.find(b"\n", pos)
+            if i == -1:
+                return self.size
+            pos = i + 1
+        return pos
+
+    def lines(self, start: int, count: int) -> str:
+        """Decoded text of lines [start, start + count) (clipped to the lines indexed so far)."""
+        if self._mm is None or count <= 0:
+            return ""
+        start = max(0, min(start, self.line_count - 1))
+        a = self._line_start(start)
+        b = self._line_start(min(self.line_count, start + count))
+        return self._mm[a:b].decode("utf-8", errors="replace")
+
+    def read_text(self) -> str:
+        with open(self.path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._f.close()
@@ -0,0 +1,109 @@
+# grid_index.py - Cell <-> token spatial index for a laid-out map (no GUI)
+"""Point and token queries on a layout without scanning position lists.
+
+Forward: a dense (rows, cols) int32 grid holding the token index (position in the token
+stream) of each cell, -1 for empty cells. Inverse: CSR over token IDs, so the cells of
+token ID t are cells[offsets[t]:offsets[t + 1]] in reading order of the token stream.
+A 10M-cell map costs 40 MB for the grid plus 8 bytes per placed token for the inverse.
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class GridIndex:
+    """Spatial index over layout_cells output (flat cell indices in token order)."""
+
+    def __init__(self, cells: np.ndarray, ids: np.ndarray, rows: int, cols: int, n_vocab: Optional[int] = None):
+        self.rows, self.cols = int(rows), int(cols)
+        n = len(cells)
+        self.ids = ids[:n]
+        grid = np.full(self.rows * self.cols, -1, dtype=np.int32)
+        grid[cells] = np.arange(n, dtype=np.int32)
+        self.grid = grid.reshape(self.rows, self.cols)
+        if n_vocab is None:
+            n_vocab = int(self.ids.max()) + 1 if n else 0
+        order = np.argsort(self.ids, kind="stable")
+        self.offsets = np.zeros(n_vocab + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.ids, minlength=n_vocab), out=self.offsets[1:])
+        self.cells = np.asarray(cells, dtype=np.int64)[order]
+        self.source: Optional[np.ndarray] = None  # token index -> pixel_positions index (from_positions)
+        self.vocab: Optional[List[str]] = None
+
+    @classmethod
+    def from_positions(cls, pixel_positions: List[Dict], rows: int, cols: int) -> "GridIndex":
+        """Index for the dict pipeline over its valid positions.
+
+        Token index i is the i-th valid position; source[i] is its index in pixel_positions
+        and vocab holds the token strings behind the token IDs.
+        """
+        keep = [i for i, p in enumerate(pixel_positions) if p.get("valid", True)]
+        r = np.fromiter((pixel_positions[i]["row"] for i in keep), dtype=np.int64, count=len(keep))
+        c = np.fromiter((pixel_positions[i]["col"] for i in keep), dtype=np.int64, count=len(keep))
+        if len(keep):
+            rows = max(int(rows), int(r.max()) + 1)
+            cols = max(int(cols), int(c.max()) + 1)
+        vocab_index: Dict[str, int] = {}
+        ids = np.fromiter(
+            (vocab_index.setdefault(pixel_positions[i]["token"], len(vocab_index)) for i in keep),
+            dtype=np.uint32, count=len(keep),
+        )
+        index = cls(r * cols + c, ids, rows, cols, n_vocab=len(vocab_index))
+        index.source = np.asarray(keep, dtype=np.int64)
+        index.vocab = list(vocab_index)
+        return index
+
+    _ARRAYS = ("grid", "ids", "offsets", "cells")
+
+    def save(self, directory: str) -> None:
+        """Write the index arrays as .npy files (index_grid.npy, ...) into directory."""
+        for name in self._ARRAYS:
+            np.save(os.path.join(directory, f"index_{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "GridIndex":
+        """Open an index written by save; with mmap, queries only page in the cells they touch."""
+        index = cls.__new__(cls)
+        for name in cls._ARRAYS:
+            setattr(index, name, np.load(os.path.join(directory, f"index_{name}.npy"), mmap_mode="r" if mmap else None))
+        index.rows, index.cols = index.grid.shape
+        index.source = None
+        index.vocab = None
+        return index
+
+    def token_index_at(self, row: int, col: int) -> int:
+        """Token index at (row, col), or -1 for an empty or out-of-range cell. O(1)."""
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return int(self.grid[row, col])
+        return -1
+
+    def token_id_at(self, row: int, col: int) -> int:
+        """Token ID at (row, col), or -1. O(1)."""
+        i = self.token_index_at(row, col)
+        return int(self.ids[i]) if i >= 0 else -1
+
+    def token_indices_at(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Vectorized token_index_at for arrays of coordinates (-1 where empty or outside)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        inside = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+        out = np.full(rows.shape, -1, dtype=np.int32)
+        out[inside] = self.grid[rows[inside], cols[inside]]
+        return out
+
+    def count(self, token_id: int) -> int:
+        if not 0 <= token_id < len(self.offsets) - 1:
+            return 0
+        return int(self.offsets[token_id + 1] - self.offsets[token_id])
+
+    def cells_of(self, token_id: int) -> np.ndarray:
+        """Flat cell indices of every occurrence of token_id, in token order. O(k)."""
+        if not 0 <= token_id < len(self.offsets) - 1:
+            return self.cells[:0]
+        return self.cells[self.offsets[token_id] : self.offsets[token_id + 1]]
+
+    def positions_of(self, token_id: int) -> List[Tuple[int, int]]:
+        """(row, col) of every occurrence of token_id. O(k)."""
+        r, c = np.divmod(self.cells_of(token_id), self.cols)
+        return list(zip(r.tolist(), c.tolist()))
@@ -0,0 +1,201 @@
+# image_formats.py - Output formats for image exports: PNG (parallel, indexed), PPM, raw RGB, lossless WebP
+"""The format is chosen by the output file extension:
+
+    format  extension     encode speed          size                     notes
+    png     .png          moderate; scales       small                    compress level 0-9; deflate on
+                          with encode workers                             encode_workers threads; streams bands
+    png     .png          faster than RGB PNG    ~half of RGB PNG         8-bit indexed, used when the export
+    (indexed)                                                             has <= 256 colors (png_palette)
+    ppm     .ppm          fastest (disk bound)   3 bytes/px               binary P6; header + raw rows, so it
+                                                                          can be memory-mapped; streams bands
+    raw     .raw, .rgb    fastest (disk bound)   3 bytes/px               headerless RGB rows + <path>.json
+                                                                          sidecar (width, height, dtype)
+    webp    .webp         slowest, one thread    smallest (few colors)    lossless; whole image in memory,
+                                                                          at most 16,383 px per side
+
+Other extensions Pillow can write (.jpg, .bmp, .tif, ...) are saved by Pillow from the whole
+image ("pil"); a path without a known extension gets PNG.
+
+Options: png_compress_level (0-9, default 6), encode_workers (0 = one per CPU, up to
+MAX_ENCODE_WORKERS), png_palette (default True), webp_method (0-6, default 4).
+"""
+import json
+import multiprocessing
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+import perf_profile
+from png_stream import PngStreamWriter, pack_rgb
+
+# Optional: Pillow built with libwebp
+try:
+    from PIL import features
+    HAS_WEBP = bool(features.check("webp"))
+except Exception:
+    HAS_WEBP = False
+
+FORMATS = ("png", "ppm", "raw", "webp", "pil")
+# Formats written band by band (the others need the whole image in memory)
+STREAMING_FORMATS = ("png", "ppm", "raw")
+_EXTENSIONS = {".png": "png", ".ppm": "ppm", ".raw": "raw", ".rgb": "raw", ".webp": "webp"}
+IMAGE_FILETYPES: List[Tuple[str, str]] = [
+    ("PNG", "*.png"), ("WebP (lossless)", "*.webp"), ("PPM (uncompressed)", "*.ppm"),
+    ("Raw RGB (uncompressed)", "*.raw"), ("All", "*.*"),
+]
+DEFAULT_PNG_LEVEL = 6
+MAX_ENCODE_WORKERS = 8
+MAX_PALETTE_COLORS = 256
+WEBP_MAX_DIM = 16383
+_EXPAND_BYTES = 8 << 20
+
+
+def output_format(path: str) -> str:
+    """Format name for an output path (PNG for unknown extensions)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in _EXTENSIONS:
+        return _EXTENSIONS[ext]
+    return "pil" if ext in Image.registered_extensions() else "png"
+
+
+def png_level(opts: Dict[str, Any]) -> int:
+    return min(9, max(0, int(opts.get("png_compress_level", DEFAULT_PNG_LEVEL))))
+
+
+def encode_workers(opts: Dict[str, Any]) -> int:
+    """Deflate threads for PNG: opts["encode_workers"], else the profile's, or one per CPU (0 / unset)."""
+    n = int(opts.get("encode_workers") or 0) or perf_profile.get("encode_workers")
+    if n <= 0:
+        n = min(MAX_ENCODE_WORKERS, multiprocessing.cpu_count() or 1)
+    return max(1, n)
+
+
+def indexed_palette(*color_sets: np.ndarray, max_colors: int = MAX_PALETTE_COLORS) -> Optional[np.ndarray]:
+    """Unique colors of the given (n, 3) uint8 sets plus white, or None if there are more than max_colors."""
+    keys = [np.asarray([0xFFFFFF], dtype=np.uint32)]
+    for colors in color_sets:
+        if len(colors):
+            keys.append(np.unique(pack_rgb(np.asarray(colors, dtype=np.uint8).reshape(-1, 3))))
+            if len(keys[-1]) > max_colors:
+                return None
+    keys = np.unique(np.concatenate(keys))
+    if len(keys) > max_colors:
+        return None
+    return np.stack([(keys >> 16) & 0xFF, (keys >> 8) & 0xFF, keys & 0xFF], axis=1).astype(np.uint8)
+
+
+class _ExpandIndices:
+    """Band writer adapter: (k, width) palette-index bands are written as RGB (palette[band])."""
+
+    def __init__(self, writer: Any, palette: np.ndarray):
+        self.writer = writer
+        self.palette = np.asarray(palette, dtype=np.uint8)
+
+    def write(self, band: np.ndarray) -> None:
+        self.writer.write(self.palette[band] if band.ndim == 2 else band)
+
+    def close(self) -> None:
+        self.writer.close()
+
+    def __enter__(self) -> "_ExpandIndices":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.writer.__exit__(exc_type, exc, tb)
+
+
+class RawStreamWriter:
+    """Uncompressed RGB rows written band by band: binary PPM (P6) or headerless raw with a JSON sidecar."""
+
+    def __init__(self, path: str, width: int, height: int, ppm: bool = True):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.ppm = ppm
+        self.rows_written = 0
+        self._f = open(path, "wb")
+        if ppm:
+            self._f.write(f"P6\n{width} {height}\n255\n".encode("ascii"))
+
+    def write(self, band: np.ndarray) -> None:
+        """Append rows (k, width, 3) uint8."""
+        band = np.ascontiguousarray(band, dtype=np.uint8)
+        if band.shape[1:] != (self.width, 3):
+            raise ValueError(f"band shape {band.shape} does not match width {self.width}")
+        if self.rows_written + band.shape[0] > self.height:
+            raise ValueError("more rows than the image height")
+        band.tofile(self._f)
+        self.rows_written += band.shape[0]
+
+    def close(self) -> None:
+        if self._f.closed:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"wrote {self.rows_written} of {self.height} rows")
+        finally:
+            self._f.close()
+        if not self.ppm:
+            with open(self.path + ".json", "w", encoding="utf-8") as f:
+                json.dump({"width": self.width, "height": self.height, "channels": 3, "dtype": "uint8",
+                           "layout": "row-major RGB"}, f, indent=2)
+
+    def __enter__(self) -> "RawStreamWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
+
+
+def open_image_writer(
+    path: str, fmt: str, width: int, height: int, opts: Dict[str, Any], palette: Optional[np.ndarray] = None,
+):
+    """Band writer (write(band), close(), context manager) for a streamable format.
+
+    palette: the export's colors. Bands may then be palette indices (from an index canvas);
+    PNG is written indexed when there are at most 256 colors and opts allow it.
+    """
+    indexed = fmt == "png" and palette is not None and len(palette) <= MAX_PALETTE_COLORS and opts.get("png_palette", True)
+    if fmt == "png":
+        writer = PngStreamWriter(path, width, height, png_level(opts), palette=palette if indexed else None,
+                                 workers=encode_workers(opts))
+    elif fmt in ("ppm", "raw"):
+        writer = RawStreamWriter(path, width, height, ppm=fmt == "ppm")
+    else:
+        raise ValueError(f"{fmt.upper()} output cannot be written in bands; export as PNG or PPM instead.")
+    return writer if palette is None or indexed else _ExpandIndices(writer, palette)
+
+
+def save_webp(arr: np.ndarray, path: str, opts: Dict[str, Any]) -> None:
+    """Lossless WebP of a whole (h, w, 3) image."""
+    if not HAS_WEBP:
+        raise RuntimeError("WebP export requires Pillow built with WebP support.")
+    h, w = arr.shape[:2]
+    if w > WEBP_MAX_DIM or h > WEBP_MAX_DIM:
+        raise ValueError(f"WebP images are limited to {WEBP_MAX_DIM:,} px per side (this one is {w:,} x {h:,}).")
+    method = min(6, max(0, int(opts.get("webp_method", 4))))
+    Image.fromarray(arr, mode="RGB").save(path, "WEBP", lossless=True, method=method)
+
+
+def write_image(
+    arr: np.ndarray, path: str, fmt: str, opts: Dict[str, Any], palette: Optional[np.ndarray] = None,
+) -> None:
+    """Encode a whole (h, w, 3) uint8 image, or an (h, w) index canvas of palette, in the given format."""
+    if fmt in ("webp", "pil"):
+        if arr.ndim == 2:
+            arr = np.asarray(palette, dtype=np.uint8)[arr]
+        if fmt == "webp":
+            save_webp(arr, path, opts)
+        else:
+            Image.fromarray(arr, mode="RGB").save(path)
+        return
+    # Index canvases go in row chunks, so expanding to RGB (if needed) never copies the whole image
+    step = arr.shape[0] if arr.ndim == 3 else max(1, _EXPAND_BYTES // (3 * arr.shape[1]))
+    with open_image_writer(path, fmt, arr.shape[1], arr.shape[0], opts, palette) as out:
+        for y in range(0, arr.shape[0], step):
+            out.write(arr[y : y + step])
@@ -0,0 +1,241 @@
+# job_queue.py - Export job queue: bounded concurrency, memory-aware admission, coalescing (no GUI)
+"""Export jobs run in worker processes (see export_worker). The queue:
+
+- runs at most max_concurrent processes, and only admits a job while the estimated memory
+  of running jobs plus the new one fits the budget (a job that alone exceeds the budget
+  still runs, but only when nothing else is running);
+- coalesces a job whose text and options equal a queued or running one: it is not run
+  again and its output and sidecars (.stats.json, .trends.json) are copied from the first job's files;
+- batches queued image jobs that share text and tokenize/color options into one process
+  (export_worker.run_export_batch), so tokenizing, coloring and layout are done once.
+
+poll() is called from the GUI loop; it collects results and starts admitted jobs.
+"""
+import hashlib
+import json
+import os
+import shutil
+from multiprocessing import Process, Queue
+from queue import Empty
+from typing import Any, Callable, Dict, List, Optional
+
+from export_plan import estimate_tokens, estimate_vocab, memory_budget, plan_export
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+DEFAULT_MAX_CONCURRENT = 2
+# Options that decide tokenizing and coloring; jobs equal in these share one batch process
+STAGE_OPTION_KEYS = (
+    "tokenize_mode", "custom_separator", "ngram_n", "current_mode", "seed",
+    "similarity_threshold", "emphasize_similarity", "mapping_path", "palette_cache_path",
+    "palette_cache_max_entries",
+)
+# Result keys of files written next to the output (<base>.stats.json, <base>.trends.json)
+SIDECAR_KEYS = ("stats_path", "trends_path")
+
+
+def payload_key(payload: Any) -> str:
+    """Identity of a job's input: hash of the text, or path + size + mtime for {"path": ...}."""
+    if isinstance(payload, dict):
+        st = os.stat(payload["path"])
+        raw = f"file:{os.path.abspath(payload['path'])}:{st.st_size}:{st.st_mtime_ns}".encode("utf-8")
+    elif isinstance(payload, (list, tuple)):
+        raw = json.dumps([payload_key({"path": p}) for p in payload]).encode("utf-8")
+    else:
+        raw = payload.encode("utf-8", errors="replace")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def payload_length(payload: Any) -> int:
+    if isinstance(payload, dict):
+        return os.path.getsize(payload["path"])
+    if isinstance(payload, (list, tuple)):
+        return sum(os.path.getsize(p) for p in payload)
+    return len(payload)
+
+
+def copy_outputs(result: Dict[str, Any], src: str, dest: str) -> Dict[str, Any]:
+    """Copy a finished job's output file and its sidecars to dest; returns the result for dest."""
+    shutil.copyfile(src, dest)
+    out = dict(result, path=dest)
+    src_base, dest_base = os.path.splitext(src)[0], os.path.splitext(dest)[0]
+    for key in SIDECAR_KEYS:
+        side = result.get(key)
+        if side and side.startswith(src_base) and os.path.isfile(side):
+            out[key] = dest_base + side[len(src_base):]
+            shutil.copyfile(side, out[key])
+    return out
+
+
+def estimate_job_bytes(payload_len: int, opts: Dict[str, Any]) -> int:
+    """Peak memory of a job from its export plan (token strings, grid, canvas or render bands)."""
+    mode = opts.get("tokenize_mode", "words")
+    n = estimate_tokens(payload_len, mode)
+    return plan_export(n, estimate_vocab(n, mode), opts, n_chars=payload_len)["peak_bytes"]
+
+
+class Job:
+    """One queued export; status moves queued -> running -> done / failed (or cancelled)."""
+
+    def __init__(self, job_id: int, kind: str, target: Callable, payload: Any, opts: Dict[str, Any],
+                 path: str, label: str, est_bytes: int, key: Optional[str], stage_key: Optional[str]):
+        self.id = job_id
+        self.kind = kind
+        self.target = target
+        self.payload = payload
+        self.opts = opts
+        self.path = path
+        self.label = label
+        self.est_bytes = est_bytes
+        self.key = key
+        self.stage_key = stage_key
+        self.status = QUEUED
+        self.message = ""
+        self.result: Optional[Dict[str, Any]] = None
+        self.followers: List["Job"] = []  # coalesced duplicates; get a copy of this job's output
+        self.shared_with = 0  # number of jobs in the same batch process
+
+
+class _Run:
+    def __init__(self, process: Process, queue: Queue, jobs: List[Job]):
+        self.process = process
+        self.queue = queue
+        self.jobs = jobs
+
+
+class ExportJobQueue:
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT, batch_target: Optional[Callable] = None,
+                 budget: Optional[int] = None):
+        """budget: RAM in bytes for all running jobs together (None: export_plan.memory_budget())."""
+        self.max_concurrent = max(1, max_concurrent)
+        self.batch_target = batch_target
+        self.budget = budget
+        self.jobs: List[Job] = []
+        self._runs: List[_Run] = []
+        self._next_id = 1
+
+    def submit(self, kind: str, target: Callable, payload: Any, opts: Dict[str, Any], path: str,
+               label: str = "", coalesce: bool = True, batchable: bool = False) -> Job:
+        """Queue an export. With coalesce, a job equal to a pending one only copies its output."""
+        pkey = payload_key(payload)
+        key = None
+        if coalesce:
+            opts_key = json.dumps({k: v for k, v in opts.items()}, sort_keys=True, default=str)
+            key = f"{kind}:{target.__name__}:{pkey}:{opts_key}"
+        stage_key = None
+        if batchable:
+            stage = {k: opts.get(k) for k in STAGE_OPTION_KEYS}
+            stage_key = f"{pkey}:{json.dumps(stage, sort_keys=True, default=str)}"
+        job = Job(self._next_id, kind, target, payload, opts, path, label or os.path.basename(path),
+                  estimate_job_bytes(payload_length(payload), opts), key, stage_key)
+        self._next_id += 1
+        self.jobs.append(job)
+        if key is not None:
+            for other in self.jobs[:-1]:
+                if other.key == key and other.status in (QUEUED, RUNNING):
+                    other.followers.append(job)
+                    job.status = other.status
+                    job.message = f"same as job {other.id}"
+                    job.payload = None
+                    return job
+        return job
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued job (running jobs are not interrupted)."""
+        for job in self.jobs:
+            if job.id == job_id and job.status == QUEUED:
+                self._finish(job, CANCELLED, None, "cancelled")
+                return True
+        return False
+
+    def active(self) -> bool:
+        return any(j.status in (QUEUED, RUNNING) for j in self.jobs)
+
+    def _running_bytes(self) -> int:
+        return sum(max(j.est_bytes for j in run.jobs) for run in self._runs)
+
+    def _leaders(self) -> List[Job]:
+        # Queued jobs that actually need a process (coalesced followers ride on their leader)
+        followers = {id(f) for j in self.jobs for f in j.followers}
+        return [j for j in self.jobs if j.status == QUEUED and id(j) not in followers]
+
+    def _start_ready(self) -> None:
+        budget = self.budget if self.budget is not None else memory_budget()
+        for job in self._leaders():
+            if len(self._runs) >= self.max_concurrent:
+                return
+            if job.status != QUEUED:
+                continue  # started in this pass as part of a batch
+            group = [job]
+            if job.stage_key is not None and self.batch_target is not None:
+                group += [j for j in self._leaders() if j is not job and j.stage_key == job.stage_key]
+            need = max(j.est_bytes for j in group)
+            if self._runs and self._running_bytes() + need > budget:
+                return  # wait for memory; keep queue order
+            self._launch(group)
+
+    def _launch(self, group: List[Job]) -> None:
+        q = Queue()
+        if len(group) == 1:
+            job = group[0]
+            args = (job.payload, job.opts, job.path, q)
+            target = job.target
+        else:
+            target = self.batch_target
+            args = (group[0].payload, [(j.opts, j.path) for j in group], q)
+        p = Process(target=target, args=args, daemon=True)
+        p.start()
+        for j in group:
+            j.shared_with = len(group)
+            for f in [j] + j.followers:
+                f.status = RUNNING
+                if f is j:
+                    f.message = f"batch of {len(group)}" if len(group) > 1 else ""
+        self._runs.append(_Run(p, q, group))
+
+    def _finish(self, job: Job, status: str, result: Optional[Dict[str, Any]], message: str = "") -> List[Job]:
+        job.status, job.result, job.message = status, result, message
+        job.payload = None
+        finished = [job]
+        for f in job.followers:
+            f_result = result
+            if status == DONE and result is not None and f.path != job.path and os.path.isfile(job.path):
+                try:
+                    f_result = copy_outputs(result, job.path, f.path)
+                except OSError as e:
+                    finished += self._finish(f, FAILED, {"ok": False, "error": str(e)}, str(e))
+                    continue
+            finished += self._finish(f, status, f_result, message)
+        job.followers = []
+        return finished
+
+    def poll(self) -> List[Job]:
+        """Collect finished jobs (including coalesced followers) and start admitted ones."""
+        finished: List[Job] = []
+        for run in list(self._runs):
+            while True:
+                try:
+                    result = run.queue.get_nowait()
+                except Empty:
+                    break
+                job = run.jobs[result.pop("index", 0)]
+                if result.get("ok"):
+                    finished += self._finish(job, DONE, result)
+                else:
+                    finished += self._finish(job, FAILED, result, result.get("error", "Unknown error"))
+            pending = [j for j in run.jobs if j.status == RUNNING]
+            if not pending:
+                run.process.join(timeout=3.0)
+                self._runs.remove(run)
+            elif not run.process.is_alive():
+                for j in pending:
+                    err = "Export process ended without a result."
+                    finished += self._finish(j, FAILED, {"ok": False, "error": err}, err)
+                self._runs.remove(run)
+        self._start_ready()
+        return finished
+
+    def shutdown(self) -> None:
+        for run in self._runs:
+            if run.process.is_alive():
+                run.process.terminate()
+        self._runs = []
@@ -6,17 +6,48 @@ Run: python main.py
 import json
 import os
 import random
+import shutil
+import tempfile
+import time
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, colorchooser
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any
 from multiprocessing import Process, Queue
 from queue import Empty
+import numpy as np
 from PIL import Image
 import core
 from render_2d import draw_canvas
 from export_worker import run_export_image as run_export_image_worker
+from export_worker import run_export_video as run_export_video_worker
+from export_worker import run_export_compare as run_export_compare_worker
+from export_worker import run_build_view as run_build_view_worker
+from export_worker import run_export_batch as run_export_batch_worker
+from export_worker import run_export_mapping as run_export_mapping_worker
+from file_loader import LARGE_FILE_BYTES, BackgroundReader, LineIndex, file_size
+from export_plan import LONG_EXPORT_S, estimate_tokens, estimate_vocab, format_plan, memory_budget, plan_export
+from grid_index import GridIndex
+from image_formats import DEFAULT_PNG_LEVEL, IMAGE_FILETYPES, output_format
+from job_queue import CANCELLED, DONE, FAILED, ExportJobQueue, Job
+from mapping_io import MappingFile, is_binary_mapping_path, read_mapping_json
+from palette_cache import DEFAULT_MAX_ENTRIES
+import perf_profile
+from perf_profile import SETTINGS_FILE
+from tile_pyramid import TilePyramid
+from tile_viewer import TileViewer
+from virtual_text import VirtualTextView
 
-SETTINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "token_color_mapper_settings.json")
+PALETTE_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "token_color_palette_cache.sqlite")
+# Tk time per event-loop turn for inserting loaded/pasted text, and the size of one insert
+LOAD_FRAME_BUDGET_S = 0.012
+INSERT_PIECE_CHARS = 16_000
+GATHER_PIECE_CHARS = 100_000
+MAPPING_FILETYPES = [
+    ("Binary mapping", "*.tcm"),
+    ("Compressed binary mapping", "*.tcmz"),
+    ("JSON", "*.json"),
+    ("All", "*.*"),
+]
 
 
 class TokenColorMapperApp:
@@ -27,6 +58,7 @@ class TokenColorMapperApp:
         self.root.geometry("1200x800")
 
         self.token_color_map: Dict[str, str] = {}
+        self.mapping_path: Optional[str] = None  # imported binary mapping (read via mmap at export)
         self.pixel_positions: List[Dict] = []
         self.current_mode = "standard"
         self.pixel_size = 10
@@ -45,6 +77,7 @@ class TokenColorMapperApp:
         self.trend_opacity = 50
         self.highlight_color_hex = "#ffff00"
         self.export_scale = 4
+        self.palette_cache_max_entries = DEFAULT_MAX_ENTRIES
 
         self._build_ui()
         self._load_settings()
@@ -57,8 +90,15 @@ class TokenColorMapperApp:
 
         # Text input
         ttk.Label(main, text="Enter text:").pack(anchor=tk.W)
-        self.text_input = tk.Text(main, height=6, wrap=tk.WORD)
-        self.text_input.pack(fill=tk.X, pady=(0, 8))
+        text_frame = ttk.Frame(main)
+        text_frame.pack(fill=tk.X)
+        self.text_input = tk.Text(text_frame, height=6, wrap=tk.WORD)
+        self.text_scroll = ttk.Scrollbar(text_frame, orient=tk.VERTICAL, command=self.text_input.yview)
+        self.text_input.configure(yscrollcommand=self.text_scroll.set)
+        self.text_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text_input.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.load_status_var = tk.StringVar(value="")
+        ttk.Label(main, textvariable=self.load_status_var).pack(anchor=tk.W, pady=(0, 8))
         self.text_input.bind("<KeyRelease>", self._schedule_render)
         self.text_input.bind("<<Paste>>", self._on_paste)
 
@@ -70,11 +110,14 @@ class TokenColorMapperApp:
         ttk.Combobox(
             row1,
             textvariable=self.tokenize_var,
-            values=["words", "chars", "lines", "custom"],
+            values=["words", "chars", "lines", "custom"] + list(core.NGRAM_MODES),
             state="readonly",
             width=12,
         ).pack(side=tk.LEFT, padx=(0, 8))
         self.tokenize_var.trace_add("write", lambda *a: self._render())
+        ttk.Label(row1, text="N-gram n:").pack(side=tk.LEFT, padx=(0, 4))
+        self.ngram_n_var = tk.IntVar(value=core.DEFAULT_NGRAM_N)
+        ttk.Spinbox(row1, from_=1, to=16, textvariable=self.ngram_n_var, width=3, command=self._render).pack(side=tk.LEFT, padx=(0, 8))
         ttk.Label(row1, text="Custom sep:").pack(side=tk.LEFT, padx=(0, 4))
         self.custom_sep_var = tk.StringVar(value=",")
         self.custom_sep_entry = ttk.Entry(row1, textvariable=self.custom_sep_var, width=8)
@@ -87,7 +130,11 @@ class TokenColorMapperApp:
         ttk.Label(row2, text="Color mode:").pack(side=tk.LEFT, padx=(0, 8))
         self.mode_var = tk.StringVar(value="standard")
         ttk.Radiobutton(row2, text="Standard (deterministic)", variable=self.mode_var, value="standard", command=self._render).pack(side=tk.LEFT, padx=(0, 12))
-        ttk.Radiobutton(row2, text="Random", variable=self.mode_var, value="random", command=self._render).pack(side=tk.LEFT)
+        ttk.Radiobutton(row2, text="Random", variable=self.mode_var, value="random", command=self._render).pack(side=tk.LEFT, padx=(0, 12))
+        ttk.Label(row2, text="Seed:").pack(side=tk.LEFT, padx=(0, 4))
+        self.seed_var = tk.StringVar(value="")
+        ttk.Entry(row2, textvariable=self.seed_var, width=20).pack(side=tk.LEFT, padx=(0, 4))
+        ttk.Label(row2, text="(blank = new each export)").pack(side=tk.LEFT)
 
         # Pixel size
         row3 = ttk.Frame(main)
@@ -109,7 +156,7 @@ class TokenColorMapperApp:
         ttk.Combobox(
             row4,
             textvariable=self.pattern_var,
-            values=["row-major", "column-major", "spiral-in", "spiral-out", "zigzag", "zigzag-col", "diagonal", "random"],
+            values=["row-major", "column-major", "spiral-in", "spiral-out", "zigzag", "zigzag-col", "diagonal", "hilbert", "morton", "random"],
             state="readonly",
             width=14,
         ).pack(side=tk.LEFT)
@@ -152,6 +199,17 @@ class TokenColorMapperApp:
         self.highlight_color_var.trace_add("write", lambda *a: self._render())
         ttk.Button(row6, text="…", width=2, command=self._pick_highlight_color).pack(side=tk.LEFT)
 
+        # Token frequency statistics / heatmap (export)
+        row7 = ttk.Frame(main)
+        row7.pack(fill=tk.X, pady=4)
+        self.heatmap_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row7, text="Frequency heatmap", variable=self.heatmap_var).pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Label(row7, text="Heat opacity %:").pack(side=tk.LEFT, padx=(0, 4))
+        self.heatmap_opacity_var = tk.IntVar(value=60)
+        ttk.Spinbox(row7, from_=0, to=100, textvariable=self.heatmap_opacity_var, width=3).pack(side=tk.LEFT, padx=(0, 16))
+        self.write_stats_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(row7, text="Save stats JSON with PNG", variable=self.write_stats_var).pack(side=tk.LEFT)
+
         # Export scale (match desktop: up to 256 + custom 1-512)
         row8 = ttk.Frame(main)
         row8.pack(fill=tk.X, pady=4)
@@ -168,19 +226,85 @@ class TokenColorMapperApp:
         ttk.Label(row8, text="Custom (1–512):").pack(side=tk.LEFT, padx=(0, 4))
         self.export_scale_custom_var = tk.StringVar(value="64")
         self.export_scale_custom_entry = ttk.Entry(row8, textvariable=self.export_scale_custom_var, width=5)
-        self.export_scale_custom_entry.pack(side=tk.LEFT)
+        self.export_scale_custom_entry.pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Label(row8, text="Also at scales:").pack(side=tk.LEFT, padx=(0, 4))
+        self.extra_scales_var = tk.StringVar(value="")
+        ttk.Entry(row8, textvariable=self.extra_scales_var, width=10).pack(side=tk.LEFT, padx=(0, 16))
+        # PNG deflate level: 0-1 fast and larger, 9 slow and smallest (format follows the file extension)
+        ttk.Label(row8, text="PNG level:").pack(side=tk.LEFT, padx=(0, 4))
+        self.png_level_var = tk.IntVar(value=DEFAULT_PNG_LEVEL)
+        ttk.Spinbox(row8, from_=0, to=9, textvariable=self.png_level_var, width=2).pack(side=tk.LEFT)
         self._on_export_scale_change()
 
-        # Video export (RGB 3D)
+        # Video export (RGB 3D cube or 2D growth)
+        row9 = ttk.Frame(main)
+        row9.pack(fill=tk.X, pady=4)
+        ttk.Label(row9, text="Video:").pack(side=tk.LEFT, padx=(0, 4))
+        self.video_kind_var = tk.StringVar(value="rgb-cube")
+        ttk.Combobox(row9, textvariable=self.video_kind_var, values=["rgb-cube", "growth"], state="readonly", width=9).pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Label(row9, text="Frames:").pack(side=tk.LEFT, padx=(0, 4))
+        self.video_frames_var = tk.IntVar(value=120)
+        ttk.Spinbox(row9, from_=10, to=3600, textvariable=self.video_frames_var, width=5).pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Label(row9, text="FPS:").pack(side=tk.LEFT, padx=(0, 4))
+        self.video_fps_var = tk.IntVar(value=30)
+        ttk.Spinbox(row9, from_=1, to=60, textvariable=self.video_fps_var, width=3).pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Label(row9, text="Size:").pack(side=tk.LEFT, padx=(0, 4))
+        self.video_size_var = tk.StringVar(value="720")
+        ttk.Combobox(row9, textvariable=self.video_size_var, values=["480", "720", "1080", "1440", "2160"], state="readonly", width=5).pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Label(row9, text="Cube bins:").pack(side=tk.LEFT, padx=(0, 4))
+        self.video_bins_var = tk.StringVar(value="64")
+        ttk.Combobox(row9, textvariable=self.video_bins_var, values=["256", "128", "64", "32", "16"], state="readonly", width=4).pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Button(row9, text="Export video...", command=self._export_video).pack(side=tk.LEFT)
+
+        # Multi-document comparison (shared vocab and palette)
+        row10 = ttk.Frame(main)
+        row10.pack(fill=tk.X, pady=4)
+        ttk.Label(row10, text="Compare:").pack(side=tk.LEFT, padx=(0, 4))
+        self.compare_mode_var = tk.StringVar(value="side-by-side")
+        ttk.Combobox(row10, textvariable=self.compare_mode_var, values=["side-by-side", "diff"], state="readonly", width=11).pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Button(row10, text="Compare files...", command=self._export_compare).pack(side=tk.LEFT)
+
+        # Export jobs (queued / running / done); equal jobs are coalesced, same-text image jobs batched
+        jobs_frame = ttk.Frame(main)
+        jobs_frame.pack(fill=tk.X, pady=4)
+        self.jobs_tree = ttk.Treeview(jobs_frame, columns=("file", "status", "detail"), show="headings", height=4)
+        for col, title, width in (("file", "Export", 260), ("status", "Status", 80), ("detail", "Detail", 360)):
+            self.jobs_tree.heading(col, text=title)
+            self.jobs_tree.column(col, width=width, anchor=tk.W)
+        self.jobs_tree.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        jobs_buttons = ttk.Frame(jobs_frame)
+        jobs_buttons.pack(side=tk.LEFT, padx=(8, 0), anchor=tk.N)
+        ttk.Button(jobs_buttons, text="Cancel", command=self._cancel_jobs).pack(fill=tk.X)
+        ttk.Button(jobs_buttons, text="Clear finished", command=self._clear_jobs).pack(fill=tk.X, pady=(4, 0))
+        ttk.Label(jobs_buttons, text="RAM budget MB (0 = auto):").pack(anchor=tk.W, pady=(8, 0))
+        self.memory_budget_var = tk.IntVar(value=0)
+        ttk.Spinbox(jobs_buttons, from_=0, to=1_048_576, increment=256, textvariable=self.memory_budget_var, width=8).pack(anchor=tk.W)
+        # Out of core: token IDs and grids on disk (auto = when the export plan does not fit the budget)
+        ttk.Label(jobs_buttons, text="Out of core:").pack(anchor=tk.W, pady=(4, 0))
+        self.out_of_core_var = tk.StringVar(value="auto")
+        ttk.Combobox(jobs_buttons, textvariable=self.out_of_core_var, values=["auto", "on", "off"], state="readonly", width=6).pack(anchor=tk.W)
+        # Performance profile (thresholds, worker caps, backend), saved to the settings file when changed
+        ttk.Label(jobs_buttons, text="Performance:").pack(anchor=tk.W, pady=(4, 0))
+        self.profile_var = tk.StringVar(value=perf_profile.active_name())
+        self.profile_combo = ttk.Combobox(jobs_buttons, textvariable=self.profile_var, state="readonly", width=11)
+        self.profile_combo.pack(anchor=tk.W)
+        self.profile_combo.bind("<<ComboboxSelected>>", self._on_profile_selected)
+        self._update_profile_choices()
+        self.autotune_button = ttk.Button(jobs_buttons, text="Auto-tune", command=self._autotune)
+        self.autotune_button.pack(fill=tk.X, pady=(4, 0))
+        self._autotune_proc: Optional[Process] = None
+        self._autotune_queue: Optional[Queue] = None
+
         # Buttons
         btn_frame = ttk.Frame(main)
         btn_frame.pack(fill=tk.X, pady=8)
         ttk.Button(btn_frame, text="Open file...", command=self._open_file).pack(side=tk.LEFT, padx=(0, 8))
         ttk.Button(btn_frame, text="Save text...", command=self._save_text).pack(side=tk.LEFT, padx=(0, 8))
         ttk.Button(btn_frame, text="Re-randomize colors", command=self._randomize).pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Button(btn_frame, text="View map", command=self._view_map).pack(side=tk.LEFT, padx=(0, 8))
         ttk.Button(btn_frame, text="Export image...", command=self._export_image).pack(side=tk.LEFT, padx=(0, 8))
-        ttk.Button(btn_frame, text="Export mapping (JSON)...", command=self._export_json).pack(side=tk.LEFT, padx=(0, 8))
-        ttk.Button(btn_frame, text="Import mapping (JSON)...", command=self._import_json).pack(side=tk.LEFT)
+        ttk.Button(btn_frame, text="Export mapping...", command=self._export_json).pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Button(btn_frame, text="Import mapping...", command=self._import_json).pack(side=tk.LEFT)
 
         # Canvas area: use Canvas so image is shown at natural size (square stays square)
         self.canvas_frame = ttk.Frame(main)
@@ -188,9 +312,21 @@ class TokenColorMapperApp:
         self.display_canvas = tk.Canvas(self.canvas_frame, highlightthickness=0)
         self.display_canvas.pack(fill=tk.BOTH, expand=True)
         self.caption_label = ttk.Label(self.canvas_frame, text="")
+        self._viewer: Optional[TileViewer] = None
+        self._viewer_dir: Optional[str] = None
+        self._viewer_index: Optional[GridIndex] = None
+        self._viewer_vocab: Optional[MappingFile] = None
+        self._pending_views: Dict[int, str] = {}  # job id -> directory of a viewer build in progress
+        # File loading: background reader feeding the widget, or a read-only view of a large file
+        self.source_path: Optional[str] = None  # large file shown virtually; workers read it directly
+        self._virtual_view: Optional[VirtualTextView] = None
+        self._reader: Optional[BackgroundReader] = None
+        self._feed = None
+        self._feed_after_id = None
+        self._gather_seq = 0  # names the text mark of each export reading the editor
         self._render_after_id = None
-        self._export_process: Optional[Process] = None
-        self._export_queue: Optional[Queue] = None
+        self.jobs = ExportJobQueue(batch_target=run_export_batch_worker)
+        self._job_messages: List[str] = []  # results reported together when the queue goes idle
         self._poll_export_id = None
 
     def _log_backend(self):
@@ -234,6 +370,112 @@ class TokenColorMapperApp:
         except (ValueError, tk.TclError):
             return 4
 
+    def _get_extra_scales(self) -> List[int]:
+        """Additional export scales from the "Also at scales" field (e.g. "8, 16"); invalid entries are skipped."""
+        scales: List[int] = []
+        for part in self.extra_scales_var.get().replace(";", ",").split(","):
+            try:
+                n = min(512, max(1, int(part.strip())))
+            except ValueError:
+                continue
+            if n not in scales:
+                scales.append(n)
+        return scales
+
+    def _get_memory_budget_mb(self) -> int:
+        try:
+            return max(0, int(self.memory_budget_var.get()))
+        except (ValueError, tk.TclError):
+            return 0
+
+    def _get_png_level(self) -> int:
+        try:
+            return max(0, min(9, int(self.png_level_var.get())))
+        except (ValueError, tk.TclError):
+            return DEFAULT_PNG_LEVEL
+
+    def _update_profile_choices(self):
+        name = self.profile_var.get()
+        self.profile_combo["values"] = list(perf_profile.PRESETS) + ([name] if name not in perf_profile.PRESETS else [])
+
+    def _on_profile_selected(self, *a):
+        name = self.profile_var.get()
+        if name not in perf_profile.PRESETS:
+            return
+        perf_profile.use(perf_profile.preset(name), name)
+        self._save_profile()
+        self._update_profile_choices()
+
+    def _save_profile(self):
+        try:
+            perf_profile.save()
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save the performance profile: {e}")
+
+    def _autotune(self):
+        """Benchmark this machine in a separate process; the result becomes the saved profile."""
+        if self._autotune_proc is not None:
+            return
+        if not messagebox.askokcancel(
+            "Auto-tune", "Measure this machine (about half a minute; keep other work light) and save the tuned profile?"
+        ):
+            return
+        self._autotune_queue = Queue()
+        self._autotune_proc = Process(target=perf_profile.run_autotune, args=(self._autotune_queue,))
+        self._autotune_proc.start()
+        self.autotune_button.config(state=tk.DISABLED, text="Tuning...")
+        self.root.after(500, self._poll_autotune)
+
+    def _poll_autotune(self):
+        try:
+            result = self._autotune_queue.get_nowait()
+        except Empty:
+            if self._autotune_proc.is_alive():
+                self.root.after(500, self._poll_autotune)
+                return
+            result = {"ok": False, "error": "Auto-tune process exited without a result."}
+        self._autotune_proc.join()
+        self._autotune_proc = self._autotune_queue = None
+        self.autotune_button.config(state=tk.NORMAL, text="Auto-tune")
+        if not result.get("ok"):
+            messagebox.showerror("Auto-tune failed", result.get("error", "Unknown error"))
+            return
+        p = perf_profile.use(result["profile"], perf_profile.AUTO_TUNED)
+        self.profile_var.set(perf_profile.AUTO_TUNED)
+        self._update_profile_choices()
+        self._save_profile()
+        never = perf_profile.NEVER
+        messagebox.showinfo(
+            "Auto-tune",
+            "Saved the auto-tuned performance profile:\n"
+            + "\n".join(f"{k}: {'never' if v == never else v}" for k, v in p.items()),
+        )
+
+    def _get_out_of_core(self) -> Any:
+        """"auto", True or False for opts["out_of_core"]."""
+        return {"on": True, "off": False}.get(self.out_of_core_var.get(), "auto")
+
+    def _text_length(self) -> int:
+        """Characters (bytes for a large file) of the export input, without reading the text."""
+        if self.source_path is not None:
+            return file_size(self.source_path)
+        try:
+            return int(self.text_input.count("1.0", "end-1c", "chars")[0])
+        except (tk.TclError, TypeError, IndexError):
+            return 0
+
+    def _confirm_plan(self, opts: Dict[str, Any]) -> bool:
+        """Show the estimated export plan before long, banded, reduced-scale or over-budget exports."""
+        n_chars = self._text_length()
+        n = estimate_tokens(n_chars, opts["tokenize_mode"])
+        plan = plan_export(n, estimate_vocab(n, opts["tokenize_mode"]), opts, n_chars=n_chars)
+        if plan["error"]:
+            messagebox.showerror("Export plan", plan["error"])
+            return False
+        if plan["seconds"] < LONG_EXPORT_S and plan["fits"] and plan["render"] == "memory" and not plan["scale_clamped"]:
+            return True
+        return messagebox.askokcancel("Export plan (estimate)", format_plan(plan) + "\n\nStart export?")
+
     def _schedule_render(self, event=None):
         """Debounce render so typing doesn't trigger a full redraw on every key."""
         if self._render_after_id:
@@ -242,6 +484,9 @@ class TokenColorMapperApp:
 
     def _on_paste(self, event=None):
         """Prevent default paste; run chunked paste on next idle so handler returns immediately."""
+        if self._virtual_view is not None:
+            messagebox.showinfo("Read-only", "This large file is shown read-only. Open a smaller file to edit text.")
+            return "break"
         self.root.after(0, self._paste_chunked)
         return "break"
 
@@ -257,14 +502,70 @@ class TokenColorMapperApp:
 
     def _insert_chunked(self, content: str, chunk_chars: int = 50_000) -> None:
         """Insert content into the text widget in chunks so the UI can update."""
-        self.text_input.mark_set("insert", tk.INSERT)
+        self.text_input.mark_set("feed", tk.INSERT)
         self.text_input.see(tk.INSERT)
-        for i in range(0, len(content), chunk_chars):
-            chunk = content[i : i + chunk_chars]
-            self.text_input.insert(tk.INSERT, chunk)
-            self.root.update_idletasks()
+        chunks = (content[i : i + chunk_chars] for i in range(0, len(content), chunk_chars))
+        self._start_feed(lambda: next(chunks, None), "feed")
+
+    def _start_feed(self, next_chunk, mark: str, progress=None) -> None:
+        """Insert text from next_chunk() (str; None at end; raises Empty if not ready yet) at mark.
+
+        Runs on the Tk loop in slices of LOAD_FRAME_BUDGET_S, so input and redraws keep flowing.
+        """
+        self._cancel_feed()
+        self._feed = {"next": next_chunk, "pending": "", "mark": mark, "progress": progress}
+        self._feed_after_id = self.root.after(0, self._drain_feed)
+
+    def _drain_feed(self) -> None:
+        self._feed_after_id = None
+        feed = self._feed
+        if feed is None:
+            return
+        deadline = time.perf_counter() + LOAD_FRAME_BUDGET_S
+        waiting = False
+        while time.perf_counter() < deadline:
+            if not feed["pending"]:
+                try:
+                    chunk = feed["next"]()
+                except Empty:
+                    waiting = True
+                    break
+                if chunk is None:
+                    self._finish_feed()
+                    return
+                feed["pending"] = chunk
+            piece, feed["pending"] = feed["pending"][:INSERT_PIECE_CHARS], feed["pending"][INSERT_PIECE_CHARS:]
+            self.text_input.insert(feed["mark"], piece)
+        if feed["progress"] is not None:
+            self.load_status_var.set(feed["progress"]())
+        self._feed_after_id = self.root.after(15 if waiting else 1, self._drain_feed)
+
+    def _finish_feed(self) -> None:
+        reader, self._reader = self._reader, None
+        self._feed = None
+        self.load_status_var.set("")
+        if reader is not None and reader.error is not None:
+            messagebox.showerror("Error", str(reader.error))
         self._render()
 
+    def _cancel_feed(self) -> None:
+        if self._feed_after_id is not None:
+            self.root.after_cancel(self._feed_after_id)
+            self._feed_after_id = None
+        self._feed = None
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+
+    def _close_source(self) -> None:
+        """Leave the read-only large-file view (if any) and stop any load in progress."""
+        self._cancel_feed()
+        if self._virtual_view is not None:
+            self._virtual_view.destroy()
+            self._virtual_view = None
+        self.source_path = None
+        self.load_status_var.set("")
+
     def _pick_highlight_color(self):
         color = colorchooser.askcolor(
             color=self.highlight_color_var.get() or "#ffff00",
@@ -274,29 +575,35 @@ class TokenColorMapperApp:
             self.highlight_color_var.set(color[1])
             self._render()
 
-    def _get_text_chunked(self, chunk_chars: int = 100_000) -> str:
-        """Get full text from the widget in chunks, calling update() so the UI stays responsive on huge content."""
-        parts = []
-        start = "1.0"
-        while True:
-            end = self.text_input.index(f"{start}+{chunk_chars}c")
-            part = self.text_input.get(start, end)
-            if not part:
-                break
-            parts.append(part)
-            self.root.update_idletasks()
+    def _with_export_payload(self, then: Callable[[Any], None]) -> None:
+        """Call then(payload) with the export input: {"path": ...} for a large file, else the editor text.
+
+        The editor text is read on the Tk loop in slices of LOAD_FRAME_BUDGET_S (see _drain_gather),
+        so exporting millions of tokens does not freeze the UI.
+        """
+        if self.source_path is not None:
+            then({"path": self.source_path})  # the worker reads the large file itself
+            return
+        self._gather_seq += 1
+        mark = f"gather{self._gather_seq}"
+        self.text_input.mark_set(mark, "1.0")
+        self.root.after(0, self._drain_gather, mark, [], then)
+
+    def _drain_gather(self, mark: str, parts: List[str], then: Callable[[Any], None]) -> None:
+        deadline = time.perf_counter() + LOAD_FRAME_BUDGET_S
+        while time.perf_counter() < deadline:
+            end = self.text_input.index(f"{mark}+{GATHER_PIECE_CHARS}c")
+            parts.append(self.text_input.get(mark, end))
+            self.text_input.mark_set(mark, end)
             if self.text_input.compare(end, ">=", tk.END):
-                break
-            start = end
-        return "".join(parts)
-
-    def _get_tokens(self) -> List[str]:
-        text = self.text_input.get("1.0", tk.END)
-        return core.tokenize(
-            text,
-            mode=self.tokenize_mode,
-            custom_sep=self.custom_separator,
-        )
+                self.text_input.mark_unset(mark)
+                text = "".join(parts)
+                if not text.strip():
+                    messagebox.showwarning("Warning", "No text to export.")
+                    return
+                then(text)
+                return
+        self.root.after(1, self._drain_gather, mark, parts, then)
 
     def _render(self):
         """Entry point for controls: run render immediately (no debounce)."""
@@ -327,6 +634,15 @@ class TokenColorMapperApp:
             trend_opacity = max(0, min(100, int(self.trend_opacity_var.get())))
         except (ValueError, tk.TclError):
             trend_opacity = 50
+        try:
+            ngram_n = max(1, min(16, int(self.ngram_n_var.get())))
+        except (ValueError, tk.TclError):
+            ngram_n = core.DEFAULT_NGRAM_N
+        try:
+            # Same normalization as the export worker, so a negative seed means one thing everywhere
+            seed = core.normalize_seed(int(self.seed_var.get().strip()))
+        except (ValueError, tk.TclError):
+            seed = None
         hc = (self.highlight_color_var.get() or "#ffff00").strip()
         highlight_color_hex = hc if (hc and hc.startswith("#") and len(hc) in (4, 7)) else "#ffff00"
         return {
@@ -336,6 +652,7 @@ class TokenColorMapperApp:
             "arrangement_pattern": self.pattern_var.get(),
             "tokenize_mode": self.tokenize_var.get(),
             "custom_separator": self.custom_sep_var.get() or ",",
+            "ngram_n": ngram_n,
             "emphasize_similarity": self.emphasize_var.get(),
             "similarity_threshold": similarity_threshold,
             "highlight_trends": self.trends_var.get(),
@@ -346,10 +663,13 @@ class TokenColorMapperApp:
             "trend_similarity": trend_similarity,
             "trend_opacity": trend_opacity,
             "highlight_color_hex": highlight_color_hex,
+            "seed": seed,
         }
 
     def _has_text_content(self) -> bool:
         """Lightweight check if the text widget has any content. Avoids get(1.0, END) which freezes on huge paste."""
+        if self.source_path is not None:
+            return True
         try:
             return self.text_input.compare("end-1c", ">", "1.0")
         except tk.TclError:
@@ -382,15 +702,18 @@ class TokenColorMapperApp:
         self._show_ready()
 
     def _show_empty(self):
+        self._close_viewer()
         self.display_canvas.pack(fill=tk.BOTH, expand=True)
         self.display_canvas.delete("all")
-        self.display_canvas.create_text(400, 300, text="Enter text, then use Export image… to generate and save the map.", anchor="center")
+        self.display_canvas.create_text(400, 300, text="Enter text, then use View map or Export image… to see the map.", anchor="center")
         self.caption_label.pack_forget()
 
     def _show_ready(self):
+        if self._viewer is not None:
+            return  # keep the open map; "View map" rebuilds it from the current text
         self.display_canvas.pack(fill=tk.BOTH, expand=True)
         self.display_canvas.delete("all")
-        self.display_canvas.create_text(400, 300, text="Ready. Use Export image… to generate and save the map.", anchor="center")
+        self.display_canvas.create_text(400, 300, text="Ready. Use View map to explore the map here, or Export image… to save it.", anchor="center")
         self.caption_label.pack_forget()
 
     def _open_file(self):
@@ -398,16 +721,21 @@ class TokenColorMapperApp:
         if not path:
             return
         try:
+            self._close_source()
             self.text_input.delete("1.0", tk.END)
-            chunk_size = 100_000
-            with open(path, "r", encoding="utf-8", errors="replace") as f:
-                while True:
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        break
-                    self.text_input.insert(tk.END, chunk)
-                    self.root.update_idletasks()
-            self._render()
+            size = file_size(path)
+            name = os.path.basename(path)
+            if size > LARGE_FILE_BYTES:
+                # Only a window of lines is ever in the widget; exports read the file themselves
+                self.source_path = path
+                self._virtual_view = VirtualTextView(self.text_input, self.text_scroll, LineIndex(path))
+                self.load_status_var.set(f"Read-only view of {name} ({size / 2**20:,.0f} MB); exports read the file directly.")
+                self._render()
+                return
+            reader = BackgroundReader(path)
+            self._reader = reader
+            progress = lambda: f"Loading {name}… {100 * reader.bytes_read // max(1, reader.total)}%"
+            self._start_feed(reader.queue.get_nowait, tk.END, progress)
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
@@ -416,8 +744,11 @@ class TokenColorMapperApp:
         if not path:
             return
         try:
-            with open(path, "w", encoding="utf-8") as f:
-                f.write(self.text_input.get("1.0", tk.END))
+            if self.source_path is not None:
+                shutil.copyfile(self.source_path, path)
+            else:
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(self.text_input.get("1.0", tk.END))
             messagebox.showinfo("Saved", f"Saved to {path}")
         except Exception as e:
             messagebox.showerror("Error", str(e))
@@ -427,42 +758,202 @@ class TokenColorMapperApp:
             messagebox.showinfo("Info", "Re-randomize only applies in Random mode.")
             return
         self.token_color_map.clear()
+        if self.seed_var.get().strip():
+            # Fixed seed would reproduce the same colors; pick a new one (shown so it can be reused)
+            self.seed_var.set(str(core.new_seed()))
         self._render()
 
+    def _view_map(self):
+        if not self._has_text_content():
+            messagebox.showwarning("Warning", "No text to view.")
+            return
+        opts = self._read_options()
+
+        def queue(payload: Any) -> None:
+            # The worker writes the color grid and index here; the viewer maps them from disk
+            path = tempfile.mkdtemp(prefix="tcm_view_")
+            job = self._start_export(run_build_view_worker, opts, path, payload, label="Map view", coalesce=False)
+            if job is None:
+                shutil.rmtree(path, ignore_errors=True)
+                return
+            self._pending_views[job.id] = path
+            self.caption_label.config(text="Building map…")
+            self.caption_label.pack(fill=tk.X)
+
+        self._with_export_payload(queue)
+
+    def _open_viewer(self, path: str) -> None:
+        self._close_viewer()
+        grid = np.load(os.path.join(path, "color_grid.npy"), mmap_mode="r")
+        pyramid = TilePyramid(grid, spill_dir=path)
+        pyramid.start()
+        self._viewer_dir = path
+        self._viewer_index = GridIndex.load(path)
+        self._viewer_vocab = MappingFile(os.path.join(path, "vocab.tcm"))
+        self._viewer = TileViewer(
+            self.display_canvas, pyramid,
+            on_hover=self._hover_text,
+            on_status=lambda text: self.caption_label.config(text=text),
+        )
+        self.caption_label.config(text=f"{grid.shape[1]:,} x {grid.shape[0]:,} cells — drag to pan, wheel to zoom, double-click to fit")
+
+    def _hover_text(self, row: int, col: int) -> str:
+        """Token under the cursor via the grid index (O(1)) and the vocab file (mmap)."""
+        index, vocab = self._viewer_index, self._viewer_vocab
+        if index is None or vocab is None:
+            return ""
+        i = index.token_index_at(row, col)
+        if i < 0:
+            return f"({row}, {col})"
+        tid = int(index.ids[i])
+        r, g, b = vocab.rgb[tid]
+        return f"({row}, {col})  token #{i:,}: {vocab.token(tid)!r}  #{r:02x}{g:02x}{b:02x}  ×{index.count(tid):,}"
+
+    def _discard_pending_view(self, job_id: int) -> None:
+        path = self._pending_views.pop(job_id, None)
+        if path is not None:
+            shutil.rmtree(path, ignore_errors=True)
+            if self._viewer is None:
+                self.caption_label.config(text="")
+
+    def _close_viewer(self) -> None:
+        if self._viewer is not None:
+            self._viewer.destroy()
+            self._viewer = None
+        if self._viewer_vocab is not None:
+            self._viewer_vocab.close()
+            self._viewer_vocab = None
+        self._viewer_index = None
+        if self._viewer_dir is not None:
+            shutil.rmtree(self._viewer_dir, ignore_errors=True)
+            self._viewer_dir = None
+        self.caption_label.config(text="")
+
     def _export_image(self):
         if not self._has_text_content():
             messagebox.showwarning("Warning", "No text to export.")
             return
-        path = filedialog.asksaveasfilename(defaultextension=".png", filetypes=[("PNG", "*.png"), ("All", "*.*")])
+        path = filedialog.asksaveasfilename(defaultextension=".png", filetypes=IMAGE_FILETYPES)
         if not path:
             return
-        if self._export_process is not None and self._export_process.is_alive():
-            messagebox.showinfo("Export", "An export is already in progress.")
+        opts = self._read_options()
+        opts["export_scale"] = self._get_export_scale()
+        opts["output_format"] = output_format(path)
+        opts["png_compress_level"] = self._get_png_level()
+        opts["heatmap"] = self.heatmap_var.get()
+        try:
+            opts["heatmap_opacity"] = max(0, min(100, int(self.heatmap_opacity_var.get())))
+        except (ValueError, tk.TclError):
+            opts["heatmap_opacity"] = 60
+        opts["write_stats"] = self.write_stats_var.get()
+        opts["memory_budget_mb"] = self._get_memory_budget_mb()
+        opts["out_of_core"] = self._get_out_of_core()
+        if not self._confirm_plan(opts):
             return
-        # Get text in chunks so UI stays responsive (avoids freeze on millions of tokens)
-        text = self._get_text_chunked()
-        if not (text or "").strip():
+        extra_scales = self._get_extra_scales()
+
+        def queue(payload: Any) -> None:
+            if self._start_export(run_export_image_worker, opts, path, payload, batchable=True) is None:
+                return
+            # Extra scales are queued with the main export and share its tokenizing, colors and layout
+            base, ext = os.path.splitext(path)
+            for scale in extra_scales:
+                if scale != opts["export_scale"]:
+                    extra = dict(opts, export_scale=scale)
+                    self._start_export(
+                        run_export_image_worker, extra, f"{base}_x{scale}{ext or '.png'}", payload, batchable=True
+                    )
+
+        self._with_export_payload(queue)
+
+    def _export_video(self):
+        if not self._has_text_content():
             messagebox.showwarning("Warning", "No text to export.")
             return
+        path = filedialog.asksaveasfilename(defaultextension=".mp4", filetypes=[("MP4", "*.mp4"), ("GIF", "*.gif"), ("All", "*.*")])
+        if not path:
+            return
+        opts = self._read_options()
+        try:
+            opts["video_frames"] = max(10, min(3600, int(self.video_frames_var.get())))
+        except (ValueError, tk.TclError):
+            opts["video_frames"] = 120
+        try:
+            opts["video_fps"] = max(1, min(60, int(self.video_fps_var.get())))
+        except (ValueError, tk.TclError):
+            opts["video_fps"] = 30
+        opts["video_size"] = int(self.video_size_var.get() or 720)
+        opts["video_bins"] = int(self.video_bins_var.get() or 64)
+        opts["video_kind"] = self.video_kind_var.get()
+        self._with_export_payload(lambda payload: self._start_export(run_export_video_worker, opts, path, payload, kind="video"))
+
+    def _export_compare(self):
+        paths = filedialog.askopenfilenames(filetypes=[("Text", "*.txt"), ("All", "*.*")])
+        if not paths:
+            return
+        if len(paths) < 2:
+            messagebox.showwarning("Compare", "Select at least two files to compare.")
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".png", filetypes=[("PNG", "*.png"), ("All", "*.*")])
+        if not path:
+            return
         opts = self._read_options()
-        self._sync_options_from_read(opts)
         opts["export_scale"] = self._get_export_scale()
-        result_queue = Queue()
-        p = Process(
-            target=run_export_image_worker,
-            args=(text, opts, path, result_queue),
-            daemon=True,
-        )
-        p.start()
-        self._export_process = p
-        self._export_queue = result_queue
-        messagebox.showinfo(
-            "Exporting",
-            "Export started. The window will stay responsive.\n\n"
-            "For very large files (millions of tokens) this may take several minutes. "
-            "You will see a message when it finishes.",
-        )
-        self._poll_export_id = self.root.after(200, self._poll_export_result)
+        opts["compare_mode"] = self.compare_mode_var.get()
+        # Workers read the documents themselves; only the paths cross the process boundary
+        self._start_export(run_export_compare_worker, opts, path, payload=list(paths), kind="compare")
+
+    def _start_export(
+        self,
+        target,
+        opts: Dict[str, Any],
+        path: str,
+        payload: Any,
+        kind: str = "image",
+        label: str = "",
+        coalesce: bool = True,
+        batchable: bool = False,
+    ) -> Optional[Job]:
+        """Queue an export worker on payload (see _with_export_payload); the job list shows its progress.
+
+        Returns None if nothing was queued.
+        """
+        self._sync_options_from_read(opts)
+        opts["palette_cache_path"] = PALETTE_CACHE_FILE
+        opts["palette_cache_max_entries"] = self.palette_cache_max_entries
+        opts["mapping_path"] = self.mapping_path
+        opts["memory_budget_mb"] = self._get_memory_budget_mb()
+        opts["out_of_core"] = self._get_out_of_core()
+        self.jobs.budget = memory_budget(opts) if opts["memory_budget_mb"] else None
+        try:
+            job = self.jobs.submit(kind, target, payload, opts, path, label=label, coalesce=coalesce, batchable=batchable)
+        except OSError as e:
+            messagebox.showerror("Export error", str(e))
+            return None
+        self.jobs_tree.insert("", tk.END, iid=str(job.id), values=(job.label, job.status, job.message))
+        if self._poll_export_id is None:
+            # Start on the next poll, so exports queued together can be batched
+            self._poll_export_id = self.root.after(50, self._poll_export_result)
+        return job
+
+    def _update_job_row(self, job: Job) -> None:
+        if self.jobs_tree.exists(str(job.id)):
+            self.jobs_tree.item(str(job.id), values=(job.label, job.status, job.message))
+
+    def _cancel_jobs(self) -> None:
+        """Cancel the selected queued jobs (running exports finish)."""
+        for iid in self.jobs_tree.selection():
+            job_id = int(iid)
+            if self.jobs.cancel(job_id):
+                self._discard_pending_view(job_id)
+        for job in self.jobs.jobs:
+            self._update_job_row(job)
+
+    def _clear_jobs(self) -> None:
+        for job in [j for j in self.jobs.jobs if j.status in (DONE, FAILED, CANCELLED)]:
+            if self.jobs_tree.exists(str(job.id)):
+                self.jobs_tree.delete(str(job.id))
+            self.jobs.jobs.remove(job)
 
     def _sync_options_from_read(self, opts: Dict[str, Any]) -> None:
         """Sync opts from _read_options() into instance for later use."""
@@ -484,57 +975,96 @@ class TokenColorMapperApp:
         self.highlight_color_hex = opts["highlight_color_hex"]
 
     def _poll_export_result(self):
-        """Poll for export result from subprocess."""
+        """Poll the job queue: report finished jobs and start queued ones."""
         self._poll_export_id = None
-        if self._export_queue is None or self._export_process is None:
+        for job in self.jobs.poll():
+            self._job_finished(job)
+        for job in self.jobs.jobs:
+            self._update_job_row(job)
+        if self.jobs.active():
+            self._poll_export_id = self.root.after(200, self._poll_export_result)
+        elif self._job_messages:
+            messages, self._job_messages = self._job_messages, []
+            messagebox.showinfo("Saved", "\n\n".join(messages))
+
+    def _job_finished(self, job: Job) -> None:
+        result = job.result or {}
+        if result.get("ok") and result.get("kind") == "mapping":
+            self.token_color_map.update(result.pop("color_map", {}))
+            job.message = result["path"]
+            self._job_messages.append(f"Mapping saved to {result['path']}")
             return
-        try:
-            result = self._export_queue.get_nowait()
-        except Empty:
-            if self._export_process.is_alive():
-                self._poll_export_id = self.root.after(200, self._poll_export_result)
-            else:
-                self._export_process = None
-                self._export_queue = None
-                messagebox.showerror("Export", "Export process ended without a result.")
+        if result.get("ok") and result.get("kind") == "view":
+            path = self._pending_views.pop(job.id, result["path"])
+            try:
+                self._open_viewer(path)
+            except Exception as e:
+                shutil.rmtree(path, ignore_errors=True)
+                messagebox.showerror("View map", str(e))
             return
-        if self._export_process.is_alive():
-            self._export_process.join(timeout=3.0)
-        self._export_process = None
-        self._export_queue = None
         if result.get("ok"):
-            messagebox.showinfo("Saved", f"Image saved to {result.get('path', '')}")
-        else:
-            messagebox.showerror("Export error", result.get("error", "Unknown error"))
+            job.message = result.get("path", "")
+            what = {"video": "Video", "compare": "Comparison"}.get(result.get("kind"), "Image")
+            msg = f"{what} saved to {result.get('path', '')}"
+            if result.get("kind") == "compare":
+                msg += "\n\nTokens per document: " + ", ".join(str(n) for n in result["tokens"])
+                msg += "\nUnique tokens per document: " + ", ".join(str(n) for n in result["unique_tokens"])
+            if result.get("stats_path"):
+                msg += f"\nStats saved to {result['stats_path']}"
+            if result.get("trends_path"):
+                msg += f"\nTrend analytics saved to {result['trends_path']}"
+            if result.get("scale") and result["scale"] < result.get("requested_scale", 0):
+                msg += (
+                    f"\nScale reduced from {result['requested_scale']:g} to {result['scale']:.2f} "
+                    f"({result.get('max_dim', 32768):,} px limit)"
+                )
+            if result.get("trend_note"):
+                msg += f"\nTrends {result['trend_note']}"
+            if result.get("render") == "banded":
+                msg += "\nRendered in row bands (canvas larger than the RAM budget)"
+            if result.get("palette_colors"):
+                msg += f"\nIndexed PNG ({result['palette_colors']} colors)"
+            if result.get("out_of_core"):
+                msg += "\nTokenized out of core (token IDs and grids on disk)"
+            if job.opts.get("current_mode") == "random" or job.opts.get("arrangement_pattern") == "random":
+                msg += f"\nSeed: {result.get('seed')}"
+            self._job_messages.append(msg)
+        elif job.status != CANCELLED:
+            self._discard_pending_view(job.id)
+            messagebox.showerror("Export error", f"{job.label}: {result.get('error', 'Unknown error')}")
 
     def _export_json(self):
-        tokens = self._get_tokens()
-        if not tokens:
+        if not self._has_text_content():
             messagebox.showwarning("Warning", "No text to export.")
             return
-        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json"), ("All", "*.*")])
+        path = filedialog.asksaveasfilename(defaultextension=".tcm", filetypes=MAPPING_FILETYPES)
         if not path:
             return
-        try:
-            # Build color map for all tokens (no preview, so build on export)
-            for t in tokens:
-                core.get_color_for_token(t, self.current_mode, self.token_color_map)
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump(self.token_color_map, f, indent=2)
-            messagebox.showinfo("Saved", f"Mapping saved to {path}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        # Colors for tokens not yet mapped are built on export (no preview), in a worker like image exports
+        opts = self._read_options()
+        opts["token_color_map"] = dict(self.token_color_map)
+        self._with_export_payload(
+            lambda payload: self._start_export(
+                run_export_mapping_worker, opts, path, payload, kind="mapping", coalesce=False
+            )
+        )
 
     def _import_json(self):
-        path = filedialog.askopenfilename(filetypes=[("JSON", "*.json"), ("All", "*.*")])
+        path = filedialog.askopenfilename(filetypes=MAPPING_FILETYPES)
         if not path:
             return
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            self.token_color_map.update(data)
+            if is_binary_mapping_path(path):
+                # Binary mappings stay on disk; exports look tokens up in the file (no dict)
+                with MappingFile(path) as mf:
+                    n = len(mf)
+                self.mapping_path = path
+                message = f"Color mapping imported ({n:,} tokens)."
+            else:
+                self.token_color_map.update(read_mapping_json(path))
+                message = "Color mapping imported."
             self._render()
-            messagebox.showinfo("Imported", "Color mapping imported.")
+            messagebox.showinfo("Imported", message)
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
@@ -562,6 +1092,24 @@ class TokenColorMapperApp:
                 self.trend_opacity_var.set(s["trend_opacity"])
             if "highlight_color" in s and hasattr(self, "highlight_color_var"):
                 self.highlight_color_var.set(s["highlight_color"])
+            if "seed" in s:
+                self.seed_var.set(str(s["seed"]))
+            if "ngram_n" in s:
+                self.ngram_n_var.set(s["ngram_n"])
+            if "heatmap" in s:
+                self.heatmap_var.set(bool(s["heatmap"]))
+            if "heatmap_opacity" in s:
+                self.heatmap_opacity_var.set(s["heatmap_opacity"])
+            if "write_stats" in s:
+                self.write_stats_var.set(bool(s["write_stats"]))
+            if "memory_budget_mb" in s:
+                self.memory_budget_var.set(int(s["memory_budget_mb"]))
+            if s.get("out_of_core") in ("auto", "on", "off"):
+                self.out_of_core_var.set(s["out_of_core"])
+            if "png_compress_level" in s:
+                self.png_level_var.set(max(0, min(9, int(s["png_compress_level"]))))
+            if "palette_cache_max_entries" in s:
+                self.palette_cache_max_entries = max(1, int(s["palette_cache_max_entries"]))
             self._on_export_scale_change()
         except Exception:
             pass
@@ -582,6 +1130,16 @@ class TokenColorMapperApp:
                 s["trend_opacity"] = self.trend_opacity_var.get()
             if hasattr(self, "highlight_color_var"):
                 s["highlight_color"] = self.highlight_color_var.get()
+            s["seed"] = self.seed_var.get().strip()
+            s["ngram_n"] = self.ngram_n_var.get()
+            s["heatmap"] = self.heatmap_var.get()
+            s["heatmap_opacity"] = self.heatmap_opacity_var.get()
+            s["write_stats"] = self.write_stats_var.get()
+            s["memory_budget_mb"] = self._get_memory_budget_mb()
+            s["out_of_core"] = self.out_of_core_var.get()
+            s["png_compress_level"] = self._get_png_level()
+            s["palette_cache_max_entries"] = self.palette_cache_max_entries
+            s[perf_profile.SETTINGS_KEY] = perf_profile.settings_entry()
             with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
                 json.dump(s, f, indent=2)
         except Exception:
@@ -593,6 +1151,13 @@ class TokenColorMapperApp:
 
     def _on_close(self):
         self._save_settings()
+        self.jobs.shutdown()
+        if self._autotune_proc is not None:
+            self._autotune_proc.terminate()
+        for job_id in list(self._pending_views):
+            self._discard_pending_view(job_id)
+        self._close_viewer()
+        self._close_source()
         self.root.destroy()
 
 
@@ -0,0 +1,239 @@
+# mapping_io.py - Token -> color mapping files (compact binary + JSON interchange)
+"""Read/write token color mappings.
+
+Binary layout (little endian), extension .tcm (.tcmz when zlib-compressed):
+
+    magic    8 bytes  b"TCMAP\\x00\\x01\\x00"
+    header   u32 flags, u64 count, u64 blob_size, u64 blob_raw_size, u64 offsets_size, u64 rgb_size
+    blob     UTF-8 token bytes, concatenated (token i is blob[offsets[i]:offsets[i + 1]])
+    offsets  u64[count + 1] token start offsets (the length prefix of each token)
+    rgb      u8[count, 3]
+
+Uncompressed files are read through mmap, so opening a multi-million-token mapping
+costs nothing until tokens are looked up; nothing is ever loaded into a dict.
+"""
+import json
+import mmap
+import struct
+import zlib
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b"TCMAP\x00\x01\x00"
+_HEADER = struct.Struct("<IQQQQQ")
+_DATA_START = len(MAGIC) + _HEADER.size
+FLAG_SORTED = 1
+FLAG_ZLIB = 2
+BINARY_EXTENSIONS = (".tcm", ".tcmz")
+
+
+def is_binary_mapping_path(path: str) -> bool:
+    return path.lower().endswith(BINARY_EXTENSIONS)
+
+
+def _hex_to_packed(hex_color: str) -> Optional[Tuple[int, int, int]]:
+    h = hex_color.lstrip("#")
+    if len(h) != 6:
+        return None
+    try:
+        v = int(h, 16)
+    except ValueError:
+        return None
+    return (v >> 16) & 0xFF, (v >> 8) & 0xFF, v & 0xFF
+
+
+class MappingWriter:
+    """Streaming binary mapping writer: token bytes go straight to disk, only offsets/RGB stay in memory."""
+
+    def __init__(self, path: str, compress: bool = False, level: int = 6):
+        self._f = open(path, "wb")
+        self._f.write(MAGIC)
+        self._f.write(b"\x00" * _HEADER.size)
+        self._compressor = zlib.compressobj(level) if compress else None
+        self._level = level
+        self._offsets = array("Q", [0])
+        self._rgb = bytearray()
+        self._blob_size = 0
+        self._prev: Optional[bytes] = None
+        self._sorted = True
+
+    def __enter__(self) -> "MappingWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
+
+    def write(self, token: str, rgb: Tuple[int, int, int]) -> None:
+        data = token.encode("utf-8")
+        if self._prev is not None and data <= self._prev:
+            self._sorted = False
+        self._prev = data
+        self._offsets.append(self._offsets[-1] + len(data))
+        self._rgb.extend(rgb)
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._f.write(data)
+        self._blob_size += len(data)
+
+    def write_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        """Write (token, "#rrggbb") pairs; entries with invalid colors are skipped."""
+        for token, color in items:
+            rgb = _hex_to_packed(color)
+            if rgb is not None:
+                self.write(token, rgb)
+
+    def close(self) -> None:
+        f = self._f
+        if f.closed:
+            return
+        offsets = np.asarray(self._offsets, dtype="<u8").tobytes()
+        rgb = bytes(self._rgb)
+        flags = FLAG_SORTED if self._sorted else 0
+        if self._compressor is not None:
+            tail = self._compressor.flush()
+            f.write(tail)
+            self._blob_size += len(tail)
+            offsets = zlib.compress(offsets, self._level)
+            rgb = zlib.compress(rgb, self._level)
+            flags |= FLAG_ZLIB
+        f.write(offsets)
+        f.write(rgb)
+        f.seek(len(MAGIC))
+        f.write(_HEADER.pack(
+            flags, len(self._offsets) - 1, self._blob_size, int(self._offsets[-1]), len(offsets), len(rgb)
+        ))
+        f.close()
+
+
+class MappingFile:
+    """Read-only view of a binary mapping (mmap for uncompressed files)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "rb")
+        head = self._f.read(_DATA_START)
+        if len(head) < _DATA_START or head[: len(MAGIC)] != MAGIC:
+            self._f.close()
+            raise ValueError(f"Not a binary token color mapping: {path}")
+        flags, self.count, blob_size, blob_raw, off_size, rgb_size = _HEADER.unpack(head[len(MAGIC):])
+        self.sorted = bool(flags & FLAG_SORTED)
+        self._mm = None
+        if flags & FLAG_ZLIB:
+            blob = zlib.decompress(self._f.read(blob_size))
+            offsets = zlib.decompress(self._f.read(off_size))
+            rgb = zlib.decompress(self._f.read(rgb_size))
+            self._blob = memoryview(blob)
+            self.offsets = np.frombuffer(offsets, dtype="<u8")
+            self.rgb = np.frombuffer(rgb, dtype=np.uint8).reshape(-1, 3)
+        else:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+            start = _DATA_START
+            self._blob = memoryview(self._mm)[start : start + blob_size]
+            start += blob_size
+            self.offsets = np.frombuffer(self._mm, dtype="<u8", count=self.count + 1, offset=start)
+            start += off_size
+            self.rgb = np.frombuffer(self._mm, dtype=np.uint8, count=self.count * 3, offset=start).reshape(-1, 3)
+        self._off = self.offsets.tolist() if self.count <= 1_000_000 else self.offsets
+
+    def __enter__(self) -> "MappingFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        # Drop numpy/memoryview references before closing the mmap
+        self.offsets = self.rgb = self._off = None
+        if self._blob is not None:
+            self._blob.release()
+            self._blob = None
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass  # caller still holds an array view; the map is released with it
+            self._mm = None
+        self._f.close()
+
+    def token_bytes(self, i: int) -> bytes:
+        return bytes(self._blob[int(self._off[i]) : int(self._off[i + 1])])
+
+    def token(self, i: int) -> str:
+        return self.token_bytes(i).decode("utf-8")
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        """Yield (token, "#rrggbb") in file order."""
+        rgb = self.rgb
+        for i in range(self.count):
+            r, g, b = rgb[i]
+            yield self.token(i), "#{:02x}{:02x}{:02x}".format(r, g, b)
+
+    def lookup_rgb(self, vocab: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Colors for vocab tokens: ((V, 3) uint8, (V,) bool found).
+
+        Sorted files with a small vocab use binary search; otherwise the file is scanned once
+        against a vocab-sized index, so no mapping-sized dict is built either way.
+        """
+        n_vocab = len(vocab)
+        out = np.zeros((n_vocab, 3), dtype=np.uint8)
+        found = np.zeros(n_vocab, dtype=bool)
+        if n_vocab == 0 or self.count == 0:
+            return out, found
+        if self.sorted and n_vocab * max(1, self.count.bit_length()) < self.count:
+            keys = _TokenKeys(self)
+            for i, tok in enumerate(vocab):
+                key = tok.encode("utf-8")
+                j = bisect_left(keys, key)
+                if j < self.count and keys[j] == key:
+                    out[i] = self.rgb[j]
+                    found[i] = True
+            return out, found
+        index: Dict[bytes, int] = {t.encode("utf-8"): i for i, t in enumerate(vocab)}
+        rows: List[int] = []
+        hits: List[int] = []
+        for j in range(self.count):
+            i = index.get(self.token_bytes(j))
+            if i is not None:
+                rows.append(j)
+                hits.append(i)
+        if hits:
+            out[hits] = self.rgb[rows]
+            found[hits] = True
+        return out, found
+
+
+class _TokenKeys:
+    """Sequence adapter so bisect can search the sorted blob without decoding it."""
+
+    def __init__(self, mf: MappingFile):
+        self._mf = mf
+
+    def __len__(self) -> int:
+        return self._mf.count
+
+    def __getitem__(self, i: int) -> bytes:
+        return self._mf.token_bytes(i)
+
+
+def write_mapping(path: str, color_map: Dict[str, str]) -> None:
+    """Write color_map to path; binary (sorted, so lookups can bisect) for .tcm/.tcmz, else JSON."""
+    if not is_binary_mapping_path(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(color_map, f, indent=2)
+        return
+    with MappingWriter(path, compress=path.lower().endswith(".tcmz")) as w:
+        w.write_many((t, color_map[t]) for t in sorted(color_map))
+
+
+def read_mapping_json(path: str) -> Dict[str, str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
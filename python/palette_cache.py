@@ -0,0 +1,110 @@
+# palette_cache.py - Persistent token -> color cache for standard (hash) mode
+"""On-disk token -> RGB store so repeat exports only hash tokens they have not seen before."""
+import sqlite3
+import time
+from typing import Dict, Iterable, List
+
+# Default upper bound on cached tokens; least recently used entries are evicted past this
+DEFAULT_MAX_ENTRIES = 5_000_000
+# Let SQLite memory-map the database file (bytes) so bulk lookups avoid read() copies
+_MMAP_SIZE = 256 * 1024 * 1024
+_INSERT_BATCH = 50_000
+
+
+class PaletteCache:
+    """SQLite-backed token -> "#rrggbb" cache with size-bounded LRU eviction.
+
+    Lookups and inserts are done in bulk (one temp-table join per call), so
+    fill_color_map pays one round trip per export instead of one per token.
+    """
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self._conn = sqlite3.connect(path, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size={_MMAP_SIZE}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS palette ("
+            "token TEXT PRIMARY KEY, rgb INTEGER NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS palette_lru ON palette(last_used)")
+        self._conn.commit()
+        # Upper bound on the row count: each put_many adds its size, and the table is only
+        # counted (and trimmed) once the bound passes max_entries
+        self._rows_bound = len(self)
+
+    def __enter__(self) -> "PaletteCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM palette").fetchone()[0]
+
+    def get_many(self, tokens: Iterable[str]) -> Dict[str, str]:
+        """Return {token: hex} for the tokens that are cached and mark them as recently used."""
+        conn = self._conn
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS want (token TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM want")
+        _executemany_batched(conn, "INSERT OR IGNORE INTO want(token) VALUES (?)", ((t,) for t in tokens))
+        rows = conn.execute(
+            "SELECT p.token, p.rgb FROM want w JOIN palette p ON p.token = w.token"
+        ).fetchall()
+        if rows:
+            conn.execute(
+                "UPDATE palette SET last_used = ? WHERE token IN (SELECT token FROM want)",
+                (_now(),),
+            )
+        conn.execute("DELETE FROM want")
+        conn.commit()
+        return {t: "#{:06x}".format(rgb) for t, rgb in rows}
+
+    def put_many(self, color_map: Dict[str, str]) -> None:
+        """Store {token: hex} entries, then evict least recently used entries over max_entries.
+
+        The table is counted only when the entries stored since the last count could exceed
+        max_entries (other processes sharing the file are picked up at the next count).
+        """
+        if not color_map:
+            return
+        now = _now()
+        conn = self._conn
+        _executemany_batched(
+            conn,
+            "INSERT OR REPLACE INTO palette(token, rgb, last_used) VALUES (?, ?, ?)",
+            ((t, int(c.lstrip("#"), 16), now) for t, c in color_map.items()),
+        )
+        self._rows_bound += len(color_map)
+        if self._rows_bound > self.max_entries:
+            rows = len(self)
+            if rows > self.max_entries:
+                conn.execute(
+                    "DELETE FROM palette WHERE token IN "
+                    "(SELECT token FROM palette ORDER BY last_used LIMIT ?)",
+                    (rows - self.max_entries,),
+                )
+            self._rows_bound = min(rows, self.max_entries)
+        conn.commit()
+
+
+def _now() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def _executemany_batched(conn: sqlite3.Connection, sql: str, rows: Iterable[tuple]) -> None:
+    batch: List[tuple] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= _INSERT_BATCH:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
@@ -0,0 +1,389 @@
+# perf_profile.py - Performance profile: worker counts, thresholds, memory budget, render backend (no GUI)
+"""One profile is active per process. It is kept in token_color_mapper_settings.json under
+"performance" and read from there on first use, so export workers, pool processes and the
+render server see the same values as the GUI (which saves the file when the profile changes).
+
+Keys (defaults are the values the code used before profiles existed; trend scanning is no
+longer one process per direction, so trend_max_workers defaults to 32 like tokenizing):
+
+    tokenize_parallel_min_chars  text length from which tokenization uses a process pool
+    tokenize_max_workers         cap on tokenize processes
+    trend_parallel_min_cells     grid cells from which trend lines are scanned in parallel
+    trend_max_workers            cap on trend processes
+    export_trend_max_cells       exports skip trend detection above this many cells
+    numba_min_blocks             blocks from which the numba painter is used
+    gpu_min_blocks               blocks from which the GPU painter may be used
+    max_export_dim               largest exported image side in px (at most 32,768)
+    memory_budget_mb             export RAM budget when the GUI field is 0 (0 = 70% of available)
+    encode_workers               PNG deflate threads when not set per export (0 = one per CPU)
+    render_backend               "auto", "numba", "gpu" or "numpy" (block painter)
+
+Presets: "default", "laptop", "big server". autotune() measures this machine (pool start-up,
+per-item costs, numba and encoder scaling) and returns values for it; run
+`python perf_profile.py --autotune` or use *Auto-tune* in the GUI.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import numpy as np
+
+SETTINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "token_color_mapper_settings.json")
+SETTINGS_KEY = "performance"
+MAX_EXPORT_DIM = 32768
+RENDER_BACKENDS = ("auto", "numba", "gpu", "numpy")
+# Threshold meaning "never" (parallel work does not pay off on this machine)
+NEVER = 1 << 40
+
+DEFAULT_PROFILE: Dict[str, Any] = {
+    "tokenize_parallel_min_chars": 500_000,
+    "tokenize_max_workers": 32,
+    "trend_parallel_min_cells": 100_000,
+    "trend_max_workers": 32,
+    "export_trend_max_cells": 2_000_000,
+    "numba_min_blocks": 500,
+    "gpu_min_blocks": 8000,
+    "max_export_dim": MAX_EXPORT_DIM,
+    "memory_budget_mb": 0,
+    "encode_workers": 0,
+    "render_backend": "auto",
+}
+# (min, max) of the integer keys
+_LIMITS = {
+    "tokenize_parallel_min_chars": (10_000, NEVER),
+    "tokenize_max_workers": (1, 256),
+    "trend_parallel_min_cells": (1_000, NEVER),
+    "trend_max_workers": (1, 64),
+    "export_trend_max_cells": (0, NEVER),
+    "numba_min_blocks": (1, NEVER),
+    "gpu_min_blocks": (1, NEVER),
+    "max_export_dim": (256, MAX_EXPORT_DIM),
+    "memory_budget_mb": (0, 1 << 30),
+    "encode_workers": (0, 8),
+}
+PRESETS: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    # Few cores and little RAM: start pools later, fewer processes, smaller exports
+    "laptop": {
+        "tokenize_parallel_min_chars": 2_000_000,
+        "tokenize_max_workers": 4,
+        "trend_parallel_min_cells": 400_000,
+        "trend_max_workers": 2,
+        "export_trend_max_cells": 1_000_000,
+        "max_export_dim": 16384,
+        "encode_workers": 2,
+    },
+    # Many cores and plenty of RAM: parallel sooner, trends on larger grids
+    "big server": {
+        "tokenize_parallel_min_chars": 250_000,
+        "tokenize_max_workers": 64,
+        "trend_parallel_min_cells": 50_000,
+        "trend_max_workers": 64,
+        "export_trend_max_cells": 8_000_000,
+        "encode_workers": 8,
+    },
+}
+CUSTOM = "custom"
+AUTO_TUNED = "auto-tuned"
+
+_active: Optional[Dict[str, Any]] = None
+_active_name = "default"
+
+# Auto-tune: sample sizes and the time an export may spend on trend detection
+_TOKENIZE_SAMPLE_WORDS = 300_000
+_TREND_SAMPLE_SIDE = 400
+_TREND_TARGET_S = 60.0
+_PAINT_SIZES = (32, 128, 512, 2048, 8192)
+_ENCODE_SIDE = 2048
+
+
+def normalize(values: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Defaults overlaid with values; unknown keys dropped, integers clamped, bad entries ignored."""
+    out = dict(DEFAULT_PROFILE)
+    for key, value in (values or {}).items():
+        if key not in DEFAULT_PROFILE:
+            continue
+        if key == "render_backend":
+            if value in RENDER_BACKENDS:
+                out[key] = value
+            continue
+        try:
+            lo, hi = _LIMITS[key]
+            out[key] = min(hi, max(lo, int(value)))
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+def preset(name: str) -> Dict[str, Any]:
+    if name not in PRESETS:
+        raise ValueError(f"Unknown profile {name!r} (presets: {', '.join(PRESETS)})")
+    return normalize(PRESETS[name])
+
+
+def load(path: str = SETTINGS_FILE) -> Dict[str, Any]:
+    """The "performance" entry of a settings file ({"profile": name, **values}); defaults if absent."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f).get(SETTINGS_KEY) or {}
+    except (OSError, ValueError, AttributeError):
+        entry = {}
+    return dict(normalize(entry), profile=str(entry.get("profile") or "default"))
+
+
+def use(values: Optional[Dict[str, Any]], name: str = CUSTOM) -> Dict[str, Any]:
+    """Make values (missing keys: defaults) the profile of this process; returns it."""
+    global _active, _active_name
+    _active = normalize(values)
+    _active_name = name
+    return dict(_active)
+
+
+def active() -> Dict[str, Any]:
+    """The profile of this process (loaded from the settings file on first use)."""
+    if _active is None:
+        entry = load()
+        use(entry, entry["profile"])
+    return _active
+
+
+def active_name() -> str:
+    active()
+    return _active_name
+
+
+def get(key: str) -> Any:
+    return active()[key]
+
+
+def settings_entry() -> Dict[str, Any]:
+    """The active profile as stored in the settings file."""
+    return dict(active(), profile=active_name())
+
+
+def save(path: str = SETTINGS_FILE) -> None:
+    """Write the active profile into the settings file, keeping its other settings."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            settings = json.load(f)
+        if not isinstance(settings, dict):
+            settings = {}
+    except (OSError, ValueError):
+        settings = {}
+    settings[SETTINGS_KEY] = settings_entry()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(settings, f, indent=2)
+
+
+def output_key() -> Dict[str, Any]:
+    """Profile values that change export output (not only speed), for cache keys."""
+    p = active()
+    return {"max_export_dim": p["max_export_dim"], "export_trend_max_cells": p["export_trend_max_cells"]}
+
+
+@contextmanager
+def overridden(**values: Any) -> Iterator[Dict[str, Any]]:
+    """Temporarily change keys of the active profile in this process."""
+    global _active
+    saved = active()
+    _active = normalize(dict(saved, **values))
+    try:
+        yield _active
+    finally:
+        _active = saved
+
+
+# ---- Auto-tune ----
+
+def _best_time(fn: Callable[[], Any], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _pool_start_s(workers: int, fn: Callable, args: list) -> float:
+    """Seconds to start a process pool and run one small task per worker."""
+    def run():
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            list(ex.map(fn, args))
+    return _best_time(run, repeat=2)
+
+
+def _break_even(overhead_s: float, gain_per_item_s: float) -> int:
+    return int(overhead_s / gain_per_item_s) if gain_per_item_s > 0 else NEVER
+
+
+def _tune_tokenize(cpus: int) -> Dict[str, Any]:
+    import core
+
+    rng = np.random.default_rng(0)
+    words = [f"w{i}" for i in rng.integers(0, 50_000, _TOKENIZE_SAMPLE_WORDS).tolist()]
+    text = "\n".join(" ".join(words[i : i + 12]) for i in range(0, len(words), 12))
+    workers = min(cpus, DEFAULT_PROFILE["tokenize_max_workers"])
+    if workers < 2:
+        return {"tokenize_parallel_min_chars": NEVER, "tokenize_max_workers": 1}
+    per_char = _best_time(lambda: core._tokenize_single(text, "words", ",")) / len(text)
+    tokens = core._tokenize_single(text, "words", ",")
+    # The parallel path also splits lines, rejoins chunks and pickles the tokens back
+    extra = _best_time(lambda: pickle.loads(pickle.dumps(tokens, pickle.HIGHEST_PROTOCOL))) / len(text)
+    extra += _best_time(lambda: "\n".join(text.splitlines())) / len(text)
+    overhead = _pool_start_s(workers, core._tokenize_chunk, [("a b", "words", ",")] * workers)
+    threshold = _break_even(overhead, per_char * (1 - 1 / workers) - extra)
+    return {"tokenize_parallel_min_chars": threshold, "tokenize_max_workers": workers}
+
+
+def _tune_trends(cpus: int) -> Dict[str, Any]:
+    import core
+
+    side = _TREND_SAMPLE_SIDE
+    cells = side * side
+    rng = np.random.default_rng(1)
+    # Few colors, so runs (and highlighted trends) actually occur
+    colors = np.array([[230, 40, 40], [40, 200, 60], [40, 60, 220], [250, 250, 250]], dtype=np.uint8)
+    color_grid = colors[rng.integers(0, len(colors), (side, side))]
+    filled = np.ones((side, side), dtype=bool)
+    core.detect_trend_mask(color_grid, filled, 3, 30, max_workers=1)  # JIT compile
+    per_cell = _best_time(lambda: core.detect_trend_mask(color_grid, filled, 3, 30, max_workers=1)) / cells
+    workers = min(cpus, _LIMITS["trend_max_workers"][1])
+    out: Dict[str, Any] = {"trend_max_workers": max(1, workers)}
+    if workers < 2:
+        out["trend_parallel_min_cells"] = NEVER
+    else:
+        # Workers read the packed grid from shared memory, so the cost is the pool start-up
+        overhead = _pool_start_s(workers, abs, list(range(workers)))
+        out["trend_parallel_min_cells"] = _break_even(overhead, per_cell * (1 - 1 / workers))
+    # Grids near the limit are far above the parallel threshold: time per cell is split over the workers
+    limit = int(_TREND_TARGET_S * max(1, workers) / max(per_cell, 1e-12))
+    out["export_trend_max_cells"] = min(50_000_000, max(100_000, limit // 100_000 * 100_000))
+    return out
+
+
+def _tune_painter() -> Dict[str, Any]:
+    import render_2d
+
+    out: Dict[str, Any] = {}
+    rng = np.random.default_rng(2)
+    if render_2d.HAS_NUMBA:
+        arr = np.full((512, 512, 3), 255, dtype=np.uint8)
+        rows_i = rng.integers(0, 512, max(_PAINT_SIZES))
+        cols_i = rng.integers(0, 512, max(_PAINT_SIZES))
+        rgb = rng.integers(0, 256, (max(_PAINT_SIZES), 3)).astype(np.uint8)
+
+        def paint(n: int) -> None:
+            render_2d.paint_cells(arr, rows_i[:n], cols_i[:n], rgb[:n], 1, 1.0)
+
+        with overridden(render_backend="numba", numba_min_blocks=1):
+            paint(8)  # JIT compile
+        threshold = NEVER
+        for n in _PAINT_SIZES:
+            with overridden(render_backend="numba", numba_min_blocks=1):
+                t_numba = _best_time(lambda: paint(n))
+            with overridden(render_backend="numpy"):
+                t_loop = _best_time(lambda: paint(n))
+            if t_numba < t_loop:
+                threshold = n
+                break
+        out["numba_min_blocks"] = threshold
+    if render_2d.TORCH_CUDA:
+        # Sub-pixel blocks (the painter path) of a 1000 x 1000 grid, GPU against the CPU painter
+        grid = rng.integers(0, 256, (1000, 1000, 3)).astype(np.uint8)
+        filled = np.ones((1000, 1000), dtype=bool)
+        info = {"width": 1000, "height": 1000, "rows": 1000, "cols": 1000}
+
+        def draw() -> None:
+            render_2d.draw_grid_array(grid, filled, info, 1, scale=0.5)
+
+        with overridden(render_backend="gpu", gpu_min_blocks=1):
+            draw()
+            t_gpu = _best_time(draw)
+        with overridden(render_backend="numba" if render_2d.HAS_NUMBA else "numpy"):
+            t_cpu = _best_time(draw)
+        out["render_backend"] = "gpu" if t_gpu < t_cpu else "auto"
+    return out
+
+
+def _tune_encoder(cpus: int) -> Dict[str, Any]:
+    from png_stream import PngStreamWriter
+
+    # Blocky image (10 px cells) like an export, so deflate sees realistic input
+    rng = np.random.default_rng(3)
+    cells = rng.integers(0, 256, (_ENCODE_SIDE // 10 + 1, _ENCODE_SIDE // 10 + 1, 3)).astype(np.uint8)
+    img = np.repeat(np.repeat(cells, 10, axis=0), 10, axis=1)[:_ENCODE_SIDE, :_ENCODE_SIDE]
+    fd, path = tempfile.mkstemp(suffix=".png")
+    os.close(fd)
+
+    def encode(workers: int) -> None:
+        with PngStreamWriter(path, _ENCODE_SIDE, _ENCODE_SIDE, 6, workers=workers) as w:
+            w.write(img)
+
+    try:
+        times = {k: _best_time(lambda: encode(k), repeat=2)
+                 for k in (1, 2, 4, 8) if k <= max(1, min(cpus, _LIMITS["encode_workers"][1]))}
+    finally:
+        os.remove(path)
+    return {"encode_workers": min(times, key=times.get)}
+
+
+def autotune(progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Benchmark this machine (a few seconds) and return a profile for it.
+
+    Pool thresholds are where the measured per-item saving of parallel work pays for the
+    pool start-up; export_trend_max_cells keeps trend detection near a minute. The memory
+    budget stays 0 (70% of the RAM available at export time) and max_export_dim unchanged.
+    """
+    report = progress or (lambda msg: None)
+    cpus = multiprocessing.cpu_count() or 1
+    values = dict(active())
+    for label, step in (
+        ("tokenization", lambda: _tune_tokenize(cpus)),
+        ("trend detection", lambda: _tune_trends(cpus)),
+        ("block painter", _tune_painter),
+        ("PNG encoder", lambda: _tune_encoder(cpus)),
+    ):
+        report(f"Measuring {label}...")
+        values.update(step())
+    return normalize(values)
+
+
+def run_autotune(result_queue: Any) -> None:
+    """Process entry for the GUI: puts {"ok": True, "profile": values} or an error in result_queue."""
+    try:
+        result_queue.put({"ok": True, "profile": autotune()})
+    except Exception as e:
+        result_queue.put({"ok": False, "error": str(e)})
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Show, select or auto-tune the performance profile.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--preset", choices=sorted(PRESETS), help="make a preset the saved profile")
+    group.add_argument("--autotune", action="store_true", help="benchmark this machine and save the result")
+    parser.add_argument("--settings", default=SETTINGS_FILE, help="settings file")
+    args = parser.parse_args(argv)
+
+    entry = load(args.settings)
+    use(entry, entry["profile"])
+    if args.preset:
+        use(preset(args.preset), args.preset)
+        save(args.settings)
+    elif args.autotune:
+        use(autotune(lambda msg: print(msg, flush=True)), AUTO_TUNED)
+        save(args.settings)
+    print(json.dumps(settings_entry(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    # Run as the imported module, so the profile set here is the one render_2d and core read
+    import perf_profile
+    raise SystemExit(perf_profile.main())
@@ -0,0 +1,198 @@
+# png_stream.py - Write an RGB PNG band by band (zlib stream), so the full image is never in memory
+"""PngStreamWriter takes (rows, width, 3) uint8 bands top to bottom. Rows use the PNG "Up"
+filter (difference to the row above), which turns the repeated rows of scaled cell blocks
+into zeros, and are deflated into IDAT chunks.
+
+With workers > 1 the filtered rows are cut into pieces of about 4 MB that are deflated on a
+thread pool (zlib releases the GIL). Each piece is a raw deflate stream primed with the last
+32 KB of the previous piece (so matches across the cut are kept) and ends with a sync flush;
+the pieces are joined in order under one zlib header and Adler-32, which is still a single
+valid zlib stream. The output is a little larger than the one-compressor stream (one flush
+marker per piece) and decodes to the same pixels.
+
+With a palette (at most 256 colors) the image is written 8-bit indexed, so the deflate input
+is a third of truecolor. Bands are then either (rows, width) palette indices (from an index
+canvas, written as they are) or RGB, mapped to indices.
+"""
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_FILTER_UP = 2
+_IDAT_BYTES = 1 << 20
+_PIECE_BYTES = 4 << 20
+_WINDOW = 32768
+_MAX_PALETTE = 256
+
+
+def pack_rgb(rgb: np.ndarray) -> np.ndarray:
+    """(..., 3) uint8 -> (...) uint32 keys 0xRRGGBB."""
+    rgb = np.asarray(rgb, dtype=np.uint8)
+    key = rgb[..., 0].astype(np.uint32)
+    key <<= 8
+    key |= rgb[..., 1]
+    key <<= 8
+    key |= rgb[..., 2]
+    return key
+
+
+def _deflate_piece(data: bytes, level: int, zdict: bytes) -> bytes:
+    # Raw deflate (no zlib header/trailer) ending on a byte boundary, so pieces can be concatenated
+    z = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict) if zdict else zlib.compressobj(level, zlib.DEFLATED, -15)
+    return z.compress(data) + z.flush(zlib.Z_SYNC_FLUSH)
+
+
+def _zlib_header(level: int) -> bytes:
+    # CMF: deflate, 32 KB window; FLG: level hint, check bits so that (CMF * 256 + FLG) % 31 == 0
+    cmf = 0x78
+    flevel = 0 if level < 2 else 1 if level < 6 else 2 if level == 6 else 3
+    flg = flevel << 6
+    flg += 31 - (cmf * 256 + flg) % 31
+    return bytes([cmf, flg])
+
+
+class PngStreamWriter:
+    def __init__(self, path: str, width: int, height: int, compress_level: int = 6,
+                 palette: Optional[np.ndarray] = None, workers: int = 1):
+        """palette: optional (n <= 256, 3) uint8 colors for an indexed PNG (every pixel must be one of them).
+        workers: threads deflating in parallel (1: one streaming compressor)."""
+        self.path = path
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.level = int(compress_level)
+        self._palette: Optional[np.ndarray] = None
+        self._lut: Optional[np.ndarray] = None
+        self._pending = bytearray()
+        self._prev: Optional[np.ndarray] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._futures: deque = deque()
+        if palette is not None:
+            palette = np.ascontiguousarray(palette, dtype=np.uint8).reshape(-1, 3)
+            if not 0 < len(palette) <= _MAX_PALETTE:
+                raise ValueError(f"palette must have 1 to {_MAX_PALETTE} colors, got {len(palette)}")
+            self._palette = palette
+        self._row_bytes = width * (1 if self._palette is not None else 3)
+        self._piece_rows = max(1, _PIECE_BYTES // (self._row_bytes + 1))
+        self._f = open(path, "wb")
+        if workers > 1:
+            self._pool = ThreadPoolExecutor(max_workers=workers)
+            self._max_in_flight = 2 * workers
+            self._adler = 1
+            self._zdict = b""
+            self._pending += _zlib_header(self.level)
+        else:
+            self._z = zlib.compressobj(self.level)
+        self._f.write(_SIGNATURE)
+        # 8-bit truecolor (2) or indexed (3), deflate, adaptive filtering, no interlace
+        color_type = 3 if self._palette is not None else 2
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+        if palette is not None:
+            self._chunk(b"PLTE", palette.tobytes())
+
+    def _chunk(self, kind: bytes, data: bytes) -> None:
+        self._f.write(struct.pack(">I", len(data)))
+        self._f.write(kind)
+        self._f.write(data)
+        self._f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF))
+
+    def _flush_idat(self, final: bool = False) -> None:
+        while len(self._pending) >= _IDAT_BYTES or (final and self._pending):
+            self._chunk(b"IDAT", bytes(self._pending[:_IDAT_BYTES]))
+            del self._pending[:_IDAT_BYTES]
+
+    def _deflate(self, data: bytes) -> None:
+        if self._pool is None:
+            self._pending += self._z.compress(data)
+        else:
+            self._adler = zlib.adler32(data, self._adler)
+            self._futures.append(self._pool.submit(_deflate_piece, data, self.level, self._zdict))
+            self._zdict = data[-_WINDOW:]
+            while len(self._futures) > self._max_in_flight:
+                self._pending += self._futures.popleft().result()
+        self._flush_idat()
+
+    def _indices(self, piece: np.ndarray) -> np.ndarray:
+        if self._lut is None:
+            # RGB key -> palette index (32 MB, built once per image); _MAX_PALETTE marks colors not in it
+            self._lut = np.full(1 << 24, _MAX_PALETTE, dtype=np.uint16)
+            self._lut[pack_rgb(self._palette)] = np.arange(len(self._palette), dtype=np.uint16)
+        # Map only rows that differ from the row above (scaled cell blocks repeat rows), then expand
+        changed = np.ones(len(piece), dtype=bool)
+        changed[1:] = (piece[1:] != piece[:-1]).any(axis=(1, 2))
+        mapped = self._lut[pack_rgb(piece[changed])]
+        if mapped.max() == _MAX_PALETTE:
+            raise ValueError("image has a color that is not in the PNG palette")
+        mapped = mapped.astype(np.uint8)
+        return mapped if changed.all() else mapped[np.cumsum(changed) - 1]
+
+    def write(self, band: np.ndarray) -> None:
+        """Append rows (k, width, 3) uint8, or (k, width) palette indices for an indexed PNG."""
+        band = np.asarray(band)
+        indexed = band.ndim == 2 and self._palette is not None
+        if band.shape[1:] != ((self.width,) if indexed else (self.width, 3)):
+            raise ValueError(f"band shape {band.shape} does not match width {self.width}")
+        band = band.astype(np.uint8, copy=False)
+        k = band.shape[0]
+        if k == 0:
+            return
+        if self.rows_written + k > self.height:
+            raise ValueError("more rows than the image height")
+        for y in range(0, k, self._piece_rows):
+            piece = band[y : y + self._piece_rows]
+            if indexed:
+                rows = np.ascontiguousarray(piece)
+            elif self._palette is not None:
+                rows = self._indices(piece)
+            else:
+                rows = np.ascontiguousarray(piece).reshape(len(piece), -1)
+            prev = np.zeros((1, self._row_bytes), dtype=np.uint8) if self._prev is None else self._prev
+            out = np.empty((len(rows), self._row_bytes + 1), dtype=np.uint8)
+            out[:, 0] = _FILTER_UP
+            np.subtract(rows, np.concatenate([prev, rows[:-1]]), out=out[:, 1:])  # wraps mod 256
+            self._prev = rows[-1:].copy()
+            self._deflate(out.tobytes())
+        self.rows_written += k
+
+    def close(self) -> None:
+        if self._f.closed:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"wrote {self.rows_written} of {self.height} rows")
+            if self._pool is None:
+                self._pending += self._z.flush()
+            else:
+                while self._futures:
+                    self._pending += self._futures.popleft().result()
+                # Empty final block, then the Adler-32 of all filtered rows
+                self._pending += zlib.compressobj(self.level, zlib.DEFLATED, -15).flush()
+                self._pending += struct.pack(">I", self._adler & 0xFFFFFFFF)
+            self._flush_idat(final=True)
+            self._chunk(b"IEND", b"")
+        finally:
+            self._shutdown()
+            self._f.close()
+
+    def _shutdown(self) -> None:
+        if self._pool is not None:
+            for fut in self._futures:
+                fut.cancel()
+            self._futures.clear()
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def __enter__(self) -> "PngStreamWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._shutdown()
+            self._f.close()
@@ -1,9 +1,11 @@
 # render_2d.py - Draw pixel grid to PIL Image (numpy + optional numba/GPU)
-from typing import List, Dict, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 import numpy as np
 from PIL import Image
 
 import core
+import perf_profile
+from png_stream import pack_rgb
 
 # Optional: PyTorch GPU (RTX 5060 etc.) - use for large token counts
 try:
@@ -46,34 +48,43 @@ if HAS_NUMBA:
                     arr[py, px, 1] = g
                     arr[py, px, 2] = b
 
+    @njit(parallel=True, cache=True, fastmath=True)
+    def _fill_index_parallel(
+        arr: np.ndarray,
+        x0s: np.ndarray,
+        y0s: np.ndarray,
+        x1s: np.ndarray,
+        y1s: np.ndarray,
+        vals: np.ndarray,
+    ) -> None:
+        n = x0s.shape[0]
+        for i in prange(n):
+            v = vals[i]
+            for py in range(int(y0s[i]), int(y1s[i])):
+                arr[py, int(x0s[i]) : int(x1s[i])] = v
+
 
 def _fill_pixels_gpu(
-    h: int, w: int, valid_data: List[Tuple[int, int, int, int, int, int, int]]
+    h: int, w: int,
+    x0s: np.ndarray, y0s: np.ndarray, x1s: np.ndarray, y1s: np.ndarray, rgb: np.ndarray,
 ) -> np.ndarray:
-    """Fill canvas on GPU via scatter. valid_data: (x0, y0, x1, y1, r, g, b). Returns (h, w, 3) uint8."""
-    total_pixels = 0
-    for x0, y0, x1, y1, _r, _g, _b in valid_data:
-        total_pixels += max(0, x1 - x0) * max(0, y1 - y0)
+    """Fill canvas on GPU via scatter. Blocks are (x0, y0, x1, y1) with (n, 3) colors. Returns (h, w, 3) uint8."""
+    nx = np.maximum(0, x1s - x0s).astype(np.int64)
+    ny = np.maximum(0, y1s - y0s).astype(np.int64)
+    total_pixels = int((nx * ny).sum())
     if total_pixels == 0:
         return np.full((h, w, 3), 255, dtype=np.uint8)
     indices = np.empty(total_pixels, dtype=np.int64)
     colors = np.empty((total_pixels, 3), dtype=np.uint8)
     pos = 0
-    for x0, y0, x1, y1, r, g, b in valid_data:
-        ny, nx = y1 - y0, x1 - x0
-        if ny <= 0 or nx <= 0:
-            continue
-        yy = np.arange(y0, y1, dtype=np.int64)
-        xx = np.arange(x0, x1, dtype=np.int64)
+    for i in np.flatnonzero((nx > 0) & (ny > 0)).tolist():
+        yy = np.arange(y0s[i], y1s[i], dtype=np.int64)
+        xx = np.arange(x0s[i], x1s[i], dtype=np.int64)
         idx_2d = yy[:, None] * w + xx[None, :]
         n = idx_2d.size
         indices[pos : pos + n] = idx_2d.ravel()
-        colors[pos : pos + n, 0] = r
-        colors[pos : pos + n, 1] = g
-        colors[pos : pos + n, 2] = b
+        colors[pos : pos + n] = rgb[i]
         pos += n
-    indices = indices[:pos]
-    colors = colors[:pos]
     dev = TORCH_DEVICE
     canvas_flat = torch.full((h * w, 3), 255, dtype=torch.uint8, device=dev)
     idx = torch.from_numpy(indices).to(dev)
@@ -88,6 +99,125 @@ def hex_to_rgb_tuple(hex_color: str) -> Tuple[int, int, int]:
     return r if r else (128, 128, 128)
 
 
+def block_bounds(
+    rows_i: np.ndarray, cols_i: np.ndarray, pixel_size: int, scale: float, w: int, h: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Exact integer block bounds from (row,col) so scaled blocks tile with no gaps/lines."""
+    # Starts are clamped inside the canvas: below one pixel per cell, truncation can put the
+    # last column/row at w/h, and the +1 below would then paint past the array
+    x0s = np.minimum(w - 1, (cols_i * pixel_size * scale).astype(np.int64))
+    y0s = np.minimum(h - 1, (rows_i * pixel_size * scale).astype(np.int64))
+    x1s = np.minimum(w, ((cols_i + 1) * pixel_size * scale).astype(np.int64))
+    y1s = np.minimum(h, ((rows_i + 1) * pixel_size * scale).astype(np.int64))
+    x1s = np.where(x1s <= x0s, x0s + 1, x1s)
+    y1s = np.where(y1s <= y0s, y0s + 1, y1s)
+    return x0s, y0s, x1s, y1s
+
+
+def _use_numba(n_blocks: int) -> bool:
+    """Numba block fill for this many blocks (performance profile: backend and threshold)."""
+    backend = perf_profile.get("render_backend")
+    return HAS_NUMBA and backend in ("auto", "numba", "gpu") and n_blocks >= perf_profile.get("numba_min_blocks")
+
+
+def _use_gpu(n_blocks: int) -> bool:
+    """GPU fill: with backend "gpu" from gpu_min_blocks; with "auto" only where numba would not be used."""
+    backend = perf_profile.get("render_backend")
+    if not TORCH_CUDA or n_blocks < perf_profile.get("gpu_min_blocks"):
+        return False
+    return backend == "gpu" or (backend == "auto" and not _use_numba(n_blocks))
+
+
+def paint_cells(
+    arr: np.ndarray,
+    rows_i: np.ndarray,
+    cols_i: np.ndarray,
+    rgb: np.ndarray,
+    pixel_size: int,
+    scale: float,
+    y_offset: int = 0,
+    full_height: Optional[int] = None,
+) -> None:
+    """Paint cell blocks into an existing (h, w, 3) canvas in place (numba when worthwhile).
+
+    An (h, w) palette-index canvas takes (n,) indices in rgb instead of (n, 3) colors.
+    For a row band of a taller image, arr holds image rows [y_offset, y_offset + h) and
+    full_height is the image height; blocks are clipped to the band.
+    """
+    h, w = arr.shape[:2]
+    x0s, y0s, x1s, y1s = block_bounds(rows_i, cols_i, pixel_size, scale, w, full_height or h)
+    if y_offset or full_height:
+        y0s = np.maximum(y0s - y_offset, 0)
+        y1s = np.minimum(y1s - y_offset, h)
+        keep = y1s > y0s
+        if not keep.all():
+            x0s, y0s, x1s, y1s, rgb = x0s[keep], y0s[keep], x1s[keep], y1s[keep], rgb[keep]
+    use_numba = _use_numba(len(x0s))
+    if use_numba and arr.ndim == 2:
+        _fill_index_parallel(
+            arr, x0s.astype(np.int32), y0s.astype(np.int32), x1s.astype(np.int32), y1s.astype(np.int32),
+            np.ascontiguousarray(rgb, dtype=arr.dtype),
+        )
+        return
+    if use_numba:
+        _fill_pixels_parallel(
+            arr,
+            x0s.astype(np.int32), y0s.astype(np.int32), x1s.astype(np.int32), y1s.astype(np.int32),
+            np.ascontiguousarray(rgb[:, 0]), np.ascontiguousarray(rgb[:, 1]), np.ascontiguousarray(rgb[:, 2]),
+        )
+        return
+    if arr.ndim == 2:
+        for x0, y0, x1, y1, v in zip(x0s.tolist(), y0s.tolist(), x1s.tolist(), y1s.tolist(), rgb.tolist()):
+            arr[y0:y1, x0:x1] = v
+        return
+    for x0, y0, x1, y1, (r, g, b) in zip(x0s.tolist(), y0s.tolist(), x1s.tolist(), y1s.tolist(), rgb.tolist()):
+        arr[y0:y1, x0:x1, 0] = r
+        arr[y0:y1, x0:x1, 1] = g
+        arr[y0:y1, x0:x1, 2] = b
+
+
+# Palette-index canvases: uint8 up to 256 colors, uint16 up to MAX_INDEX_COLORS
+MAX_INDEX_COLORS = 65535
+# Image rows replicated per step when blocks are >= 1 px (BlockMaps)
+_REPLICATE_BYTES = 8 << 20
+
+
+class CanvasPalette:
+    """Palette for an index canvas: (n, 3) uint8 colors (must include white, the background)
+    and a packed-RGB -> index table (32 MB) to turn cell colors into indices."""
+
+    def __init__(self, colors: np.ndarray):
+        self.colors = np.ascontiguousarray(colors, dtype=np.uint8).reshape(-1, 3)
+        n = len(self.colors)
+        if not 0 < n <= MAX_INDEX_COLORS:
+            raise ValueError(f"canvas palette must have 1 to {MAX_INDEX_COLORS:,} colors, got {n:,}")
+        self.dtype = np.dtype(np.uint8 if n <= 256 else np.uint16)
+        self._lut = np.full(1 << 24, n, dtype=np.uint16)
+        self._lut[pack_rgb(self.colors)] = np.arange(n, dtype=np.uint16)
+        self.background = self.indices(np.array([[255, 255, 255]], dtype=np.uint8))[0]
+
+    def indices(self, rgb: np.ndarray) -> np.ndarray:
+        """(n,) palette indices of (n, 3) colors."""
+        idx = self._lut[pack_rgb(rgb)]
+        if len(idx) and int(idx.max()) == len(self.colors):
+            raise ValueError("a cell color is not in the canvas palette")
+        return idx.astype(self.dtype)
+
+    def blank(self, h: int, w: int) -> np.ndarray:
+        return np.full((h, w), self.background, dtype=self.dtype)
+
+
+_HEAT_STOPS = np.array([[0, 0, 160], [0, 200, 255], [255, 230, 0], [220, 0, 0]], dtype=np.float64)
+
+
+def heat_ramp(heat: np.ndarray) -> np.ndarray:
+    """Map heat in [0, 1] to (n, 3) uint8 colors on a blue -> cyan -> yellow -> red ramp."""
+    x = np.clip(heat, 0.0, 1.0) * (len(_HEAT_STOPS) - 1)
+    i = np.minimum(x.astype(np.int64), len(_HEAT_STOPS) - 2)
+    t = (x - i)[:, None]
+    return np.round(_HEAT_STOPS[i] * (1 - t) + _HEAT_STOPS[i + 1] * t).astype(np.uint8)
+
+
 def draw_canvas(
     pixel_positions: List[Dict],
     canvas_info: Dict,
@@ -99,66 +229,265 @@ def draw_canvas(
     highlight_color: str = "#ffff00",
     highlight_opacity: float = 0.5,
     scale: float = 1,
+    heat: Optional[np.ndarray] = None,
+    heat_opacity: float = 0.6,
 ) -> Image.Image:
-    w = max(1, int(int(canvas_info["width"]) * scale))
-    h = max(1, int(int(canvas_info["height"]) * scale))
-    if w <= 0 or h <= 0:
-        return Image.new("RGB", (1, 1), (255, 255, 255))
-
-    arr = np.full((h, w, 3), 255, dtype=np.uint8)
-    trend_set = set(trend_cells) if trend_cells else set()
-    hr, hg, hb = hex_to_rgb_tuple(highlight_color)
-
-    # Use exact integer block bounds from (row,col) so scaled blocks tile with no gaps/lines
-    def block_bounds(row: int, col: int):
-        x0 = int(col * pixel_size * scale)
-        y0 = int(row * pixel_size * scale)
-        x1 = min(w, int((col + 1) * pixel_size * scale))
-        y1 = min(h, int((row + 1) * pixel_size * scale))
-        if x1 <= x0:
-            x1 = x0 + 1
-        if y1 <= y0:
-            y1 = y0 + 1
-        return x0, y0, x1, y1
-
-    valid_data = []
+    """Draw position dicts (dict pipeline); builds the color grid and renders it with draw_grid.
+
+    heat is an optional (rows, cols) frequency heatmap in [0, 1] blended over the cells.
+    """
+    rows = max([int(canvas_info["rows"])] + [p["row"] + 1 for p in pixel_positions])
+    cols = max([int(canvas_info["cols"])] + [p["col"] + 1 for p in pixel_positions])
+    color_grid = np.full((rows, cols, 3), 255, dtype=np.uint8)
+    filled = np.zeros((rows, cols), dtype=bool)
     for p in pixel_positions:
         if not p.get("valid", True):
             continue
         color = display_color_map.get(p["token"]) or token_color_map.get(p["token"])
         if not color:
             continue
-        r, g, b = hex_to_rgb_tuple(color)
-        if highlight_trends and (p["row"], p["col"]) in trend_set:
-            r = int(r * (1 - highlight_opacity) + hr * highlight_opacity)
-            g = int(g * (1 - highlight_opacity) + hg * highlight_opacity)
-            b = int(b * (1 - highlight_opacity) + hb * highlight_opacity)
-        row, col = p["row"], p["col"]
-        x0, y0, x1, y1 = block_bounds(row, col)
-        valid_data.append((x0, y0, x1, y1, r, g, b))
-
-    if not valid_data:
-        return Image.fromarray(arr, mode="RGB")
-
-    n = len(valid_data)
-    # Prefer numba (fast, no transfer); then GPU for very large; else loop
-    use_numba = HAS_NUMBA and n >= 500
-    use_gpu = TORCH_CUDA and n >= 8000 and not use_numba
-    if use_gpu:
-        arr = _fill_pixels_gpu(h, w, valid_data)
-    elif use_numba:
-        x0s = np.array([v[0] for v in valid_data], dtype=np.int32)
-        y0s = np.array([v[1] for v in valid_data], dtype=np.int32)
-        x1s = np.array([v[2] for v in valid_data], dtype=np.int32)
-        y1s = np.array([v[3] for v in valid_data], dtype=np.int32)
-        rs = np.array([v[4] for v in valid_data], dtype=np.uint8)
-        gs = np.array([v[5] for v in valid_data], dtype=np.uint8)
-        bs = np.array([v[6] for v in valid_data], dtype=np.uint8)
-        _fill_pixels_parallel(arr, x0s, y0s, x1s, y1s, rs, gs, bs)
+        color_grid[p["row"], p["col"]] = hex_to_rgb_tuple(color)
+        filled[p["row"], p["col"]] = True
+    trend_mask = None
+    if highlight_trends and trend_cells:
+        trend_mask = np.zeros((rows, cols), dtype=bool)
+        for r, c in trend_cells:
+            if 0 <= r < rows and 0 <= c < cols:
+                trend_mask[r, c] = True
+    return draw_grid(
+        color_grid, filled, canvas_info, pixel_size,
+        trend_mask=trend_mask,
+        highlight_color=highlight_color,
+        highlight_opacity=highlight_opacity,
+        scale=scale,
+        heat=heat,
+        heat_opacity=heat_opacity,
+    )
+
+
+def _cell_colors(
+    color_grid: np.ndarray,
+    cells: np.ndarray,
+    trend_mask: Optional[np.ndarray],
+    highlight_color: str,
+    highlight_opacity: float,
+    heat: Optional[np.ndarray],
+    heat_opacity: float,
+) -> np.ndarray:
+    """(n, 3) uint8 colors of flat cells: heatmap blend first, then trend highlights."""
+    rgb = color_grid.reshape(-1, 3)[cells]
+    if heat is not None and heat_opacity > 0:
+        rgb = blend_heat(rgb, heat.ravel()[cells], heat_opacity)
+    if trend_mask is not None:
+        hit = trend_mask.ravel()[cells]
+        if hit.any():
+            rgb[hit] = blend_highlight(rgb[hit], hex_to_rgb_tuple(highlight_color), highlight_opacity)
+    return rgb
+
+
+def blend_heat(rgb: np.ndarray, heat: np.ndarray, heat_opacity: float) -> np.ndarray:
+    """(n, 3) uint8 colors with the heat ramp of heat (n,) blended over them."""
+    return (rgb * (1 - heat_opacity) + heat_ramp(heat) * heat_opacity).astype(np.uint8)
+
+
+def blend_highlight(rgb: np.ndarray, highlight_rgb: Tuple[int, int, int], highlight_opacity: float) -> np.ndarray:
+    """(n, 3) uint8 colors with the trend highlight color blended over them."""
+    return (rgb * (1 - highlight_opacity) + np.array(highlight_rgb) * highlight_opacity).astype(np.uint8)
+
+
+class BlockMaps:
+    """Source grid row of each output row and grid column of each output column, for blocks of
+    at least one pixel (they then tile the image exactly, each pixel belongs to one cell).
+
+    col_repeat is the block width when it is the same integer for every column (the columns
+    are then np.repeat of the cells), else 0 and the columns are gathered through col_map.
+    """
+
+    def __init__(self, rows: int, cols: int, pixel_size: int, scale: float, w: int, h: int):
+        # Same starts as block_bounds (same operation order, so fractional scales round alike)
+        ys = (np.arange(rows, dtype=np.int64) * pixel_size * scale).astype(np.int64)
+        xs = (np.arange(cols, dtype=np.int64) * pixel_size * scale).astype(np.int64)
+        self.row_map = (np.searchsorted(ys, np.arange(h), side="right") - 1).astype(np.intp)
+        self.col_map = (np.searchsorted(xs, np.arange(w), side="right") - 1).astype(np.intp)
+        k = w // cols if cols else 0
+        self.col_repeat = k if k and k * cols == w and np.array_equal(xs, np.arange(cols) * k) else 0
+
+    @staticmethod
+    def applies(pixel_size: int, scale: float) -> bool:
+        return pixel_size * scale >= 1
+
+
+def _fill_replicated(
+    out: np.ndarray,
+    y0: int,
+    maps: BlockMaps,
+    color_grid: np.ndarray,
+    filled: np.ndarray,
+    palette: Optional["CanvasPalette"],
+    blend: Dict,
+) -> None:
+    """Fill image rows [y0, y0 + len(out)) from the grid rows they show: final cell colors
+    (or palette indices) per grid row, replicated across and down by the block maps."""
+    cols = color_grid.shape[1]
+    ys = maps.row_map[y0 : y0 + len(out)]
+    r0, r1 = int(ys[0]), int(ys[-1]) + 1
+    cells = np.flatnonzero(filled[r0:r1]) + r0 * cols
+    if palette is None:
+        sub = np.full(((r1 - r0) * cols, 3), 255, dtype=np.uint8)
     else:
-        for x0, y0, x1, y1, r, g, b in valid_data:
-            arr[y0:y1, x0:x1, 0] = r
-            arr[y0:y1, x0:x1, 1] = g
-            arr[y0:y1, x0:x1, 2] = b
+        sub = np.full((r1 - r0) * cols, palette.background, dtype=palette.dtype)
+    if len(cells):
+        rgb = _cell_colors(color_grid, cells, **blend)
+        sub[cells - r0 * cols] = rgb if palette is None else palette.indices(rgb)
+    sub = sub.reshape((r1 - r0, cols) + sub.shape[1:])
+    if maps.col_repeat:
+        lines = np.repeat(sub, maps.col_repeat, axis=1)
+    else:
+        lines = np.take(sub, maps.col_map, axis=1)
+    # ys is non-decreasing and covers r0..r1-1: copy each grid row's image line down its run
+    starts = np.flatnonzero(np.diff(ys, prepend=r0 - 1)).tolist() + [len(ys)]
+    for i in range(len(starts) - 1):
+        out[starts[i] : starts[i + 1]] = lines[i]
+
+
+def draw_grid(
+    color_grid: np.ndarray,
+    filled: np.ndarray,
+    canvas_info: Dict,
+    pixel_size: int,
+    trend_mask: Optional[np.ndarray] = None,
+    highlight_color: str = "#ffff00",
+    highlight_opacity: float = 0.5,
+    scale: float = 1,
+    heat: Optional[np.ndarray] = None,
+    heat_opacity: float = 0.6,
+) -> Image.Image:
+    """Draw a dense (rows, cols, 3) color grid; only cells set in filled are painted.
 
+    heat (rows, cols) in [0, 1] blends a frequency heatmap over the token colors; trend
+    highlights are applied on top of it.
+    """
+    arr = draw_grid_array(
+        color_grid, filled, canvas_info, pixel_size, trend_mask, highlight_color, highlight_opacity,
+        scale, heat, heat_opacity,
+    )
     return Image.fromarray(arr, mode="RGB")
+
+
+def draw_grid_array(
+    color_grid: np.ndarray,
+    filled: np.ndarray,
+    canvas_info: Dict,
+    pixel_size: int,
+    trend_mask: Optional[np.ndarray] = None,
+    highlight_color: str = "#ffff00",
+    highlight_opacity: float = 0.5,
+    scale: float = 1,
+    heat: Optional[np.ndarray] = None,
+    heat_opacity: float = 0.6,
+    palette: Optional[CanvasPalette] = None,
+) -> np.ndarray:
+    """draw_grid as an (h, w, 3) uint8 array (for encoders that take pixels directly).
+
+    With a palette holding every drawn color, returns an (h, w) palette-index canvas instead
+    (uint8 or uint16: 1/3 or 2/3 of the RGB memory).
+    """
+    w = max(1, int(int(canvas_info["width"]) * scale))
+    h = max(1, int(int(canvas_info["height"]) * scale))
+
+    if BlockMaps.applies(pixel_size, scale):
+        # Blocks of >= 1 px: replicate grid rows into the image a few MB at a time
+        maps = BlockMaps(color_grid.shape[0], color_grid.shape[1], pixel_size, scale, w, h)
+        arr = np.empty((h, w, 3), dtype=np.uint8) if palette is None else np.empty((h, w), dtype=palette.dtype)
+        blend = dict(trend_mask=trend_mask, highlight_color=highlight_color, highlight_opacity=highlight_opacity,
+                     heat=heat, heat_opacity=heat_opacity)
+        step = max(1, _REPLICATE_BYTES // max(1, arr[0].nbytes))
+        for y0 in range(0, h, step):
+            _fill_replicated(arr[y0 : y0 + step], y0, maps, color_grid, filled, palette, blend)
+        return arr
+
+    arr = np.full((h, w, 3), 255, dtype=np.uint8) if palette is None else palette.blank(h, w)
+    cells = np.flatnonzero(filled)
+    if len(cells) == 0:
+        return arr
+    rows_i, cols_i = np.divmod(cells, color_grid.shape[1])
+    rgb = _cell_colors(
+        color_grid, cells, trend_mask, highlight_color, highlight_opacity, heat, heat_opacity
+    )
+    if palette is not None:
+        paint_cells(arr, rows_i, cols_i, palette.indices(rgb), pixel_size, scale)
+        return arr
+
+    # Prefer numba (fast, no transfer); then GPU for very large; else loop (see the performance profile)
+    if _use_gpu(len(cells)):
+        x0s, y0s, x1s, y1s = block_bounds(rows_i, cols_i, pixel_size, scale, w, h)
+        arr = _fill_pixels_gpu(h, w, x0s, y0s, x1s, y1s, rgb)
+    else:
+        paint_cells(arr, rows_i, cols_i, rgb, pixel_size, scale)
+    return arr
+
+
+def iter_grid_bands(
+    color_grid: np.ndarray,
+    filled: np.ndarray,
+    canvas_info: Dict,
+    pixel_size: int,
+    band_rows: int,
+    trend_mask: Optional[np.ndarray] = None,
+    highlight_color: str = "#ffff00",
+    highlight_opacity: float = 0.5,
+    scale: float = 1,
+    heat: Optional[np.ndarray] = None,
+    heat_opacity: float = 0.6,
+    palette: Optional[CanvasPalette] = None,
+) -> Iterator[np.ndarray]:
+    """Same pixels as draw_grid, yielded as (band_rows, w, 3) row bands from the top (last may be shorter).
+
+    Each band paints only the grid rows it overlaps, so memory is one band, not the canvas.
+    With a palette the bands are (band_rows, w) palette indices (see draw_grid_array).
+    """
+    w = max(1, int(int(canvas_info["width"]) * scale))
+    h = max(1, int(int(canvas_info["height"]) * scale))
+    cols = color_grid.shape[1]
+    step = pixel_size * scale
+    band_rows = max(1, band_rows)
+    if BlockMaps.applies(pixel_size, scale):
+        maps = BlockMaps(color_grid.shape[0], cols, pixel_size, scale, w, h)
+        blend = dict(trend_mask=trend_mask, highlight_color=highlight_color, highlight_opacity=highlight_opacity,
+                     heat=heat, heat_opacity=heat_opacity)
+        for y0 in range(0, h, band_rows):
+            y1 = min(h, y0 + band_rows)
+            band = np.empty((y1 - y0, w, 3), dtype=np.uint8) if palette is None else np.empty((y1 - y0, w), dtype=palette.dtype)
+            _fill_replicated(band, y0, maps, color_grid, filled, palette, blend)
+            yield band
+        return
+    for y0 in range(0, h, band_rows):
+        y1 = min(h, y0 + band_rows)
+        band = np.full((y1 - y0, w, 3), 255, dtype=np.uint8) if palette is None else palette.blank(y1 - y0, w)
+        # Grid rows whose blocks may overlap [y0, y1) (block_bounds truncates, so widen by one)
+        r0 = max(0, int(y0 // step) - 1)
+        r1 = min(filled.shape[0], int(y1 // step) + 2)
+        cells = np.flatnonzero(filled[r0:r1]) + r0 * cols
+        if len(cells):
+            rows_i, cols_i = np.divmod(cells, cols)
+            rgb = _cell_colors(
+                color_grid, cells, trend_mask, highlight_color, highlight_opacity, heat, heat_opacity
+            )
+            if palette is not None:
+                rgb = palette.indices(rgb)
+            paint_cells(band, rows_i, cols_i, rgb, pixel_size, scale, y_offset=y0, full_height=h)
+        yield band
+
+
+def compose_side_by_side(images: List[Image.Image], gap: int = 8, background=(255, 255, 255)) -> Image.Image:
+    """Paste images left to right (top-aligned) with gap pixels between them."""
+    if not images:
+        return Image.new("RGB", (1, 1), background)
+    width = sum(im.width for im in images) + gap * (len(images) - 1)
+    height = max(im.height for im in images)
+    out = Image.new("RGB", (max(1, width), max(1, height)), background)
+    x = 0
+    for im in images:
+        out.paste(im, (x, 0))
+        x += im.width + gap
+    return out
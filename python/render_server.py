@@ -0,0 +1,501 @@
+# render_server.py - Local HTTP render service: export pipeline behind a process pool, with a disk result cache
+"""Other tools get token maps from this service instead of driving the GUI.
+
+    python render_server.py --port 8765 --workers 2 --cache-mb 2048
+
+Endpoints (JSON errors are {"ok": false, "error": ...}):
+
+    POST /render            body {"text": ...} or {"path": ...}, plus optional
+                            "options" (export options, see render_spec.DEFAULT_OPTIONS)
+                            and "format" ("png", "webp", "ppm", "spec" or "trends":
+                            trend analytics JSON, no image); returns the file
+    GET  /result/<key>.<ext> a cached result by key (X-Render-Key of an earlier response)
+    GET  /metrics           counters, cache size, latency percentiles, throughput
+    GET  /health            {"ok": true}
+
+Results are content-addressed: the key hashes the text (or the file's bytes), the format
+and the options, and results are kept as files in the cache directory, least recently
+used evicted past the size limit. Equal requests that arrive while one is rendering wait
+for that render instead of starting another. Renders in random color mode or random
+arrangement without a "seed" are not cached (the output is not a function of the input).
+Responses carry X-Cache: hit, miss, coalesced or bypass.
+
+The server binds to 127.0.0.1 by default; "path" requests read any file the user can read.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from job_queue import DEFAULT_MAX_CONCURRENT
+import perf_profile
+from render_spec import DEFAULT_OPTIONS
+
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_MB = 2048
+DEFAULT_MAX_BODY_MB = 512
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "render_cache")
+PALETTE_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "token_color_palette_cache.sqlite")
+# format -> (content type, file extension)
+FORMATS = {
+    "png": ("image/png", ".png"),
+    "webp": ("image/webp", ".webp"),
+    "ppm": ("image/x-portable-pixmap", ".ppm"),
+    "spec": ("application/octet-stream", ".tcrs"),
+    "trends": ("application/json", ".json"),
+}
+# Options that do not change the output (excluded from the cache key)
+_RUNTIME_OPTION_KEYS = (
+    "palette_cache_path", "palette_cache_max_entries", "memory_budget_mb", "write_stats",
+    "out_of_core", "out_of_core_dir", "encode_workers", "index_canvas",
+)
+_HASH_CHUNK = 1 << 20
+_LATENCY_WINDOW = 1000
+_THROUGHPUT_WINDOW_S = 60.0
+
+
+def render_job(fmt: str, payload: Any, opts: Dict[str, Any], path: str) -> Dict[str, Any]:
+    """Runs in a pool process: render payload (text or {"path": ...}) to path."""
+    from export_worker import build_render_spec, export_image, export_trends
+
+    if fmt == "spec":
+        return build_render_spec(payload, opts, path)
+    if fmt == "trends":
+        return export_trends(payload, opts, path)
+    return export_image(payload, opts, path)
+
+
+def request_options(options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """DEFAULT_OPTIONS updated with the request's options (no stats sidecar)."""
+    opts = dict(DEFAULT_OPTIONS)
+    opts.update(options or {})
+    opts["write_stats"] = False
+    opts.setdefault("palette_cache_path", PALETTE_CACHE_FILE)
+    return opts
+
+
+def is_deterministic(opts: Dict[str, Any]) -> bool:
+    """False when the output depends on a fresh random seed."""
+    uses_seed = opts.get("current_mode") == "random" or opts.get("arrangement_pattern") == "random"
+    return opts.get("seed") is not None or not uses_seed
+
+
+def result_key(fmt: str, payload: Any, opts: Dict[str, Any]) -> str:
+    """Content hash of (format, options, text or file bytes)."""
+    h = hashlib.blake2b(digest_size=20)
+    key_opts = {k: v for k, v in opts.items() if k not in _RUNTIME_OPTION_KEYS}
+    mapping = key_opts.get("mapping_path")
+    if mapping and os.path.isfile(mapping):
+        st = os.stat(mapping)
+        key_opts["mapping_path"] = [os.path.abspath(mapping), st.st_size, st.st_mtime_ns]
+    # Profile limits that change the image (side limit, trend cell limit) belong to the key too
+    key_opts["_profile"] = perf_profile.output_key()
+    h.update(fmt.encode("ascii"))
+    h.update(json.dumps(key_opts, sort_keys=True, default=str).encode("utf-8"))
+    if isinstance(payload, dict):
+        with open(payload["path"], "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+                h.update(chunk)
+    else:
+        h.update(payload.encode("utf-8", errors="replace"))
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Result files named <key><ext> in one directory, least recently used evicted past max_bytes."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max(1, int(max_bytes))
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # name -> size, oldest first
+        self._bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith("."):
+                _remove(path)  # partial render from an earlier run
+            elif os.path.isfile(path):
+                st = os.stat(path)
+                found.append((st.st_mtime, name, st.st_size))
+        for _mtime, name, size in sorted(found):
+            self._entries[name] = size
+            self._bytes += size
+        with self._lock:
+            self._evict(None)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def part_path(self, name: str) -> str:
+        """Where a render of name is written before it is added (keeps the extension for PIL)."""
+        return os.path.join(self.directory, "." + name)
+
+    def open(self, name: str) -> Optional[Tuple[Any, int]]:
+        """(file, size) for a cached entry, marked as recently used; None if absent.
+
+        The file is opened under the lock, so a concurrent eviction cannot remove it first.
+        """
+        with self._lock:
+            if name not in self._entries:
+                return None
+            path = self.path(name)
+            try:
+                f = open(path, "rb")
+            except OSError:
+                self._bytes -= self._entries.pop(name)
+                return None
+            self._entries.move_to_end(name)
+            try:
+                os.utime(path)  # LRU order survives restarts
+            except OSError:
+                pass
+            return f, self._entries[name]
+
+    def add(self, name: str, src: str) -> None:
+        """Move a finished render into the cache and evict older entries past the limit."""
+        dst = self.path(name)
+        with self._lock:
+            os.replace(src, dst)
+            self._bytes -= self._entries.pop(name, 0)
+            self._entries[name] = os.path.getsize(dst)
+            self._bytes += self._entries[name]
+            self._evict(name)
+
+    def _evict(self, keep: Optional[str]) -> None:
+        while self._bytes > self.max_bytes and len(self._entries) > (1 if keep else 0):
+            name, size = next(iter(self._entries.items()))
+            if name == keep:
+                self._entries.move_to_end(name)
+                continue
+            del self._entries[name]
+            self._bytes -= size
+            _remove(self.path(name))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    v = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(v[min(len(v) - 1, int(q * len(v)))], 4)
+
+    return {
+        "count": len(v), "mean": round(sum(v) / len(v), 4),
+        "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(v[-1], 4),
+    }
+
+
+class Metrics:
+    """Request counters plus latency samples (last 1000) and completion times for throughput."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.counters = {k: 0 for k in ("requests", "hit", "miss", "coalesced", "bypass", "errors")}
+        self._request_s: deque = deque(maxlen=_LATENCY_WINDOW)
+        self._render_s: deque = deque(maxlen=_LATENCY_WINDOW)
+        self._done_at: deque = deque()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def request_done(self, seconds: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._request_s.append(seconds)
+            self._done_at.append(now)
+            while self._done_at and self._done_at[0] < now - _THROUGHPUT_WINDOW_S:
+                self._done_at.popleft()
+
+    def render_done(self, seconds: float) -> None:
+        with self._lock:
+            self._render_s.append(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            recent = sum(1 for t in self._done_at if t >= now - _THROUGHPUT_WINDOW_S)
+            counters = dict(self.counters)
+            lookups = counters["hit"] + counters["miss"] + counters["coalesced"]
+            return {
+                "uptime_s": round(now - self.started, 1),
+                **counters,
+                "hit_rate": round((counters["hit"] + counters["coalesced"]) / lookups, 4) if lookups else 0.0,
+                "throughput_rps": round(recent / min(_THROUGHPUT_WINDOW_S, max(1e-9, now - self.started)), 3),
+                "request_latency_s": _percentiles(list(self._request_s)),
+                "render_latency_s": _percentiles(list(self._render_s)),
+            }
+
+
+class RenderService:
+    """Process pool, result cache and in-flight table shared by all request threads."""
+
+    def __init__(self, cache_dir: str = CACHE_DIR, cache_bytes: int = DEFAULT_CACHE_MB * 1024 * 1024,
+                 workers: int = DEFAULT_MAX_CONCURRENT):
+        self.cache = ResultCache(cache_dir, cache_bytes)
+        self.metrics = Metrics()
+        self.workers = max(1, workers)
+        # spawn: worker processes must not be forked from the server's request threads
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+
+    def render(self, fmt: str, payload: Any, options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Cached or fresh result: {"ok", "status", "file", "size", "name", "key", "content_type", ...}.
+
+        "file" is an open file for the response body; the caller closes it (and, for
+        uncached results, removes "temp_path").
+        """
+        if fmt not in FORMATS:
+            return {"ok": False, "status": 400, "error": f"Unknown format {fmt!r} (use {', '.join(FORMATS)})."}
+        opts = request_options(options)
+        content_type, ext = FORMATS[fmt]
+        if not is_deterministic(opts):
+            return self._render_uncached(fmt, payload, opts, content_type, ext)
+        key = result_key(fmt, payload, opts)
+        name = key + ext
+        with self._lock:
+            entry = self.cache.open(name)
+            done = self._inflight.get(name)
+            leader = entry is None and done is None
+            if leader:
+                done = self._inflight[name] = Future()
+        if entry is not None:
+            self.metrics.count("hit")
+            return self._response(name, key, content_type, entry, "hit")
+        if not leader:
+            self.metrics.count("coalesced")
+            result = done.result()
+            if not result.get("ok"):
+                return dict(result)
+            entry = self.cache.open(name)
+            if entry is None:
+                return {"ok": False, "status": 503, "error": "Result was evicted from the cache; retry."}
+            return self._response(name, key, content_type, entry, "coalesced", result)
+
+        self.metrics.count("miss")
+        part = self.cache.part_path(name)
+        try:
+            result = self._run(fmt, payload, opts, part)
+            if result.get("ok"):
+                self.cache.add(name, part)
+        except Exception as e:
+            result = {"ok": False, "status": 500, "error": str(e)}
+        finally:
+            _remove(part)
+            with self._lock:
+                del self._inflight[name]
+            done.set_result(result)
+        if not result.get("ok"):
+            return result
+        entry = self.cache.open(name)
+        if entry is None:
+            return {"ok": False, "status": 503, "error": "Result was evicted from the cache; retry."}
+        return self._response(name, key, content_type, entry, "miss", result)
+
+    def _render_uncached(self, fmt: str, payload: Any, opts: Dict[str, Any], content_type: str,
+                         ext: str) -> Dict[str, Any]:
+        self.metrics.count("bypass")
+        fd, tmp = tempfile.mkstemp(suffix=ext, prefix=".", dir=self.cache.directory)
+        os.close(fd)
+        try:
+            result = self._run(fmt, payload, opts, tmp)
+            if not result.get("ok"):
+                _remove(tmp)
+                return result
+            f = open(tmp, "rb")
+        except Exception as e:
+            _remove(tmp)
+            return {"ok": False, "status": 500, "error": str(e)}
+        out = self._response(os.path.basename(tmp), "", content_type, (f, os.path.getsize(tmp)), "bypass", result)
+        out["temp_path"] = tmp
+        return out
+
+    def _run(self, fmt: str, payload: Any, opts: Dict[str, Any], path: str) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        result = self.pool.submit(render_job, fmt, payload, opts, path).result()
+        self.metrics.render_done(time.perf_counter() - t0)
+        if not result.get("ok"):
+            result.setdefault("status", 422)
+        return result
+
+    def open_result(self, name: str) -> Optional[Dict[str, Any]]:
+        """A cached result by file name (<key><ext>), or None."""
+        for content_type, ext in FORMATS.values():
+            if name.endswith(ext):
+                entry = self.cache.open(name)
+                if entry is not None:
+                    return self._response(name, name[: -len(ext)], content_type, entry, "hit")
+        return None
+
+    @staticmethod
+    def _response(name: str, key: str, content_type: str, entry: Tuple[Any, int], cache: str,
+                  result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        f, size = entry
+        out = {"ok": True, "status": 200, "name": name, "key": key, "content_type": content_type,
+               "file": f, "size": size, "cache": cache}
+        if result is not None:
+            out["seed"] = result.get("seed")
+        return out
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        snap = self.metrics.snapshot()
+        with self._lock:
+            snap["in_flight"] = len(self._inflight)
+        snap["workers"] = self.workers
+        snap["cache"] = self.cache.stats()
+        return snap
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    server_version = "TokenColorMapperRender/1"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self) -> RenderService:
+        return self.server.service
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, obj: Dict[str, Any]) -> None:
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_result(self, out: Dict[str, Any]) -> None:
+        if not out.get("ok"):
+            self.service.metrics.count("errors")
+            self._send_json(out.pop("status", 500), {"ok": False, "error": out.get("error", "Unknown error")})
+            return
+        f = out["file"]
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", out["content_type"])
+            self.send_header("Content-Length", str(out["size"]))
+            self.send_header("X-Cache", out["cache"])
+            if out["key"]:
+                self.send_header("X-Render-Key", out["name"])
+            if out.get("seed") is not None:
+                self.send_header("X-Seed", str(out["seed"]))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, _HASH_CHUNK)
+        finally:
+            f.close()
+            if out.get("temp_path"):
+                _remove(out["temp_path"])
+
+    def do_GET(self) -> None:
+        path = self.path.split("?", 1)[0]
+        if path == "/health":
+            self._send_json(200, {"ok": True})
+        elif path == "/metrics":
+            self._send_json(200, self.service.metrics_snapshot())
+        elif path.startswith("/result/"):
+            out = self.service.open_result(os.path.basename(path[len("/result/"):]))
+            if out is None:
+                self._send_json(404, {"ok": False, "error": "Not in cache."})
+            else:
+                self._send_result(out)
+        else:
+            self._send_json(404, {"ok": False, "error": "Unknown endpoint."})
+
+    def do_POST(self) -> None:
+        if self.path.split("?", 1)[0] != "/render":
+            self._send_json(404, {"ok": False, "error": "Unknown endpoint."})
+            return
+        t0 = time.perf_counter()
+        self.service.metrics.count("requests")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > self.server.max_body_bytes:
+                self.close_connection = True
+                raise ValueError(f"Request body over {self.server.max_body_bytes // (1024 * 1024)} MB.")
+            req = json.loads(self.rfile.read(length) or b"{}")
+            if "text" in req:
+                payload: Any = str(req["text"])
+            elif "path" in req:
+                if not os.path.isfile(req["path"]):
+                    raise ValueError(f"No such file: {req['path']}")
+                payload = {"path": os.path.abspath(req["path"])}
+            else:
+                raise ValueError('Request needs "text" or "path".')
+            options = req.get("options") or {}
+            if not isinstance(options, dict):
+                raise ValueError('"options" must be an object.')
+        except ValueError as e:
+            self.service.metrics.count("errors")
+            self._send_json(400, {"ok": False, "error": str(e)})
+            return
+        self._send_result(self.service.render(str(req.get("format", "png")), payload, options))
+        self.service.metrics.request_done(time.perf_counter() - t0)
+
+
+def make_server(service: RenderService, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                max_body_bytes: int = DEFAULT_MAX_BODY_MB * 1024 * 1024, quiet: bool = False) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.max_body_bytes = max_body_bytes
+    server.quiet = quiet
+    return server
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Local HTTP render service for token color maps.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_CONCURRENT, help="render processes")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--cache-mb", type=int, default=DEFAULT_CACHE_MB, help="result cache size limit")
+    parser.add_argument("--max-body-mb", type=int, default=DEFAULT_MAX_BODY_MB)
+    parser.add_argument("--quiet", action="store_true", help="no per-request log lines")
+    args = parser.parse_args(argv)
+
+    service = RenderService(args.cache_dir, args.cache_mb * 1024 * 1024, args.workers)
+    server = make_server(service, args.host, args.port, args.max_body_mb * 1024 * 1024, args.quiet)
+    print(f"Render server on http://{args.host}:{server.server_address[1]} "
+          f"({service.workers} workers, cache {args.cache_dir})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
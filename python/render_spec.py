@@ -0,0 +1,169 @@
+# render_spec.py - Compact binary render spec (palette + cell grid) for other front ends (Electron app)
+"""A render spec is everything needed to paint a map: the canvas geometry, a uint8 RGB
+palette and one uint32 palette index per grid cell. Colors are final (similarity emphasis,
+heatmap and trend highlights applied), so a consumer only blits blocks.
+
+Layout (little endian), extension .tcrs:
+
+    header   48 bytes
+      0   4s   magic b"TCRS"
+      4   u16  version (1)
+      6   u16  header size (48)
+      8   u32  cols            12  u32  rows
+      16  u32  pixel_size      20  u32  width (px at scale 1)
+      24  u32  height          28  u32  palette entries P
+      32  u32  filled cells    36  u32  flags (1 = trend highlights, 2 = heatmap)
+      40  u32  background 0x00RRGGBB
+      44  u32  reserved
+    palette  u8[P, 3], zero-padded to a multiple of 4 bytes
+    grid     u32[rows * cols], row-major; EMPTY_CELL for cells without a token
+
+Palette entries 0..V-1 are the token colors by token ID; with trend highlights, entry V + i
+is the highlighted color of token i. Run as a script to build a spec from a text file:
+
+    python render_spec.py input.txt output.tcrs --options '{"pixel_size": 2}'
+"""
+import argparse
+import json
+import struct
+import sys
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from render_2d import blend_heat, blend_highlight
+
+MAGIC = b"TCRS"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHIIIIIIIIII")
+EMPTY_CELL = 0xFFFFFFFF
+FLAG_TRENDS = 1
+FLAG_HEATMAP = 2
+BACKGROUND = 0xFFFFFF
+
+# Options a caller may leave out (the Electron app sends only what it has controls for)
+DEFAULT_OPTIONS: Dict[str, Any] = {
+    "pixel_size": 10,
+    "current_mode": "standard",
+    "canvas_shape": "square",
+    "arrangement_pattern": "row-major",
+    "tokenize_mode": "words",
+    "custom_separator": ",",
+    "emphasize_similarity": False,
+    "similarity_threshold": 50,
+    "highlight_trends": False,
+    "trend_horizontal": True,
+    "trend_vertical": True,
+    "trend_diagonal": True,
+    "trend_min_length": 3,
+    "trend_similarity": 30,
+    "trend_opacity": 50,
+    "highlight_color_hex": "#ffff00",
+    "seed": None,
+    "export_scale": 1,
+}
+
+
+def spec_palette_and_grid(
+    ids: np.ndarray,
+    cells: np.ndarray,
+    display: np.ndarray,
+    rows: int,
+    cols: int,
+    trend_mask: Optional[np.ndarray] = None,
+    highlight_rgb: Tuple[int, int, int] = (255, 255, 0),
+    highlight_opacity: float = 0.5,
+    token_heat: Optional[np.ndarray] = None,
+    heat_opacity: float = 0.6,
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Palette (P, 3) uint8, grid (rows * cols,) uint32 and flags for a laid-out token stream.
+
+    Blending matches render_2d.draw_grid (heatmap, then highlights), but is done once per
+    palette entry instead of once per cell. token_heat is per token ID in [0, 1].
+    """
+    palette = np.asarray(display, dtype=np.uint8)
+    flags = 0
+    if token_heat is not None and heat_opacity > 0:
+        palette = blend_heat(palette, np.asarray(token_heat), heat_opacity)
+        flags |= FLAG_HEATMAP
+    grid = np.full(rows * cols, EMPTY_CELL, dtype=np.uint32)
+    placed = ids[: len(cells)].astype(np.uint32)
+    if trend_mask is not None:
+        hit = trend_mask.ravel()[cells]
+        if hit.any():
+            palette = np.concatenate([palette, blend_highlight(palette, highlight_rgb, highlight_opacity)])
+            placed = placed + hit.astype(np.uint32) * np.uint32(len(display))
+            flags |= FLAG_TRENDS
+    grid[cells] = placed
+    return palette, grid, flags
+
+
+def write_render_spec(
+    path: str, palette: np.ndarray, grid: np.ndarray, canvas_info: Dict[str, Any], pixel_size: int, flags: int = 0,
+) -> int:
+    """Write a spec file; returns its size in bytes."""
+    rows, cols = int(canvas_info["rows"]), int(canvas_info["cols"])
+    if grid.size != rows * cols:
+        raise ValueError(f"grid has {grid.size} cells, canvas has {rows * cols}")
+    palette = np.ascontiguousarray(palette, dtype=np.uint8).reshape(-1, 3)
+    filled = int(np.count_nonzero(grid != EMPTY_CELL))
+    header = _HEADER.pack(
+        MAGIC, VERSION, _HEADER.size, cols, rows, pixel_size,
+        int(canvas_info["width"]), int(canvas_info["height"]),
+        len(palette), filled, flags, BACKGROUND, 0,
+    )
+    pad = -palette.nbytes % 4
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(palette.tobytes())
+        f.write(b"\0" * pad)
+        np.ascontiguousarray(grid, dtype="<u4").tofile(f)
+    return _HEADER.size + palette.nbytes + pad + grid.size * 4
+
+
+def read_render_spec(path: str, mmap: bool = True) -> Dict[str, Any]:
+    """Header fields plus palette (P, 3) and grid (rows, cols) arrays (grid memory-mapped by default)."""
+    with open(path, "rb") as f:
+        raw = f.read(_HEADER.size)
+    if len(raw) < _HEADER.size:
+        raise ValueError("Not a render spec file (too short).")
+    (magic, version, header_size, cols, rows, pixel_size, width, height,
+     n_palette, filled, flags, background, _reserved) = _HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ValueError("Not a render spec file (bad magic).")
+    if version != VERSION:
+        raise ValueError(f"Unsupported render spec version {version}.")
+    palette = np.fromfile(path, dtype=np.uint8, count=n_palette * 3, offset=header_size).reshape(-1, 3)
+    grid_offset = header_size + n_palette * 3 + (-(n_palette * 3) % 4)
+    if mmap:
+        grid = np.memmap(path, dtype="<u4", mode="r", offset=grid_offset, shape=(rows, cols))
+    else:
+        grid = np.fromfile(path, dtype="<u4", count=rows * cols, offset=grid_offset).reshape(rows, cols)
+    return {
+        "cols": cols, "rows": rows, "pixel_size": pixel_size, "width": width, "height": height,
+        "filled": filled, "flags": flags, "background": background, "palette": palette, "grid": grid,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build a binary render spec (.tcrs) from a text file.")
+    parser.add_argument("input", help="UTF-8 text file ('-' reads stdin)")
+    parser.add_argument("output", help="spec file to write")
+    parser.add_argument("--options", default="{}", help="JSON export options (see DEFAULT_OPTIONS)")
+    args = parser.parse_args(argv)
+    from export_worker import build_render_spec, read_text_file
+
+    opts = dict(DEFAULT_OPTIONS)
+    opts.update(json.loads(args.options))
+    try:
+        text = sys.stdin.read() if args.input == "-" else read_text_file(args.input)
+        result = build_render_spec(text, opts, args.output)
+    except Exception as e:
+        result = {"ok": False, "error": str(e)}
+    # One JSON line on stdout for the caller (the Electron main process)
+    print(json.dumps(result))
+    return 0 if result.get("ok") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# test_job_queue.py - Coalescing, memory admission and batching of the export job queue
+import os
+import time
+
+from job_queue import DONE, QUEUED, RUNNING, ExportJobQueue
+
+
+def fake_export(text, opts, path, result_queue):
+    """Stand-in for an image worker: writes the output and a stats sidecar."""
+    time.sleep(opts.get("sleep", 0))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    stats_path = os.path.splitext(path)[0] + ".stats.json"
+    with open(stats_path, "w", encoding="utf-8") as f:
+        f.write('{"tokens": %d}' % len(text.split()))
+    result_queue.put({"ok": True, "path": path, "stats_path": stats_path, "trends_path": None})
+
+
+def fake_batch(text, variants, result_queue):
+    """Stand-in for run_export_batch: reports the variants in reverse order, tagged by index."""
+    for index in reversed(range(len(variants))):
+        opts, path = variants[index]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"{text}:{opts['export_scale']}")
+        result_queue.put({"ok": True, "path": path, "index": index})
+
+
+def run_until_idle(queue, timeout=30.0):
+    finished = []
+    deadline = time.monotonic() + timeout
+    while queue.active():
+        assert time.monotonic() < deadline, "jobs did not finish"
+        finished += queue.poll()
+        time.sleep(0.02)
+    return finished
+
+
+def test_duplicate_submit_becomes_follower(tmp_path):
+    queue = ExportJobQueue()
+    first = queue.submit("image", fake_export, "a b c", {"export_scale": 1}, str(tmp_path / "a.png"))
+    second = queue.submit("image", fake_export, "a b c", {"export_scale": 1}, str(tmp_path / "b.png"))
+    other = queue.submit("image", fake_export, "a b c", {"export_scale": 2}, str(tmp_path / "c.png"))
+    assert first.followers == [second]
+    assert second.status == QUEUED and second.payload is None
+    assert second.message == f"same as job {first.id}"
+    assert other.followers == [] and other not in first.followers
+    unique = queue.submit("image", fake_export, "a b c", {"export_scale": 1}, str(tmp_path / "d.png"), coalesce=False)
+    assert unique not in first.followers
+
+
+def test_follower_gets_a_copy_with_sidecars(tmp_path):
+    queue = ExportJobQueue()
+    first = queue.submit("image", fake_export, "a b c", {}, str(tmp_path / "a.png"))
+    second = queue.submit("image", fake_export, "a b c", {}, str(tmp_path / "b.png"))
+    finished = run_until_idle(queue)
+    assert {j.id for j in finished} == {first.id, second.id}
+    assert first.status == second.status == DONE
+    assert second.result["path"] == str(tmp_path / "b.png")
+    assert second.result["stats_path"] == str(tmp_path / "b.stats.json")
+    assert second.result["trends_path"] is None
+    assert (tmp_path / "b.png").read_text() == "a b c"
+    assert (tmp_path / "b.stats.json").read_text() == (tmp_path / "a.stats.json").read_text()
+    assert first.result["stats_path"] == str(tmp_path / "a.stats.json")
+
+
+def test_over_budget_job_runs_only_when_idle(tmp_path):
+    queue = ExportJobQueue(max_concurrent=2, budget=100)
+    small = queue.submit("image", fake_export, "small", {"sleep": 0.5}, str(tmp_path / "s.png"))
+    big = queue.submit("image", fake_export, "big", {}, str(tmp_path / "b.png"))
+    small.est_bytes, big.est_bytes = 60, 500
+    queue.poll()
+    assert small.status == RUNNING
+    assert big.status == QUEUED  # does not fit next to the running job
+    while small.status != DONE:
+        assert big.status == QUEUED
+        queue.poll()
+        time.sleep(0.02)
+    run_until_idle(queue)
+    assert big.status == DONE  # alone over budget, but runs once nothing else is running
+
+
+def test_batch_results_map_back_to_jobs(tmp_path):
+    queue = ExportJobQueue(batch_target=fake_batch)
+    jobs = [
+        queue.submit("image", fake_export, "text", {"export_scale": s}, str(tmp_path / f"x{s}.png"), batchable=True)
+        for s in (1, 2, 3)
+    ]
+    queue.poll()
+    assert all(j.status == RUNNING and j.shared_with == 3 for j in jobs)
+    run_until_idle(queue)
+    for job in jobs:
+        assert job.status == DONE
+        assert job.result["path"] == job.path
+        assert "index" not in job.result
+        assert (tmp_path / os.path.basename(job.path)).read_text() == f"text:{job.opts['export_scale']}"
@@ -0,0 +1,59 @@
+# test_mapping_io.py - Read-back of binary (.tcm/.tcmz) and JSON token color mappings
+import pytest
+
+from mapping_io import MappingFile, MappingWriter, read_mapping_json, write_mapping
+
+
+@pytest.mark.parametrize("ext", [".tcm", ".tcmz", ".json"])
+def test_mapping_round_trip(tmp_path, ext):
+    color_map = {"alpha": "#ff0000", "béta": "#00ff00", "東京": "#0000ff", "": "#010203", "zeta": "#abcdef"}
+    path = str(tmp_path / ("map" + ext))
+    write_mapping(path, color_map)
+    if ext == ".json":
+        assert read_mapping_json(path) == color_map
+        return
+    with MappingFile(path) as mf:
+        assert len(mf) == len(color_map)
+        assert mf.sorted
+        assert dict(mf.items()) == color_map
+        rgb, found = mf.lookup_rgb(["zeta", "missing", "東京"])
+        assert found.tolist() == [True, False, True]
+        assert rgb[0].tolist() == [0xAB, 0xCD, 0xEF]
+        assert rgb[2].tolist() == [0, 0, 255]
+
+
+def test_mapping_unsorted_lookup(tmp_path):
+    path = str(tmp_path / "map.tcm")
+    with MappingWriter(path) as w:
+        for i in range(50, 0, -1):
+            w.write(f"t{i}", (i, 2 * i, 3 * i))
+    with MappingFile(path) as mf:
+        assert not mf.sorted
+        rgb, found = mf.lookup_rgb(["t7", "t99"])
+        assert found.tolist() == [True, False]
+        assert rgb[0].tolist() == [7, 14, 21]
+
+
+def test_mapping_rejects_other_files(tmp_path):
+    path = tmp_path / "bad.tcm"
+    path.write_bytes(b"not a mapping")
+    with pytest.raises(ValueError):
+        MappingFile(str(path))
+
+
+def test_export_mapping_worker_keeps_existing_colors(tmp_path):
+    from export_worker import export_mapping
+
+    src = tmp_path / "doc.txt"
+    src.write_text("alpha beta gamma beta", encoding="utf-8")
+    opts = {
+        "tokenize_mode": "words", "custom_separator": ",", "current_mode": "random", "seed": 7,
+        "token_color_map": {"alpha": "#010203"},
+    }
+    path = str(tmp_path / "map.tcm")
+    result = export_mapping({"path": str(src)}, opts, path)
+    assert result["ok"] and result["tokens"] == 3
+    assert result["color_map"]["alpha"] == "#010203"
+    with MappingFile(path) as mf:
+        assert dict(mf.items()) == result["color_map"]
+    assert export_mapping("  ", opts, path)["ok"] is False
@@ -0,0 +1,23 @@
+# test_palette_cache.py - Bulk get/put and LRU eviction of the on-disk palette cache
+import time
+
+from palette_cache import PaletteCache
+
+
+def test_put_get_and_evict_least_recently_used(tmp_path):
+    path = str(tmp_path / "palette.sqlite")
+    with PaletteCache(path, max_entries=10) as cache:
+        cache.put_many({f"old{i}": "#000001" for i in range(6)})
+        assert len(cache) == 6
+        time.sleep(0.01)  # last_used has millisecond resolution
+        assert cache.get_many(["old0", "old1", "missing"]) == {"old0": "#000001", "old1": "#000001"}
+        time.sleep(0.01)
+        cache.put_many({f"new{i}": "#abcdef" for i in range(6)})
+        assert len(cache) == 10
+        kept = cache.get_many([f"old{i}" for i in range(6)] + [f"new{i}" for i in range(6)])
+        assert {"old0", "old1"} <= set(kept)  # recently read, so not evicted
+        assert all(f"new{i}" in kept for i in range(6))
+    with PaletteCache(path, max_entries=4) as cache:
+        cache.put_many({"x": "#123456"})
+        assert len(cache) == 4
+        assert cache.get_many(["x"]) == {"x": "#123456"}
@@ -0,0 +1,22 @@
+# test_png_stream.py - Streamed truecolor and indexed PNGs decode to the written pixels
+import numpy as np
+import pytest
+
+from png_stream import PngStreamWriter
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+@pytest.mark.parametrize("indexed", [False, True])
+def test_png_stream_decodes(tmp_path, workers, indexed):
+    Image = pytest.importorskip("PIL.Image")
+    rng = np.random.default_rng(1)
+    palette = rng.integers(0, 256, (40, 3)).astype(np.uint8)
+    img = palette[rng.integers(0, len(palette), (300, 77))]
+    img[100:200] = img[100]  # repeated rows, as in scaled cell blocks
+    path = str(tmp_path / "out.png")
+    with PngStreamWriter(path, 77, 300, palette=palette if indexed else None, workers=workers) as w:
+        for y in range(0, 300, 64):
+            w.write(img[y : y + 64])
+    with Image.open(path) as im:
+        assert im.mode == ("P" if indexed else "RGB")
+        assert np.array_equal(np.asarray(im.convert("RGB")), img)
@@ -0,0 +1,61 @@
+# test_render_server.py - Result cache of the render service (hit, miss, bypass, eviction)
+import os
+
+import pytest
+
+from render_server import RenderService
+
+
+@pytest.fixture
+def service(tmp_path):
+    svc = RenderService(str(tmp_path / "cache"), 64 * 1024 * 1024, workers=1)
+    yield svc
+    svc.shutdown()
+
+
+def render(service, tmp_path, text, **options):
+    options.setdefault("palette_cache_path", str(tmp_path / "palette.sqlite"))
+    out = service.render("ppm", text, options)
+    assert out["ok"], out
+    out["file"].close()
+    if out.get("temp_path"):
+        os.remove(out["temp_path"])
+    return out
+
+
+def test_miss_then_hit(service, tmp_path):
+    first = render(service, tmp_path, "one two three two one")
+    assert first["cache"] == "miss"
+    second = render(service, tmp_path, "one two three two one")
+    assert second["cache"] == "hit"
+    assert second["key"] == first["key"] and second["size"] == first["size"]
+    assert render(service, tmp_path, "one two three two one", pixel_size=3)["cache"] == "miss"
+    snap = service.metrics_snapshot()
+    assert (snap["hit"], snap["miss"], snap["bypass"]) == (1, 2, 0)
+    assert snap["cache"]["entries"] == 2
+    assert service.open_result(first["name"])["cache"] == "hit"
+
+
+def test_seedless_random_is_never_cached(service, tmp_path):
+    for _ in range(2):
+        out = render(service, tmp_path, "alpha beta gamma", current_mode="random")
+        assert out["cache"] == "bypass" and out["key"] == ""
+    assert render(service, tmp_path, "alpha beta gamma", arrangement_pattern="random")["cache"] == "bypass"
+    assert service.cache.stats()["entries"] == 0
+    assert not [n for n in os.listdir(service.cache.directory) if n.startswith(".")]  # temp files removed
+    seeded = render(service, tmp_path, "alpha beta gamma", current_mode="random", seed=42)
+    assert seeded["cache"] == "miss"
+    assert render(service, tmp_path, "alpha beta gamma", current_mode="random", seed=42)["cache"] == "hit"
+
+
+def test_evicts_least_recently_used_past_max_bytes(service, tmp_path):
+    first = render(service, tmp_path, "a b c")
+    service.cache.max_bytes = first["size"] + 1  # room for one result
+    second = render(service, tmp_path, "d e f")
+    assert second["cache"] == "miss"
+    stats = service.cache.stats()
+    assert stats["entries"] == 1 and stats["bytes"] <= stats["max_bytes"]
+    assert not os.path.exists(service.cache.path(first["name"]))
+    assert service.open_result(first["name"]) is None
+    assert render(service, tmp_path, "d e f")["cache"] == "hit"
+    assert render(service, tmp_path, "a b c")["cache"] == "miss"
@@ -0,0 +1,30 @@
+# test_render_spec.py - Render spec (.tcrs) write/read round trip
+import numpy as np
+import pytest
+
+from render_spec import EMPTY_CELL, FLAG_TRENDS, read_render_spec, write_render_spec
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_render_spec_round_trip(tmp_path, mmap):
+    rows, cols = 3, 5
+    palette = np.array([[255, 0, 0], [0, 255, 0], [1, 2, 3]], dtype=np.uint8)  # 9 bytes: padded to 12
+    grid = np.full(rows * cols, EMPTY_CELL, dtype=np.uint32)
+    grid[[0, 4, 7, 14]] = [0, 1, 2, 1]
+    canvas_info = {"rows": rows, "cols": cols, "width": cols * 4, "height": rows * 4}
+    path = str(tmp_path / "map.tcrs")
+    size = write_render_spec(path, palette, grid, canvas_info, 4, FLAG_TRENDS)
+    assert size == (tmp_path / "map.tcrs").stat().st_size
+    spec = read_render_spec(path, mmap=mmap)
+    assert (spec["rows"], spec["cols"], spec["pixel_size"]) == (rows, cols, 4)
+    assert (spec["width"], spec["height"], spec["filled"], spec["flags"]) == (20, 12, 4, FLAG_TRENDS)
+    assert np.array_equal(spec["palette"], palette)
+    assert np.array_equal(np.asarray(spec["grid"]), grid.reshape(rows, cols))
+    del spec
+
+
+def test_render_spec_rejects_other_files(tmp_path):
+    path = tmp_path / "bad.tcrs"
+    path.write_bytes(b"XXXX" + b"\0" * 60)
+    with pytest.raises(ValueError):
+        read_render_spec(str(path))
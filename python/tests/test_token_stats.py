@@ -0,0 +1,17 @@
+# test_token_stats.py - Token frequency stats sidecar contents
+import numpy as np
+
+import core
+
+
+def test_token_stats_table_and_top_k():
+    ids, vocab = core.tokenize_ids("b a c a b a d", mode="words")
+    counts = np.bincount(ids, minlength=len(vocab))
+    stats = core.token_stats(vocab, counts, top_k=2, table_limit=3)
+    assert stats["total_tokens"] == 7 and stats["unique_tokens"] == 4
+    assert stats["top_k"] == [["a", 3], ["b", 2]]
+    assert stats["frequency_table"] == [["a", 3], ["b", 2], ["c", 1]]  # ties in first-seen order
+    assert stats["frequency_table_truncated"]
+    full = core.token_stats(vocab, counts, top_k=10, table_limit=4)
+    assert len(full["top_k"]) == 4 and len(full["frequency_table"]) == 4
+    assert not full["frequency_table_truncated"]
@@ -0,0 +1,117 @@
+# test_token_store.py - Chunked tokenization, SpillVocab, TokenStore and exports against the in-memory path
+import numpy as np
+import pytest
+
+import core
+from export_worker import export_image
+from render_spec import DEFAULT_OPTIONS
+from export_plan import plan_export
+from token_store import (
+    OUT_OF_CORE_MODES, STREAM_PATTERNS, SpillVocab, iter_layout_cells, iter_token_chunks, tokenize_to_store,
+)
+
+TEXTS = [
+    "  The quick brown fox\tjumps over the lazy dog.\n\nThe dog sleeps.  ",
+    "a,b,,c , d,e\nf,g,h,,\n  ,i",
+    "line one\r\nline two\n\n   line three   \nlast",
+    "naïve café — über Straße 東京 東京 emoji 🙂🙂 end",
+    "x" * 50 + " " + "y" * 30 + "\n" + "z",
+    "",
+    "   \n\t  ",
+]
+CHUNK_CHARS = [1, 3, 7, 16, 64]
+
+
+@pytest.mark.parametrize("mode", OUT_OF_CORE_MODES)
+@pytest.mark.parametrize("chunk_chars", CHUNK_CHARS)
+@pytest.mark.parametrize("text", TEXTS)
+def test_iter_token_chunks_matches_tokenize(text, mode, chunk_chars):
+    tokens = [t for chunk in iter_token_chunks(text, mode, ",", chunk_chars) for t in chunk]
+    assert tokens == core.tokenize(text, mode, ",")
+
+
+@pytest.mark.parametrize("sep", [";", " | ", "\\t", r"\s*,\s*"])
+@pytest.mark.parametrize("chunk_chars", CHUNK_CHARS)
+def test_iter_token_chunks_custom_separators(sep, chunk_chars):
+    text = "a;b | c\td , e;;f | g\t\th,i ,j;k"
+    tokens = [t for chunk in iter_token_chunks(text, "custom", sep, chunk_chars) for t in chunk]
+    assert tokens == core.tokenize(text, "custom", sep)
+
+
+def test_iter_token_chunks_reads_files(tmp_path):
+    path = tmp_path / "in.txt"
+    path.write_text(TEXTS[3] * 20, encoding="utf-8")
+    tokens = [t for chunk in iter_token_chunks({"path": str(path)}, "words", ",", 5) for t in chunk]
+    assert tokens == core.tokenize(TEXTS[3] * 20, "words")
+
+
+def test_spill_vocab_keeps_first_seen_ids(tmp_path):
+    rng = np.random.default_rng(0)
+    words = [f"w{i}" for i in range(200)]
+    batches = [[words[j] for j in rng.integers(0, len(words), 300)] for _ in range(5)]
+    vocab = SpillVocab(str(tmp_path / "vocab.sqlite"), max_memory=16)
+    try:
+        expected = {}
+        for batch in batches:
+            ids = vocab.encode(batch)
+            for t in batch:
+                expected.setdefault(t, len(expected))
+            assert ids.dtype == np.uint32
+            assert ids.tolist() == [expected[t] for t in batch]
+        order = sorted(expected, key=expected.get)
+        assert len(vocab) == len(order)
+        assert vocab.spilled == len(order) - 16
+        assert list(vocab) == order
+        assert [vocab[i] for i in range(len(order))] == order
+        assert vocab.tokens(10, 40) == order[10:40]
+        assert vocab[-1] == order[-1]
+        with pytest.raises(IndexError):
+            vocab[len(order)]
+    finally:
+        vocab.close()
+
+
+def test_tokenize_to_store_matches_tokenize_ids(tmp_path):
+    text = " ".join(f"tok{i % 37}" for i in range(2000))
+    ids, vocab = core.tokenize_ids(text, mode="words")
+    store = tokenize_to_store(text, "words", work_dir=str(tmp_path), chunk_chars=100, max_memory_vocab=8)
+    try:
+        assert np.array_equal(np.asarray(store.ids), ids)
+        assert list(store.vocab) == list(vocab)
+    finally:
+        store.close()
+
+
+def test_out_of_core_export_matches_in_memory(tmp_path):
+    text = "\n".join(" ".join(f"w{(i * 7 + j) % 53}" for j in range(12)) for i in range(150))
+    opts = dict(DEFAULT_OPTIONS, seed=11, pixel_size=2, highlight_trends=True, current_mode="random")
+    out = {}
+    for ooc in (False, True):
+        path = str(tmp_path / f"map_{ooc}.ppm")
+        result = export_image(text, dict(opts, out_of_core=ooc, out_of_core_dir=str(tmp_path)), path)
+        assert result["ok"] and result["out_of_core"] == ooc
+        with open(path, "rb") as f:
+            out[ooc] = f.read()
+    assert out[False] == out[True]
+
+
+@pytest.mark.parametrize("pattern", STREAM_PATTERNS)
+@pytest.mark.parametrize("shape", ["square", "wide", "tall", "circle", "spiral", "triangle"])
+@pytest.mark.parametrize("n_tokens", [1, 7, 50, 333])
+def test_streamed_layout_matches_layout_cells(pattern, shape, n_tokens):
+    info = core.calculate_canvas_size(n_tokens, 3, shape)
+    expected = core.layout_cells(n_tokens, info, pattern, shape, 3)
+    for chunk in (1, 5, 64, 1 << 22):
+        chunks = list(iter_layout_cells(n_tokens, info, pattern, shape, 3, chunk=chunk))
+        starts = [start for start, _cells in chunks]
+        assert starts == [sum(len(c) for _s, c in chunks[:i]) for i in range(len(chunks))]
+        assert np.array_equal(np.concatenate([c for _s, c in chunks]), expected)
+
+
+def test_out_of_core_random_layout_is_rejected(tmp_path):
+    opts = dict(DEFAULT_OPTIONS, arrangement_pattern="random", out_of_core=True)
+    assert "cannot run out of core" in plan_export(1000, 100, opts)["error"]
+    assert plan_export(1000, 100, dict(opts, out_of_core=False))["error"] == ""
+    assert plan_export(1000, 100, dict(opts, arrangement_pattern="hilbert", canvas_shape="circle"))["error"] == ""
+    with pytest.raises(ValueError, match="cannot run out of core"):
+        export_image("a b c", opts, str(tmp_path / "map.png"))
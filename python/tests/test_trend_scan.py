@@ -0,0 +1,43 @@
+# test_trend_scan.py - Trend analytics report against runs from core.detect_trends
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import core
+import trend_scan
+
+
+@pytest.mark.parametrize("trial", range(20))
+def test_trend_report_matches_detect_trends(trial):
+    rng = np.random.default_rng(trial)
+    rows, cols = (int(v) for v in rng.integers(1, 30, 2))
+    n = int(rng.integers(1, rows * cols + 1))
+    vocab = [f"t{i}" for i in range(int(rng.integers(1, 6)))]
+    ids = rng.integers(0, len(vocab), n)
+    palette = rng.integers(0, 256, (len(vocab), 3)).astype(np.uint8)
+    cells = rng.permutation(rows * cols)[:n]
+    color_grid, filled = core.build_color_grid(cells, palette[ids], rows, cols)
+    mask, report = core.analyze_trends(color_grid, filled, 3, 90, layout=cells, ids=ids, vocab=vocab, top_n=5)
+
+    assert np.array_equal(mask, core.detect_trend_mask(color_grid, filled, 3, 90))
+    position_map = core.build_grid_position_color_map(color_grid, filled)
+    for direction in trend_scan.DIRECTIONS:
+        runs = core.detect_trends(cols, rows, direction, position_map, 3, 90)
+        stats = report["directions"][direction]
+        assert stats["runs"] == len(runs)
+        assert stats["cells"] == sum(map(len, runs))
+        assert stats["histogram"] == sorted([k, v] for k, v in Counter(map(len, runs)).items())
+
+    position = {int(c): i for i, c in enumerate(cells)}
+    runs = core.detect_all_trends(cols, rows, position_map, 3, 90)
+    longest = sorted(runs, key=len, reverse=True)[:5]  # sorted() is stable: ties stay in scan order
+    assert len(report["longest_runs"]) == len(longest)
+    for entry, run in zip(report["longest_runs"], longest):
+        tokens = [vocab[ids[position[r * cols + c]]] for r, c in run]
+        assert (entry["length"], entry["start"], entry["end"]) == (len(run), list(run[0]), list(run[-1]))
+        assert entry["tokens"] == tokens[:32]
+
+    in_runs = Counter(vocab[ids[position[int(c)]]] for c in np.flatnonzero(mask.ravel()))
+    assert {t["token"]: t["cells_in_runs"] for t in report["top_tokens"]} == dict(in_runs)
+    assert report["cells_in_runs"] == int(mask.sum())
@@ -0,0 +1,115 @@
+# tile_pyramid.py - Mipmapped (LOD) pyramid over a dense color grid for tiled viewing (no GUI)
+"""Level 0 is the color grid itself (one pixel per cell); level k halves level k - 1 by
+averaging 2x2 blocks. Levels are built in a background thread, band by band, and large
+levels live in memory-mapped files, so opening a huge map costs little RAM; a viewer only
+ever reads the tile regions it shows.
+"""
+import os
+import tempfile
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+TILE_SIZE = 256
+# Levels larger than this are written to memory-mapped files instead of RAM
+SPILL_BYTES = 64 * 1024 * 1024
+_BAND_ROWS = 2048
+
+
+def downsample_into(src: np.ndarray, dst: np.ndarray, stop: Optional[threading.Event] = None) -> bool:
+    """Average 2x2 blocks of src (h, w, 3) into dst (ceil(h/2), ceil(w/2), 3), in row bands.
+
+    Odd edges repeat their last row/column. Returns False if stopped early.
+    """
+    h, w = src.shape[:2]
+    for r0 in range(0, h, _BAND_ROWS):
+        if stop is not None and stop.is_set():
+            return False
+        band = np.asarray(src[r0 : r0 + _BAND_ROWS], dtype=np.uint16)
+        if band.shape[0] % 2:
+            band = np.concatenate([band, band[-1:]], axis=0)
+        if w % 2:
+            band = np.concatenate([band, band[:, -1:]], axis=1)
+        quad = band[0::2, 0::2] + band[1::2, 0::2] + band[0::2, 1::2] + band[1::2, 1::2]
+        dst[r0 // 2 : r0 // 2 + quad.shape[0]] = ((quad + 2) // 4).astype(np.uint8)
+    return True
+
+
+class TilePyramid:
+    """LOD pyramid; start() builds the coarser levels in a background thread."""
+
+    def __init__(self, base: np.ndarray, spill_dir: Optional[str] = None, min_size: int = TILE_SIZE):
+        self.levels: List[np.ndarray] = [base]
+        self.min_size = max(1, min_size)
+        self._spill_dir = spill_dir
+        self._own_dir = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.done = threading.Event()
+        self.error: Optional[Exception] = None
+
+    @property
+    def rows(self) -> int:
+        return self.levels[0].shape[0]
+
+    @property
+    def cols(self) -> int:
+        return self.levels[0].shape[1]
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._build, daemon=True)
+        self._thread.start()
+
+    def _alloc(self, shape) -> np.ndarray:
+        if int(np.prod(shape)) < SPILL_BYTES:
+            return np.empty(shape, dtype=np.uint8)
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="tcm_pyramid_")
+            self._own_dir = True
+        path = os.path.join(self._spill_dir, f"level{len(self.levels)}.u8")
+        return np.memmap(path, dtype=np.uint8, mode="w+", shape=shape)
+
+    def _build(self) -> None:
+        try:
+            while max(self.levels[-1].shape[:2]) > self.min_size:
+                prev = self.levels[-1]
+                nxt = self._alloc(((prev.shape[0] + 1) // 2, (prev.shape[1] + 1) // 2, 3))
+                if not downsample_into(prev, nxt, self._stop):
+                    return
+                self.levels.append(nxt)  # publish only finished levels
+        except Exception as e:  # reported by the viewer; coarse views fall back to striding
+            self.error = e
+        finally:
+            self.done.set()
+
+    def coarsest_level(self) -> int:
+        """Level at which the whole map fits in one tile (may not be built yet)."""
+        level, size = 0, max(self.rows, self.cols)
+        while size > self.min_size:
+            size = (size + 1) // 2
+            level += 1
+        return level
+
+    def region(self, level: int, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        """Pixels [y0:y1, x0:x1] of level (clipped); strides a finer level while level is not built yet."""
+        have = min(level, len(self.levels) - 1)
+        f = 1 << (level - have)
+        src = self.levels[have]
+        return np.asarray(src[y0 * f : y1 * f : f, x0 * f : x1 * f : f])
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.levels = self.levels[:1]
+        if self._own_dir and self._spill_dir:
+            for name in os.listdir(self._spill_dir):
+                try:
+                    os.remove(os.path.join(self._spill_dir, name))
+                except OSError:
+                    pass
+            try:
+                os.rmdir(self._spill_dir)
+            except OSError:
+                pass
@@ -0,0 +1,197 @@
+# tile_viewer.py - Zoom/pan map viewer on a Tk canvas, drawing LOD tiles on demand
+"""Shows a TilePyramid on a tk.Canvas. Only tiles in the viewport are made into PhotoImages,
+kept in an LRU sized from the viewport, so memory follows the window, not the map.
+
+Drag to pan, mouse wheel to zoom around the cursor, double-click to fit.
+"""
+import math
+import tkinter as tk
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from PIL import Image, ImageTk
+
+from tile_pyramid import TILE_SIZE, TilePyramid
+
+ZOOM_STEP = 1.25
+MAX_ZOOM = 64.0
+
+
+class TileViewer:
+    """Viewer state (zoom, center) and tile cache for one pyramid on one canvas."""
+
+    def __init__(
+        self,
+        canvas: tk.Canvas,
+        pyramid: TilePyramid,
+        on_hover: Optional[Callable[[int, int], str]] = None,
+        on_status: Optional[Callable[[str], None]] = None,
+    ):
+        self.canvas = canvas
+        self.pyramid = pyramid
+        self.on_hover = on_hover
+        self.on_status = on_status
+        self.zoom = 1.0  # screen pixels per cell
+        self.cx = pyramid.cols / 2.0  # view center in cells
+        self.cy = pyramid.rows / 2.0
+        self._tiles: "OrderedDict[Tuple, ImageTk.PhotoImage]" = OrderedDict()
+        self._capacity = 64
+        self._drag: Optional[Tuple[int, int, float, float]] = None
+        self._levels_seen = 0
+        self._poll_id = None
+        self._redraw_id = None
+        self._bindings = []
+        for seq, fn in (
+            ("<ButtonPress-1>", self._on_press),
+            ("<B1-Motion>", self._on_drag),
+            ("<ButtonRelease-1>", self._on_release),
+            ("<MouseWheel>", self._on_wheel),
+            ("<Button-4>", self._on_wheel),
+            ("<Button-5>", self._on_wheel),
+            ("<Double-Button-1>", lambda e: self.fit()),
+            ("<Configure>", lambda e: self.schedule_redraw()),
+            ("<Motion>", self._on_motion),
+        ):
+            self._bindings.append((seq, canvas.bind(seq, fn)))
+        canvas.delete("all")
+        self.fit()
+        self._poll_pyramid()
+
+    # --- geometry ---
+
+    def _view_size(self) -> Tuple[int, int]:
+        return max(1, self.canvas.winfo_width()), max(1, self.canvas.winfo_height())
+
+    def fit(self) -> None:
+        w, h = self._view_size()
+        if w <= 1 or h <= 1:  # canvas not mapped yet
+            self._redraw_id = None
+            self.canvas.after(100, self.fit)
+            return
+        self.zoom = min(MAX_ZOOM, min(w / max(1, self.pyramid.cols), h / max(1, self.pyramid.rows)))
+        self.cx, self.cy = self.pyramid.cols / 2.0, self.pyramid.rows / 2.0
+        self.schedule_redraw()
+
+    def screen_to_cell(self, x: float, y: float) -> Tuple[int, int]:
+        w, h = self._view_size()
+        col = self.cx + (x - w / 2.0) / self.zoom
+        row = self.cy + (y - h / 2.0) / self.zoom
+        return int(math.floor(row)), int(math.floor(col))
+
+    def _min_zoom(self) -> float:
+        w, h = self._view_size()
+        return 0.5 * min(w / max(1, self.pyramid.cols), h / max(1, self.pyramid.rows))
+
+    # --- events ---
+
+    def _on_press(self, e) -> None:
+        self._drag = (e.x, e.y, self.cx, self.cy)
+
+    def _on_drag(self, e) -> None:
+        if self._drag is None:
+            return
+        x0, y0, cx0, cy0 = self._drag
+        self.cx = cx0 - (e.x - x0) / self.zoom
+        self.cy = cy0 - (e.y - y0) / self.zoom
+        self.schedule_redraw()
+
+    def _on_release(self, e) -> None:
+        self._drag = None
+
+    def _on_wheel(self, e) -> None:
+        up = getattr(e, "delta", 0) > 0 or getattr(e, "num", 0) == 4
+        factor = ZOOM_STEP if up else 1 / ZOOM_STEP
+        zoom = max(self._min_zoom(), min(MAX_ZOOM, self.zoom * factor))
+        # Keep the cell under the cursor fixed
+        w, h = self._view_size()
+        col = self.cx + (e.x - w / 2.0) / self.zoom
+        row = self.cy + (e.y - h / 2.0) / self.zoom
+        self.zoom = zoom
+        self.cx = col - (e.x - w / 2.0) / zoom
+        self.cy = row - (e.y - h / 2.0) / zoom
+        self.schedule_redraw()
+
+    def _on_motion(self, e) -> None:
+        if self.on_hover is None or self.on_status is None:
+            return
+        row, col = self.screen_to_cell(e.x, e.y)
+        self.on_status(self.on_hover(row, col))
+
+    # --- drawing ---
+
+    def schedule_redraw(self) -> None:
+        # Coalesce bursts of drag/wheel events into one redraw per idle cycle
+        if self._redraw_id is None:
+            self._redraw_id = self.canvas.after_idle(self.redraw)
+
+    def _poll_pyramid(self) -> None:
+        self._poll_id = None
+        n = len(self.pyramid.levels)
+        if n != self._levels_seen:
+            self._levels_seen = n
+            self._tiles.clear()  # coarse tiles were strided from a finer level; rebuild from the new one
+            self.schedule_redraw()
+        if not self.pyramid.done.is_set():
+            self._poll_id = self.canvas.after(250, self._poll_pyramid)
+
+    def _tile_photo(self, level: int, size: int, s: float, tx: int, ty: int) -> Optional[ImageTk.PhotoImage]:
+        key = (level, size, round(s, 6), tx, ty)
+        photo = self._tiles.get(key)
+        if photo is not None:
+            self._tiles.move_to_end(key)
+            return photo
+        arr = self.pyramid.region(level, tx * size, ty * size, (tx + 1) * size, (ty + 1) * size)
+        if arr.size == 0:
+            return None
+        w = max(1, round((tx * size + arr.shape[1]) * s) - round(tx * size * s))
+        h = max(1, round((ty * size + arr.shape[0]) * s) - round(ty * size * s))
+        img = Image.fromarray(arr, mode="RGB")
+        if img.size != (w, h):
+            img = img.resize((w, h), Image.NEAREST)
+        photo = ImageTk.PhotoImage(img)
+        self._tiles[key] = photo
+        while len(self._tiles) > self._capacity:
+            self._tiles.popitem(last=False)
+        return photo
+
+    def redraw(self) -> None:
+        self._redraw_id = None
+        canvas = self.canvas
+        canvas.delete("tile")
+        w, h = self._view_size()
+        # Coarsest level that still has at least one pixel per screen pixel
+        level = 0 if self.zoom >= 1 else min(self.pyramid.coarsest_level(), int(math.floor(math.log2(1 / self.zoom))))
+        s = self.zoom * (1 << level)  # screen pixels per level pixel
+        size = max(1, int(TILE_SIZE / s)) if s > 1 else TILE_SIZE
+        lv_cols = -(-self.pyramid.cols // (1 << level))
+        lv_rows = -(-self.pyramid.rows // (1 << level))
+        # Screen position of level pixel p is p * s - origin
+        ox = round((self.cx - w / (2.0 * self.zoom)) * self.zoom)
+        oy = round((self.cy - h / (2.0 * self.zoom)) * self.zoom)
+        tile_px = size * s
+        tx0 = max(0, int(ox // tile_px))
+        ty0 = max(0, int(oy // tile_px))
+        tx1 = min(-(-lv_cols // size), int((ox + w) // tile_px) + 1)
+        ty1 = min(-(-lv_rows // size), int((oy + h) // tile_px) + 1)
+        visible = max(0, tx1 - tx0) * max(0, ty1 - ty0)
+        self._capacity = max(64, 2 * visible)
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                photo = self._tile_photo(level, size, s, tx, ty)
+                if photo is not None:
+                    canvas.create_image(
+                        round(tx * size * s) - ox, round(ty * size * s) - oy,
+                        image=photo, anchor="nw", tags="tile",
+                    )
+        if self.on_status is not None and not self.pyramid.done.is_set():
+            self.on_status(f"Building overview levels… ({len(self.pyramid.levels)} ready)")
+
+    def destroy(self) -> None:
+        for seq, funcid in self._bindings:
+            self.canvas.unbind(seq, funcid)
+        for after_id in (self._poll_id, self._redraw_id):
+            if after_id is not None:
+                self.canvas.after_cancel(after_id)
+        self._tiles.clear()
+        self.canvas.delete("tile")
+        self.pyramid.close()
@@ -0,0 +1,366 @@
+# token_store.py - Out-of-core tokenization: token IDs in an on-disk uint32 memmap, vocabulary spilling to SQLite
+"""For inputs larger than RAM. The text is read in chunks; each chunk is tokenized (a token cut
+by the chunk end is carried into the next chunk, so tokens equal core.tokenize), encoded by a
+SpillVocab and appended to a uint32 file that is then memory-mapped.
+
+SpillVocab keeps the first max_memory distinct tokens in a dict (frequent tokens show up
+early, so most lookups stay in memory) and assigns later ones through an SQLite table on
+disk. IDs are in first-seen order, as with core.encode_tokens.
+
+Later stages read the ID memmap in order, one chunk at a time: token counts, the palette
+(colored in vocabulary chunks) and the color grid, filled mask and heat grid, which are
+memmaps in the same work directory, so the banded renderer reads them row band by row band.
+N-gram modes are not supported (their vocabulary is built with np.unique over all windows).
+"""
+import io
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import core
+
+OUT_OF_CORE_MODES = ("words", "chars", "lines", "custom")
+# Characters read per chunk (tokens of one chunk are the only token strings in memory)
+DEFAULT_CHUNK_CHARS = 4 * 1024 * 1024
+# Distinct tokens kept in the in-memory dict before new ones go to SQLite
+DEFAULT_MEMORY_VOCAB = 2_000_000
+# Tokens per chunk when reading the ID memmap (counts, grids)
+ID_CHUNK = 1 << 22
+# Patterns whose fill order is generated piece by piece (core.pattern_cell_pieces), so the
+# layout never holds a whole-grid array; "random" samples all valid cells at once
+STREAM_PATTERNS = (
+    "row-major", "column-major", "spiral-in", "spiral-out", "zigzag", "zigzag-col", "diagonal", "hilbert", "morton",
+)
+_SEPARATORS = {"words": r"\s+", "lines": r"[\r\n]+"}
+_TAIL_WINDOW = 4096
+_SQL_BATCH = 50_000
+
+
+def supports_out_of_core(mode: str) -> bool:
+    return mode in OUT_OF_CORE_MODES
+
+
+def streams_layout(pattern: str) -> bool:
+    """True if cells can be computed per token range, for any canvas shape (else layout_cells runs in memory)."""
+    return pattern in STREAM_PATTERNS
+
+
+def _separator(mode: str, custom_sep: str) -> Optional["re.Pattern"]:
+    if mode == "chars":
+        return None
+    if mode == "custom":
+        return core.separator_pattern(custom_sep)
+    return re.compile(_SEPARATORS.get(mode, r"\s+"))
+
+
+def _safe_cut(piece: str, sep: Optional["re.Pattern"]) -> int:
+    """Length of piece that tokenizes the same whatever text follows.
+
+    That is up to the end of the last separator before the trailing whitespace (which
+    would be stripped at the end of the text); for chars mode, up to the trailing whitespace.
+    """
+    end = len(piece.rstrip())
+    if sep is None:
+        return end
+    window = _TAIL_WINDOW
+    start = end
+    while start > 0:
+        start = max(0, end - window)
+        last = None
+        for m in sep.finditer(piece, start, end):
+            if m.end() > m.start():
+                last = m
+        if last is not None:
+            return last.end()
+        window *= 2  # doubling keeps a long separator-free tail linear
+    return 0
+
+
+def iter_token_chunks(
+    source: Any, mode: str = "words", custom_sep: str = ",", chunk_chars: int = DEFAULT_CHUNK_CHARS,
+) -> Iterator[List[str]]:
+    """Token lists, chunk by chunk, of a text, {"path": ...} (UTF-8 file) or text file object.
+
+    Concatenated they equal the single-process core tokenization of the whole (stripped) text.
+    """
+    if not supports_out_of_core(mode):
+        raise ValueError(f"Out-of-core tokenization does not support {mode!r} mode.")
+    sep = _separator(mode, custom_sep)
+    if isinstance(source, dict):
+        f, close = open(source["path"], "r", encoding="utf-8", errors="replace"), True
+    elif isinstance(source, str):
+        f, close = io.StringIO(source), False
+    else:
+        f, close = source, False
+    try:
+        carry = ""
+        started = False
+        while True:
+            chunk = f.read(chunk_chars)
+            if not chunk:
+                break
+            piece = carry + chunk
+            if not started:
+                piece = piece.lstrip()  # whole text is stripped before tokenizing
+                started = bool(piece)
+            cut = _safe_cut(piece, sep)
+            carry = piece[cut:]
+            if cut:
+                tokens = core._tokenize_single(piece[:cut], mode, custom_sep)
+                if tokens:
+                    yield tokens
+        tail = carry.rstrip()
+        if tail:
+            tokens = core._tokenize_single(tail, mode, custom_sep)
+            if tokens:
+                yield tokens
+    finally:
+        if close:
+            f.close()
+
+
+class SpillVocab:
+    """Token -> ID table: a dict for the first max_memory tokens, SQLite on disk for the rest.
+
+    Reads like a list of tokens by ID (len, [i], iteration, tokens(start, stop)), so it can
+    stand in for the vocab list of core.tokenize_ids.
+    """
+
+    def __init__(self, path: str, max_memory: int = DEFAULT_MEMORY_VOCAB):
+        self.path = path
+        self.max_memory = max(1, int(max_memory))
+        self._index: Dict[str, int] = {}
+        self._words: List[str] = []
+        self._n = 0
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA journal_mode=OFF")
+            self._conn.execute("PRAGMA synchronous=OFF")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS vocab (id INTEGER PRIMARY KEY, token TEXT NOT NULL UNIQUE)")
+            self._conn.execute("CREATE TEMP TABLE want (token TEXT PRIMARY KEY)")
+        return self._conn
+
+    @property
+    def spilled(self) -> int:
+        """Number of tokens stored in SQLite."""
+        return self._n - len(self._words)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def encode(self, tokens: List[str]) -> np.ndarray:
+        """uint32 IDs of tokens, adding unseen ones in first-seen order."""
+        index = self._index
+        get = index.get
+        ids = np.fromiter((get(t, -1) for t in tokens), dtype=np.int64, count=len(tokens))
+        miss = np.flatnonzero(ids < 0)
+        spill: List[int] = []
+        for i in miss.tolist():
+            t = tokens[i]
+            v = get(t)
+            if v is None and len(self._words) < self.max_memory:
+                v = index[t] = self._n
+                self._words.append(t)
+                self._n += 1
+            if v is None:
+                spill.append(i)
+            else:
+                ids[i] = v
+        if spill:
+            found = self._spill([tokens[i] for i in spill])
+            ids[spill] = [found[tokens[i]] for i in spill]
+        return ids.astype(np.uint32)
+
+    def _spill(self, tokens: List[str]) -> Dict[str, int]:
+        """IDs of tokens from SQLite, inserting the unseen ones (one temp-table join per call)."""
+        conn = self._db()
+        uniq = list(dict.fromkeys(tokens))
+        conn.execute("DELETE FROM want")
+        for k in range(0, len(uniq), _SQL_BATCH):
+            conn.executemany("INSERT INTO want(token) VALUES (?)", ((t,) for t in uniq[k : k + _SQL_BATCH]))
+        found = dict(conn.execute("SELECT v.token, v.id FROM want w JOIN vocab v ON v.token = w.token"))
+        new = [t for t in uniq if t not in found]
+        if new:
+            rows = [(self._n + k, t) for k, t in enumerate(new)]
+            for k in range(0, len(rows), _SQL_BATCH):
+                conn.executemany("INSERT INTO vocab(id, token) VALUES (?, ?)", rows[k : k + _SQL_BATCH])
+            self._n += len(new)
+            found.update((t, i) for i, t in rows)
+        return found
+
+    def __getitem__(self, i: int) -> str:
+        i = int(i)
+        if i < 0:
+            i += self._n
+        if i < len(self._words):
+            return self._words[i]
+        row = self._db().execute("SELECT token FROM vocab WHERE id = ?", (i,)).fetchone() if 0 <= i < self._n else None
+        if row is None:
+            raise IndexError(i)
+        return row[0]
+
+    def tokens(self, start: int, stop: int) -> List[str]:
+        """Tokens with IDs start..stop-1."""
+        stop = min(stop, self._n)
+        out = self._words[start:stop]
+        if stop > len(self._words):
+            lo = max(start, len(self._words))
+            out += [r[0] for r in self._db().execute(
+                "SELECT token FROM vocab WHERE id >= ? AND id < ? ORDER BY id", (lo, stop)
+            )]
+        return out
+
+    def __iter__(self) -> Iterator[str]:
+        for start in range(0, self._n, _SQL_BATCH):
+            yield from self.tokens(start, start + _SQL_BATCH)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def count_tokens(ids: np.ndarray, n_vocab: int, chunk: int = ID_CHUNK) -> np.ndarray:
+    """np.bincount over a token-ID array (or memmap), one chunk at a time."""
+    counts = np.zeros(n_vocab, dtype=np.int64)
+    for start in range(0, len(ids), chunk):
+        counts += np.bincount(ids[start : start + chunk], minlength=n_vocab)
+    return counts
+
+
+def build_palette_chunked(vocab: Any, mode: str, chunk: int = 1 << 20, **kwargs: Any) -> np.ndarray:
+    """core.build_palette over vocabulary chunks (only one chunk of token strings in memory)."""
+    palette = np.zeros((len(vocab), 3), dtype=np.uint8)
+    for start in range(0, len(vocab), chunk):
+        toks = vocab.tokens(start, start + chunk)
+        palette[start : start + len(toks)] = core.build_palette(toks, mode, id_offset=start, **kwargs)
+    return palette
+
+
+def iter_layout_cells(
+    n_tokens: int, canvas_info: Dict[str, Any], pattern: str, shape: str, pixel_size: int,
+    seed: Optional[int] = None, chunk: int = ID_CHUNK,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """(first token, cells) per token chunk; same cells as core.layout_cells, in token order.
+
+    STREAM_PATTERNS walk the fill order piece by piece and drop cells outside the shape per
+    piece; a chunk holds about chunk tokens (at most one piece more).
+    """
+    rows, cols = canvas_info["rows"], canvas_info["cols"]
+    if streams_layout(pattern):
+        if n_tokens <= 0:
+            return
+        masked = shape in ("circle", "triangle")
+        pos, pending, n_pending = 0, [], 0
+        for piece in core.pattern_cell_pieces(rows, cols, pattern, chunk):
+            if masked:
+                r, c = np.divmod(piece, cols)
+                piece = piece[core.shape_contains(canvas_info, shape, pixel_size, r, c)]
+            piece = piece[: n_tokens - pos - n_pending]
+            pending.append(piece)
+            n_pending += len(piece)
+            if n_pending >= chunk or pos + n_pending >= n_tokens:
+                cells = np.concatenate(pending)
+                if len(cells):
+                    yield pos, cells
+                pos, pending, n_pending = pos + len(cells), [], 0
+                if pos >= n_tokens:
+                    return
+        if n_pending:
+            yield pos, np.concatenate(pending)
+        return
+    cells = core.layout_cells(n_tokens, canvas_info, pattern, shape, pixel_size, seed=seed)
+    for start in range(0, len(cells), chunk):
+        yield start, cells[start : start + chunk]
+
+
+class TokenStore:
+    """Token-ID memmap, SpillVocab and grid memmaps of one out-of-core run, in a work directory."""
+
+    def __init__(self, directory: str, ids: np.ndarray, vocab: SpillVocab, owns_directory: bool = True):
+        self.directory = directory
+        self.ids = ids
+        self.vocab = vocab
+        self.owns_directory = owns_directory
+
+    def _memmap(self, name: str, dtype: Any, shape: Tuple[int, ...], fill: Any) -> np.memmap:
+        arr = np.memmap(os.path.join(self.directory, name), dtype=dtype, mode="w+", shape=shape)
+        for start in range(0, shape[0], ID_CHUNK):
+            arr[start : start + ID_CHUNK] = fill
+        return arr
+
+    def layout_chunks(self, canvas_info: Dict[str, Any], opts: Dict[str, Any],
+                      seed: Optional[int]) -> Iterator[Tuple[int, np.ndarray]]:
+        """(first token, flat cells) per chunk of the stored token IDs, in token order."""
+        return iter_layout_cells(
+            len(self.ids), canvas_info, opts["arrangement_pattern"], opts["canvas_shape"],
+            opts["pixel_size"], seed=seed,
+        )
+
+    def scatter(self, values: np.ndarray, canvas_info: Dict[str, Any], opts: Dict[str, Any], seed: Optional[int],
+                name: str, fill: Any, filled: bool = False) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """(rows, cols, ...) memmap with values[token ID] at each token's cell (fill elsewhere).
+
+        With filled, also returns the (rows, cols) filled mask memmap; both are written in
+        one pass over the ID memmap.
+        """
+        rows, cols = int(canvas_info["rows"]), int(canvas_info["cols"])
+        grid = self._memmap(name, values.dtype, (rows * cols,) + values.shape[1:], fill)
+        mask = self._memmap(name + ".filled", np.bool_, (rows * cols,), False) if filled else None
+        for start, cells in self.layout_chunks(canvas_info, opts, seed):
+            grid[cells] = values[self.ids[start : start + len(cells)]]
+            if mask is not None:
+                mask[cells] = True
+        grid.flush()
+        grid = grid.reshape((rows, cols) + values.shape[1:])
+        if mask is not None:
+            mask.flush()
+            mask = mask.reshape(rows, cols)
+        return grid, mask
+
+    def close(self) -> None:
+        """Close the vocabulary and remove the work directory (if created by tokenize_to_store)."""
+        self.vocab.close()
+        self.ids = None
+        if self.owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _open_ids(path: str, n: int) -> np.ndarray:
+    if n == 0:
+        return np.zeros(0, dtype=np.uint32)
+    return np.memmap(path, dtype=np.uint32, mode="r", shape=(n,))
+
+
+def tokenize_to_store(
+    source: Any, mode: str = "words", custom_sep: str = ",", work_dir: Optional[str] = None,
+    chunk_chars: int = DEFAULT_CHUNK_CHARS, max_memory_vocab: int = DEFAULT_MEMORY_VOCAB,
+) -> TokenStore:
+    """Tokenize a text, {"path": ...} or file object into a TokenStore (IDs as a uint32 memmap).
+
+    Files go to a new temporary directory inside work_dir (default: the system temp
+    directory), removed by TokenStore.close().
+    """
+    directory = tempfile.mkdtemp(prefix="tcm_tokens_", dir=work_dir)
+    vocab = SpillVocab(os.path.join(directory, "vocab.sqlite"), max_memory_vocab)
+    ids_path = os.path.join(directory, "token_ids.u32")
+    n = 0
+    try:
+        with open(ids_path, "wb") as out:
+            for tokens in iter_token_chunks(source, mode, custom_sep, chunk_chars):
+                ids = vocab.encode(tokens)
+                ids.tofile(out)
+                n += len(ids)
+    except BaseException:
+        vocab.close()
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return TokenStore(directory, _open_ids(ids_path, n), vocab)
@@ -0,0 +1,454 @@
+# trend_scan.py - Trend run scanning over a packed color grid: balanced line chunks, shared memory, processes (no GUI)
+"""A trend is a run of filled cells along a scan line whose colors stay within the similarity
+threshold of the run's first color (empty cells are skipped, not breaking the run). Lines
+of one direction are independent:
+
+    horizontal  one line per row, left to right
+    vertical    one line per column, top to bottom
+    diagonal    down-right from each cell of the left column and top row, then down-left
+                from each cell of the right column and top row (same order as before)
+
+Lines are rows of an (n, 6) int64 array: start row, start col, row step, col step, length,
+direction index (into DIRECTIONS). A run is (line index, first offset, last offset, filled
+cells) on its line; trend_report() summarizes runs without scanning again.
+
+The grid is packed once into int32 0xRRGGBB (EMPTY for unfilled cells). Large grids are
+scanned by a process pool: the packed grid is placed in shared memory, the lines of all
+requested directions are cut into chunks of about equal cell count, and the runs of each
+chunk come back in chunk order, so the result is the same as a serial scan.
+
+Trend analytics of a text file, without rendering an image (report JSON, see trend_report):
+
+    python trend_scan.py big.log big.trends.json --top 50 --options '{"trend_min_length": 5}'
+"""
+import argparse
+import json
+import math
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count, shared_memory
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import perf_profile
+
+# Optional: JIT-compiled line scanner
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+DIRECTIONS = ("horizontal", "vertical", "diagonal")
+EMPTY = -1
+INVALID = -2  # a color that cannot be parsed: never similar to anything, itself included
+# Cells scanned per chunk (bounds the run buffer of one scan) and chunks per worker (balance)
+_CHUNK_CELLS = 1 << 20
+_CHUNKS_PER_WORKER = 4
+_MASK_BATCH_CELLS = 1 << 20
+# Tokens listed per longest run (the rest are summarized by the distinct-token counts)
+_RUN_TOKENS = 32
+_RUN_DISTINCT = 5
+
+
+def pack_grid(color_grid: np.ndarray, filled: np.ndarray) -> np.ndarray:
+    """(rows, cols) int32 0xRRGGBB of a (rows, cols, 3) color grid; EMPTY where not filled."""
+    rgb = color_grid.astype(np.int32)
+    packed = (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+    packed[~filled] = EMPTY
+    return packed
+
+
+def pack_position_map(position_color_map: Dict[Tuple[int, int], str], rows: int, cols: int) -> np.ndarray:
+    """Packed grid of a (row, col) -> "#rrggbb" map (cells outside rows x cols are ignored)."""
+    packed = np.full((rows, cols), EMPTY, dtype=np.int32)
+    for (r, c), color in position_color_map.items():
+        if not color or not (0 <= r < rows and 0 <= c < cols):
+            continue
+        h = color.lstrip("#")
+        try:
+            packed[r, c] = int(h, 16) if len(h) == 6 and h.isalnum() else INVALID
+        except ValueError:
+            packed[r, c] = INVALID
+    return packed
+
+
+def scan_lines(rows: int, cols: int, direction: str) -> np.ndarray:
+    """(n, 6) lines of one direction, in scan order."""
+    d = DIRECTIONS.index(direction)
+    if direction == "horizontal":
+        r = np.arange(rows)
+        return _lines(r, np.zeros_like(r), 0, 1, np.full(rows, cols), d)
+    if direction == "vertical":
+        c = np.arange(cols)
+        return _lines(np.zeros_like(c), c, 1, 0, np.full(cols, rows), d)
+    sr = np.arange(rows)
+    sc = np.arange(1, cols)
+    sc_left = np.arange(cols - 2, -1, -1)
+    return np.concatenate([
+        _lines(sr, np.zeros_like(sr), 1, 1, np.minimum(rows - sr, cols), d),
+        _lines(np.zeros_like(sc), sc, 1, 1, np.minimum(rows, cols - sc), d),
+        _lines(sr, np.full(rows, cols - 1), 1, -1, np.minimum(rows - sr, cols), d),
+        _lines(np.zeros_like(sc_left), sc_left, 1, -1, np.minimum(rows, sc_left + 1), d),
+    ])
+
+
+def _lines(r0, c0, dr: int, dc: int, length, d: int) -> np.ndarray:
+    n = len(r0)
+    return np.stack([r0, c0, np.full(n, dr), np.full(n, dc), length, np.full(n, d)], axis=1).astype(np.int64)
+
+
+def threshold(similarity_pct: float) -> float:
+    """Largest RGB distance within a run (same formula as core.color_distance / max_color_distance)."""
+    return (similarity_pct / 100.0) * math.sqrt(255 * 255 * 3)
+
+
+def _scan_py(flat: np.ndarray, cols: int, lines: np.ndarray, thresh: float, min_len: int) -> np.ndarray:
+    runs: List[Tuple[int, int, int, int]] = []
+    for k, (r0, c0, dr, dc, n, _d) in enumerate(lines.tolist()):
+        o = np.arange(n)
+        v = flat[(r0 + dr * o) * cols + c0 + dc * o]
+        offs = np.flatnonzero(v != EMPTY)
+        if len(offs) < min_len:
+            continue
+        count = start = last = sv = 0
+        for off, val in zip(offs.tolist(), v[offs].tolist()):
+            if count:
+                if val != INVALID and sv != INVALID:
+                    dr_, dg, db = (val >> 16) - (sv >> 16), ((val >> 8) & 255) - ((sv >> 8) & 255), (val & 255) - (sv & 255)
+                    if math.sqrt(dr_ * dr_ + dg * dg + db * db) <= thresh:
+                        count += 1
+                        last = off
+                        continue
+                if count >= min_len:
+                    runs.append((k, start, last, count))
+            count, start, last, sv = 1, off, off, val
+        if count and count >= min_len:
+            runs.append((k, start, last, count))
+    return np.asarray(runs, dtype=np.int32).reshape(-1, 4)
+
+
+if HAS_NUMBA:
+    @njit(cache=True)
+    def _scan_kernel(flat, cols, lines, thresh, min_len, out):
+        m = 0
+        for k in range(lines.shape[0]):
+            r0, c0, dr, dc, n = lines[k, 0], lines[k, 1], lines[k, 2], lines[k, 3], lines[k, 4]
+            count = 0
+            start = 0
+            last = 0
+            sv = 0
+            for off in range(n):
+                val = flat[(r0 + dr * off) * cols + c0 + dc * off]
+                if val == EMPTY:
+                    continue
+                if count > 0:
+                    if val != INVALID and sv != INVALID:
+                        d0 = (val >> 16) - (sv >> 16)
+                        d1 = ((val >> 8) & 255) - ((sv >> 8) & 255)
+                        d2 = (val & 255) - (sv & 255)
+                        if math.sqrt(float(d0 * d0 + d1 * d1 + d2 * d2)) <= thresh:
+                            count += 1
+                            last = off
+                            continue
+                    if count >= min_len:
+                        out[m, 0] = k
+                        out[m, 1] = start
+                        out[m, 2] = last
+                        out[m, 3] = count
+                        m += 1
+                count = 1
+                start = off
+                last = off
+                sv = val
+            if count > 0 and count >= min_len:
+                out[m, 0] = k
+                out[m, 1] = start
+                out[m, 2] = last
+                out[m, 3] = count
+                m += 1
+        return m
+
+
+def _scan(flat: np.ndarray, cols: int, lines: np.ndarray, thresh: float, min_len: int) -> np.ndarray:
+    """(m, 4) int32 runs of lines (line indices local to lines)."""
+    if not HAS_NUMBA:
+        return _scan_py(flat, cols, lines, thresh, min_len)
+    # Runs on one line are disjoint and hold >= min_len filled cells each
+    cap = int(lines[:, 4].sum()) // max(1, min_len) + len(lines)
+    out = np.empty((cap, 4), dtype=np.int32)
+    m = _scan_kernel(flat, cols, lines, thresh, max(1, min_len), out)
+    return out[:m].copy()
+
+
+def _chunk_bounds(lines: np.ndarray, n_chunks: int) -> List[int]:
+    """Line index bounds of n_chunks pieces of about equal cell count."""
+    ends = np.cumsum(lines[:, 4])
+    targets = ends[-1] * np.arange(1, n_chunks) / n_chunks
+    bounds = np.searchsorted(ends, targets, side="right").tolist()
+    return sorted(set([0] + bounds + [len(lines)]))
+
+
+def _scan_shared(args: Tuple[str, Tuple[int, int], np.ndarray, float, int]) -> np.ndarray:
+    """Pool task: scan lines over the packed grid in shared memory."""
+    name, shape, lines, thresh, min_len = args
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        flat = np.ndarray(shape[0] * shape[1], dtype=np.int32, buffer=shm.buf)
+        runs = _scan(flat, shape[1], lines, thresh, min_len)
+        del flat
+        return runs
+    finally:
+        shm.close()
+
+
+def find_runs(
+    packed: np.ndarray,
+    directions: Sequence[str],
+    similarity_pct: float,
+    min_len: int,
+    max_workers: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Runs of all requested directions: (lines (n, 6), runs (m, 4) into lines), in scan order.
+
+    Uses up to max_workers processes (performance profile: trend_max_workers, from
+    trend_parallel_min_cells grid cells); 1 scans in this process.
+    """
+    rows, cols = packed.shape
+    lines = np.concatenate([scan_lines(rows, cols, d) for d in directions]) if directions else np.empty((0, 6), np.int64)
+    if len(lines) == 0 or rows * cols == 0:
+        return lines, np.empty((0, 4), dtype=np.int32)
+    thresh = threshold(similarity_pct)
+    cells = int(lines[:, 4].sum())
+    workers = min(perf_profile.get("trend_max_workers"), max_workers or cpu_count() or 1, cpu_count() or 1)
+    parallel = workers > 1 and rows * cols >= perf_profile.get("trend_parallel_min_cells")
+    n_chunks = max(-(-cells // _CHUNK_CELLS), workers * _CHUNKS_PER_WORKER if parallel else 1)
+    bounds = _chunk_bounds(lines, n_chunks)
+    pieces = [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+    parts: Optional[List[np.ndarray]] = None
+    if parallel:
+        try:
+            parts = _scan_parallel(packed, lines, pieces, thresh, min_len, workers)
+        except Exception:
+            parts = None  # e.g. no shared memory or no child processes here: scan serially
+    if parts is None:
+        flat = np.ascontiguousarray(packed).reshape(-1)
+        parts = [_scan(flat, cols, lines[a:b], thresh, min_len) for a, b in pieces]
+    # Chunk-local line indices -> indices into lines; chunks are in order, so runs are too
+    for (a, _b), runs in zip(pieces, parts):
+        runs[:, 0] += a
+    return lines, np.concatenate(parts) if parts else np.empty((0, 4), dtype=np.int32)
+
+
+def _scan_parallel(
+    packed: np.ndarray, lines: np.ndarray, pieces: List[Tuple[int, int]], thresh: float, min_len: int, workers: int,
+) -> List[np.ndarray]:
+    shm = shared_memory.SharedMemory(create=True, size=max(1, packed.nbytes))
+    try:
+        np.ndarray(packed.shape, dtype=np.int32, buffer=shm.buf)[:] = packed
+        tasks = [(shm.name, packed.shape, lines[a:b], thresh, min_len) for a, b in pieces]
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as ex:
+            return list(ex.map(_scan_shared, tasks))  # map keeps task order
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _run_cells(lines: np.ndarray, runs: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Row, col of every offset from first to last of each run, and the number of offsets per run."""
+    line = lines[runs[:, 0]]
+    span = (runs[:, 2] - runs[:, 1] + 1).astype(np.int64)
+    first = np.cumsum(span) - span
+    o = np.arange(int(span.sum()), dtype=np.int64) - np.repeat(first, span) + np.repeat(runs[:, 1].astype(np.int64), span)
+    r = np.repeat(line[:, 0], span) + np.repeat(line[:, 2], span) * o
+    c = np.repeat(line[:, 1], span) + np.repeat(line[:, 3], span) * o
+    return r, c, span
+
+
+def runs_to_mask(packed: np.ndarray, lines: np.ndarray, runs: np.ndarray) -> np.ndarray:
+    """(rows, cols) bool: cells that are part of a run."""
+    mask = np.zeros(packed.shape, dtype=bool)
+    if len(runs) == 0:
+        return mask
+    span = runs[:, 2].astype(np.int64) - runs[:, 1] + 1
+    ends = np.cumsum(span)
+    start = 0
+    while start < len(runs):
+        stop = max(start + 1, int(np.searchsorted(ends, (ends[start - 1] if start else 0) + _MASK_BATCH_CELLS)))
+        r, c, _ = _run_cells(lines, runs[start:stop])
+        mask[r, c] = True
+        start = stop
+    # Offsets between a run's cells that are empty were skipped by the scan
+    mask &= packed != EMPTY
+    return mask
+
+
+def runs_to_cells(packed: np.ndarray, lines: np.ndarray, runs: np.ndarray) -> List[List[Tuple[int, int]]]:
+    """Each run as its list of (row, col) filled cells (the format of core.detect_trends)."""
+    if len(runs) == 0:
+        return []
+    r, c, span = _run_cells(lines, runs)
+    keep = packed[r, c] != EMPTY
+    counts = np.add.reduceat(keep.astype(np.int64), np.cumsum(span) - span)
+    cells = list(zip(r[keep].tolist(), c[keep].tolist()))
+    out = []
+    i = 0
+    for n in counts.tolist():
+        out.append(cells[i : i + n])
+        i += n
+    return out
+
+
+def _direction_stats(runs: np.ndarray, dirs: np.ndarray, d: int, filled: int) -> Dict[str, Any]:
+    n = runs[:, 3][dirs == d].astype(np.int64)
+    hist = np.bincount(n) if len(n) else np.zeros(0, dtype=np.int64)
+    lengths = np.flatnonzero(hist)
+    return {
+        "runs": int(len(n)),
+        "cells": int(n.sum()),
+        "coverage": float(n.sum() / filled) if filled else 0.0,
+        "longest": int(n.max()) if len(n) else 0,
+        "mean_length": float(n.mean()) if len(n) else 0.0,
+        "histogram": [[int(k), int(hist[k])] for k in lengths],
+    }
+
+
+def trend_report(
+    packed: np.ndarray,
+    lines: np.ndarray,
+    runs: np.ndarray,
+    mask: Optional[np.ndarray] = None,
+    layout: Optional[Iterable[Tuple[int, np.ndarray]]] = None,
+    ids: Optional[np.ndarray] = None,
+    vocab: Optional[Sequence[str]] = None,
+    counts: Optional[np.ndarray] = None,
+    top_n: int = 20,
+    top_tokens: int = 20,
+) -> Dict[str, Any]:
+    """JSON-ready analytics of find_runs() output, from the run metadata (no second scan).
+
+    Per direction: run count, cells, coverage of the filled cells, longest and mean length
+    and a run-length histogram ([length, runs] pairs). The top_n longest runs (ties in scan
+    order) with their start, end and color. With layout ((first token position, flat cell
+    per token) chunks in position order, e.g. core.layout cells or
+    token_store.iter_layout_cells), ids and vocab, runs are attributed to tokens: the token
+    positions and tokens each longest run spans, and the top_tokens tokens by cells in runs
+    with their share of the token's occurrences (counts: per-token counts, if already known).
+    """
+    rows, cols = packed.shape
+    filled = int(np.count_nonzero(packed != EMPTY))
+    if mask is None:
+        mask = runs_to_mask(packed, lines, runs)
+    covered = int(np.count_nonzero(mask))
+    dirs = lines[runs[:, 0], 5] if len(runs) else np.zeros(0, dtype=np.int64)
+    report: Dict[str, Any] = {
+        "rows": rows,
+        "cols": cols,
+        "filled_cells": filled,
+        "runs": int(len(runs)),
+        "cells_in_runs": covered,
+        "coverage": covered / filled if filled else 0.0,
+        "directions": {
+            name: _direction_stats(runs, dirs, d, filled)
+            for d, name in enumerate(DIRECTIONS) if np.any(lines[:, 5] == d)
+        },
+    }
+
+    # Longest runs: their filled cells in line order (flat indices), for token attribution
+    top = np.argsort(-runs[:, 3].astype(np.int64), kind="stable")[: max(0, top_n)]
+    longest: List[Dict[str, Any]] = []
+    run_cells: List[np.ndarray] = []
+    if len(top):
+        r, c, span = _run_cells(lines, runs[top])
+        flat = r * cols + c
+        keep = packed.reshape(-1)[flat] != EMPTY
+        bounds = np.cumsum(span)
+        for k, i in enumerate(top.tolist()):
+            part = flat[bounds[k] - span[k] : bounds[k]][keep[bounds[k] - span[k] : bounds[k]]]
+            run_cells.append(part)
+            line = lines[runs[i, 0]]
+            color = int(packed.reshape(-1)[part[0]])
+            longest.append({
+                "direction": DIRECTIONS[int(line[5])],
+                "length": int(runs[i, 3]),
+                "start": [int(part[0] // cols), int(part[0] % cols)],
+                "end": [int(part[-1] // cols), int(part[-1] % cols)],
+                "color": "#%06x" % color if color >= 0 else None,
+            })
+    report["longest_runs"] = longest
+
+    if layout is None or ids is None or vocab is None:
+        return report
+    # One pass over the layout: token of each covered cell, positions of the longest runs' cells
+    want = np.concatenate(run_cells) if run_cells else np.zeros(0, dtype=np.int64)
+    want_sorted, want_inverse = np.unique(want, return_inverse=True)  # runs of two directions can share cells
+    cell_positions = np.full(len(want_sorted), -1, dtype=np.int64)
+    # Per chunk, np.unique of the chunk's tokens (a bincount would cost the vocab size per chunk)
+    in_runs = np.zeros(len(vocab), dtype=np.int64)
+    total = np.zeros(len(vocab), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+    flat_mask = mask.reshape(-1)
+    for start, cells in layout:
+        cells = np.asarray(cells, dtype=np.int64)
+        tok = np.asarray(ids[start : start + len(cells)], dtype=np.int64)
+        cells = cells[: len(tok)]
+        if counts is None:
+            uniq, n = np.unique(tok, return_counts=True)
+            total[uniq] += n
+        uniq, n = np.unique(tok[flat_mask[cells]], return_counts=True)
+        in_runs[uniq] += n
+        if len(want_sorted):
+            j = np.searchsorted(want_sorted, cells)
+            j[j == len(want_sorted)] = 0
+            found = want_sorted[j] == cells
+            cell_positions[j[found]] = start + np.flatnonzero(found)
+
+    positions = cell_positions[want_inverse]
+    offset = 0
+    for entry, part in zip(longest, run_cells):
+        pos = positions[offset : offset + len(part)]
+        offset += len(part)
+        pos = pos[pos >= 0]
+        if not len(pos):
+            continue
+        tok = np.asarray(ids)[pos].astype(np.int64)
+        uniq, run_counts = np.unique(tok, return_counts=True)
+        best = np.argsort(-run_counts, kind="stable")[:_RUN_DISTINCT]
+        entry["first_position"] = int(pos.min())
+        entry["last_position"] = int(pos.max())
+        entry["tokens"] = [vocab[int(t)] for t in tok[:_RUN_TOKENS]]
+        entry["tokens_truncated"] = len(tok) > _RUN_TOKENS
+        entry["distinct_tokens"] = int(len(uniq))
+        entry["most_common"] = [[vocab[int(uniq[b])], int(run_counts[b])] for b in best]
+
+    ranked = np.argsort(-in_runs, kind="stable")[: max(0, top_tokens)]
+    report["top_tokens"] = [
+        {"token": vocab[int(t)], "cells_in_runs": int(in_runs[t]), "share": float(in_runs[t] / total[t])}
+        for t in ranked.tolist() if in_runs[t] > 0
+    ]
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Write trend run analytics (JSON) of a text file, no image.")
+    parser.add_argument("input", help="UTF-8 text file")
+    parser.add_argument("output", help="JSON report to write")
+    parser.add_argument("--top", type=int, default=20, help="longest runs to list")
+    parser.add_argument("--options", default="{}", help="JSON export options (see render_spec.DEFAULT_OPTIONS)")
+    args = parser.parse_args(argv)
+    from export_worker import export_trends
+    from render_spec import DEFAULT_OPTIONS
+
+    opts = dict(DEFAULT_OPTIONS, trend_top_runs=args.top)
+    opts.update(json.loads(args.options))
+    try:
+        # A path payload: large logs are tokenized out of core instead of read into memory
+        result = export_trends({"path": args.input}, opts, args.output)
+    except Exception as e:
+        result = {"ok": False, "error": str(e)}
+    print(json.dumps(result))
+    return 0 if result.get("ok") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+# video_export.py - RGB 3D density cube, 2D growth frames and MP4/GIF video export (no GUI)
+"""Video frame sources and the encoder.
+
+RGB 3D: the token stream is reduced to an RGB occupancy/count cube and rotating frames are
+rendered from it. Memory depends on the number of distinct colors (cube bins), not on the
+number of tokens: tokens are only touched by np.bincount over palette indices.
+
+Growth: the 2D map is filled in reading order by painting each frame's new cells onto one
+persistent canvas.
+"""
+import math
+import threading
+from queue import Empty, Queue
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from render_2d import paint_cells
+
+# Optional: video writer (MP4 needs imageio-ffmpeg; GIF works with imageio alone)
+try:
+    import imageio
+    HAS_IMAGEIO = True
+except ImportError:
+    HAS_IMAGEIO = False
+
+CUBE_BINS = (256, 128, 64, 32, 16)
+_FRAME_QUEUE_SIZE = 8
+_BACKGROUND = (18, 18, 24)
+_EDGE_COLOR = (90, 90, 110)
+
+
+def palette_bins(palette: np.ndarray, bins: int = 64) -> Tuple[np.ndarray, np.ndarray]:
+    """Map each palette entry to a cube bin: (V,) bin index into the occupied bins, (k, 3) bin coords."""
+    if bins not in CUBE_BINS:
+        raise ValueError(f"bins must be one of {CUBE_BINS}")
+    shift = 8 - int(math.log2(bins))
+    q = (palette.astype(np.int64) >> shift)
+    packed = (q[:, 0] * bins + q[:, 1]) * bins + q[:, 2]
+    occupied, inv = np.unique(packed, return_inverse=True)
+    coords = np.stack([occupied // (bins * bins), (occupied // bins) % bins, occupied % bins], axis=1)
+    return inv.ravel(), coords
+
+
+def density_cube(ids: np.ndarray, palette: np.ndarray, bins: int = 64) -> Dict[str, np.ndarray]:
+    """Sparse RGB cube: occupied bin coords (k, 3), token counts (k,), display colors (k, 3) uint8."""
+    token_bin, coords = palette_bins(palette, bins)
+    per_token = np.bincount(ids, minlength=len(palette))
+    counts = np.bincount(token_bin, weights=per_token, minlength=len(coords)).astype(np.int64)
+    return {"coords": coords, "counts": counts, "colors": _bin_colors(coords, bins)}
+
+
+def _bin_colors(coords: np.ndarray, bins: int) -> np.ndarray:
+    size = 256 // bins
+    return np.minimum(255, coords * size + size // 2).astype(np.uint8)
+
+
+def _rotation(angle: float, tilt: float) -> np.ndarray:
+    ca, sa = math.cos(angle), math.sin(angle)
+    ct, st = math.cos(tilt), math.sin(tilt)
+    spin = np.array([[ca, 0.0, sa], [0.0, 1.0, 0.0], [-sa, 0.0, ca]])
+    pitch = np.array([[1.0, 0.0, 0.0], [0.0, ct, -st], [0.0, st, ct]])
+    return pitch @ spin
+
+
+_CUBE_CORNERS = np.array([[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype=np.float64)
+_CUBE_EDGES = [(a, b) for a in range(8) for b in range(a + 1, 8) if bin(a ^ b).count("1") == 1]
+
+
+def render_cube_frame(
+    coords: np.ndarray,
+    counts: np.ndarray,
+    colors: np.ndarray,
+    bins: int,
+    size: int,
+    angle: float,
+    tilt: float = 0.45,
+    max_splat: int = 4,
+) -> np.ndarray:
+    """Orthographic splat of occupied bins at one rotation; (size, size, 3) uint8.
+
+    Splat radius grows with log(count); overlaps resolve to the point nearest the viewer.
+    """
+    frame = np.empty((size, size, 3), dtype=np.uint8)
+    frame[:] = _BACKGROUND
+    rot = _rotation(angle, tilt)
+    half = size / 2.0
+    scale = size / 1.9  # cube diagonal (sqrt 3) fits the frame at any angle
+
+    corners = (_CUBE_CORNERS - 0.5) @ rot.T
+    img = Image.fromarray(frame)
+    draw = ImageDraw.Draw(img)
+    for a, b in _CUBE_EDGES:
+        draw.line(
+            [(half + corners[a, 0] * scale, half - corners[a, 1] * scale),
+             (half + corners[b, 0] * scale, half - corners[b, 1] * scale)],
+            fill=_EDGE_COLOR,
+        )
+    frame = np.asarray(img).copy()
+
+    live = counts > 0
+    if not live.any():
+        return frame
+    pts = ((coords[live] + 0.5) / bins - 0.5) @ rot.T
+    # Rank points far -> near; per pixel the highest rank (nearest point) wins (z-buffer)
+    order = np.argsort(pts[:, 2], kind="stable")
+    pts = pts[order]
+    cols = colors[live][order]
+    c = counts[live][order]
+    u = np.round(half + pts[:, 0] * scale).astype(np.int64)
+    v = np.round(half - pts[:, 1] * scale).astype(np.int64)
+    radius = np.minimum(max_splat, (np.log2(c) * max_splat / max(1.0, math.log2(c.max()))).astype(np.int64))
+
+    best = np.full(size * size, -1, dtype=np.int64)
+    for r in np.unique(radius).tolist():
+        sel = np.flatnonzero(radius == r)
+        for dy in range(-r, r + 1):
+            vv = v[sel] + dy
+            for dx in range(-r, r + 1):
+                uu = u[sel] + dx
+                inside = (uu >= 0) & (uu < size) & (vv >= 0) & (vv < size)
+                np.maximum.at(best, (vv * size + uu)[inside], sel[inside])
+    hit = best >= 0
+    frame.reshape(-1, 3)[hit] = cols[best[hit]]
+    return frame
+
+
+def iter_cube_frames(
+    ids: np.ndarray,
+    palette: np.ndarray,
+    bins: int = 64,
+    n_frames: int = 120,
+    size: int = 720,
+    reveal: bool = True,
+    turns: float = 1.0,
+) -> Iterator[np.ndarray]:
+    """Frames of the rotating RGB cube; with reveal, frame k shows the first k/n_frames of the tokens.
+
+    Counts are accumulated incrementally (one bincount over each frame's new tokens), so the
+    whole sequence costs one pass over the token-ID array.
+    """
+    token_bin, coords = palette_bins(palette, bins)
+    colors = _bin_colors(coords, bins)
+    n = len(ids)
+    if reveal:
+        counts = np.zeros(len(coords), dtype=np.int64)
+    else:
+        counts = np.bincount(token_bin[ids], minlength=len(coords)).astype(np.int64)
+    done = 0
+    for k in range(n_frames):
+        if reveal:
+            upto = n if k == n_frames - 1 else (n * (k + 1)) // n_frames
+            if upto > done:
+                counts += np.bincount(token_bin[ids[done:upto]], minlength=len(coords))
+                done = upto
+        angle = 2 * math.pi * turns * k / max(1, n_frames)
+        yield render_cube_frame(coords, counts, colors, bins, size, angle)
+
+
+def iter_growth_frames(
+    cells: np.ndarray,
+    cell_rgb: np.ndarray,
+    canvas_info: Dict,
+    pixel_size: int,
+    size: int = 720,
+    n_frames: int = 120,
+) -> Iterator[np.ndarray]:
+    """Frames of the 2D map filling in token order: frame k shows the first (k + 1) * step tokens.
+
+    cells / cell_rgb are the layout arrays (token order, any pattern). One canvas buffer is kept
+    and each frame only paints its new cells onto it, so nothing is redrawn; each yielded frame
+    is a copy because the buffer keeps changing while earlier frames are being encoded.
+    """
+    w, h = int(canvas_info["width"]), int(canvas_info["height"])
+    scale = size / max(1, w, h)
+    canvas = np.full((max(1, int(h * scale)), max(1, int(w * scale)), 3), 255, dtype=np.uint8)
+    n = len(cells)
+    step = max(1, -(-n // max(1, n_frames)))
+    cols = int(canvas_info["cols"])
+    for start in range(0, max(n, 1), step):
+        delta = cells[start : start + step]
+        if len(delta):
+            rows_i, cols_i = np.divmod(delta, cols)
+            paint_cells(canvas, rows_i, cols_i, cell_rgb[start : start + step], pixel_size, scale)
+        yield canvas.copy()
+
+
+def _even_frame(frame: np.ndarray) -> np.ndarray:
+    # H.264 (yuv420p) needs even dimensions; pad with the frame's edge pixels
+    h, w = frame.shape[:2]
+    if h % 2 == 0 and w % 2 == 0:
+        return frame
+    return np.pad(frame, ((0, h % 2), (0, w % 2), (0, 0)), mode="edge")
+
+
+def write_video(
+    frames: Iterator[np.ndarray],
+    path: str,
+    fps: int = 30,
+    queue_size: int = _FRAME_QUEUE_SIZE,
+) -> int:
+    """Encode frames with imageio; a producer thread renders while this thread encodes. Returns frame count.
+
+    For MP4, imageio-ffmpeg pipes frames to an ffmpeg child process, so encoding runs in a
+    separate process and overlaps rendering; queue_size bounds the frames in flight.
+    """
+    if not HAS_IMAGEIO:
+        raise RuntimeError("Video export requires imageio (and imageio-ffmpeg for MP4).")
+    q: "Queue[Optional[np.ndarray]]" = Queue(maxsize=max(1, queue_size))
+    stop = threading.Event()
+    error = []
+
+    def produce() -> None:
+        try:
+            for frame in frames:
+                if stop.is_set():
+                    break
+                q.put(frame)
+        except Exception as e:  # surfaced to the caller after the writer drains
+            error.append(e)
+        finally:
+            q.put(None)
+
+    is_gif = path.lower().endswith(".gif")
+    if is_gif:
+        writer = imageio.get_writer(path, mode="I", duration=1000.0 / fps, loop=0)
+    else:
+        writer = imageio.get_writer(path, fps=fps, macro_block_size=1)
+    frames = iter(frames)
+    producer = threading.Thread(target=produce, daemon=True)
+    written = 0
+    try:
+        # First frame on this thread: the ffmpeg child is spawned here, before the producer
+        # thread starts any (numba) worker threads
+        first = next(frames, None)
+        if first is not None:
+            writer.append_data(first if is_gif else _even_frame(first))
+            written += 1
+        producer.start()
+        while True:
+            frame = q.get()
+            if frame is None:
+                break
+            writer.append_data(frame if is_gif else _even_frame(frame))
+            written += 1
+    finally:
+        writer.close()
+        # Unblock a producer waiting on a full queue if the writer failed
+        stop.set()
+        while producer.ident is not None and producer.is_alive():
+            try:
+                q.get(timeout=0.1)
+            except Empty:
+                pass
+    if error:
+        raise error[0]
+    return written
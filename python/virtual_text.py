@@ -0,0 +1,92 @@
+# virtual_text.py - Read-only Tk Text view that holds only a window of a large file's lines
+"""VirtualTextView puts WINDOW_LINES lines of a LineIndex into an existing tk.Text and moves
+that window as the user scrolls; the scrollbar shows the position in the whole file.
+"""
+import tkinter as tk
+from tkinter import ttk
+from typing import Optional
+
+from file_loader import LineIndex
+
+WINDOW_LINES = 400
+_EDGE = 0.15  # shift the window when the visible part gets this close to either end
+
+
+class VirtualTextView:
+    def __init__(self, text: tk.Text, scrollbar: ttk.Scrollbar, index: LineIndex):
+        self.text = text
+        self.scrollbar = scrollbar
+        self.index = index
+        self.top = 0
+        self._loaded = 0
+        self._poll_id: Optional[str] = None
+        self._shift_pending = False
+        self._old_yscroll = text.cget("yscrollcommand")
+        text.configure(yscrollcommand=self._on_text_scroll)
+        scrollbar.configure(command=self._on_scrollbar)
+        self._load(0)
+        self._poll_index()
+
+    def _shift(self, top: int, keep_line: int) -> None:
+        self._shift_pending = False
+        self._load(top, keep_line)
+
+    def _load(self, top: int, keep_line: Optional[int] = None) -> None:
+        total = max(1, self.index.line_count)
+        top = max(0, min(top, total - WINDOW_LINES // 2))
+        self.top = top
+        content = self.index.lines(top, WINDOW_LINES)
+        self._loaded = content.count("\n") + (0 if content.endswith("\n") or not content else 1)
+        self.text.configure(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", content)
+        self.text.configure(state=tk.DISABLED)
+        if keep_line is not None:
+            self.text.yview(max(0, keep_line - top))
+
+    def _poll_index(self) -> None:
+        # Refresh the scrollbar while the background scan is still counting lines
+        self._poll_id = None
+        self._on_text_scroll(*self.text.yview())
+        if self._loaded < WINDOW_LINES and self.index.line_count > self.top + self._loaded:
+            self._load(self.top, keep_line=self.top + int(float(self.text.index("@0,0").split(".")[0])) - 1)
+        if not self.index.done.is_set():
+            self._poll_id = self.text.after(300, self._poll_index)
+
+    def _on_text_scroll(self, first, last) -> None:
+        first, last = float(first), float(last)
+        total = max(1, self.index.line_count)
+        loaded = max(1, self._loaded)
+        g0 = (self.top + first * loaded) / total
+        g1 = (self.top + last * loaded) / total
+        self.scrollbar.set(g0, min(1.0, g1))
+        if self._shift_pending:
+            return
+        visible = self.top + int(first * loaded)
+        if first < _EDGE and self.top > 0:
+            self._shift_pending = True
+            self.text.after_idle(self._shift, visible - WINDOW_LINES // 2, visible)
+        elif last > 1 - _EDGE and self.top + loaded < self.index.line_count:
+            self._shift_pending = True
+            self.text.after_idle(self._shift, visible - WINDOW_LINES // 4, visible)
+
+    def _on_scrollbar(self, *args) -> None:
+        total = max(1, self.index.line_count)
+        if args[0] == "moveto":
+            line = int(float(args[1]) * total)
+        elif args[0] == "scroll":
+            first = self.top + int(float(self.text.yview()[0]) * max(1, self._loaded))
+            amount = int(args[1]) * (int(self.text.cget("height")) if args[2] == "pages" else 1)
+            line = first + amount
+        else:
+            return
+        line = max(0, min(total - 1, line))
+        self._load(line - WINDOW_LINES // 4, line)
+
+    def destroy(self) -> None:
+        if self._poll_id is not None:
+            self.text.after_cancel(self._poll_id)
+        self.text.configure(yscrollcommand=self._old_yscroll, state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.scrollbar.configure(command=self.text.yview)
+        self.index.close()